@@ -0,0 +1,135 @@
+"""
+Review history: an append-only ReviewEvent log plus per-day and per-week
+ReviewRollup rows.
+
+record_review() appends the event and bumps both rollups with F()
+increments in the same transaction, so streaks, daily counts and the
+activity heatmap are read from at most a few hundred small rollup rows
+instead of the event log. `manage.py rebuild_review_rollups` recomputes the
+rollups from the log if they are ever in doubt.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import LearningProgress, ReviewEvent, ReviewRollup
+from . import stats
+
+
+HEATMAP_DAYS = 365
+MAX_HEATMAP_DAYS = 3 * 366
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def record_review(note, grade, reviewed_at=None):
+    """Log a review of note and update the rollups and the user's progress"""
+    reviewed_at = reviewed_at or note.last_reviewed or timezone.now()
+    day = timezone.localdate(reviewed_at)
+    with transaction.atomic():
+        ReviewEvent.objects.create(
+            user_id=note.user_id, note=note, grade=grade,
+            interval_days=note.interval_days, reviewed_at=reviewed_at,
+        )
+        bump_rollups(note.user_id, day, reviews=1, grade_total=grade)
+        progress = LearningProgress.for_user(note.user)
+        progress.update_daily_progress(day)
+    stats.invalidate_dashboard(note.user_id)
+    return progress
+
+
+def bump_rollups(user_id, day, reviews=1, grade_total=0):
+    for period, start in (('day', day), ('week', week_start(day))):
+        rollup = ReviewRollup.objects.filter(user_id=user_id, period=period, start=start)
+        increments = {'reviews': F('reviews') + reviews, 'grade_total': F('grade_total') + grade_total}
+        if rollup.update(**increments):
+            continue
+        try:
+            with transaction.atomic():
+                ReviewRollup.objects.create(
+                    user_id=user_id, period=period, start=start,
+                    reviews=reviews, grade_total=grade_total,
+                )
+        except IntegrityError:
+            # Another review created the row first
+            rollup.update(**increments)
+
+
+def rebuild_rollups(events=None):
+    """Recompute the rollups of every user that has events in events; returns rows written"""
+    events = ReviewEvent.objects.all() if events is None else events
+    user_ids = set(events.values_list('user_id', flat=True).distinct())
+    rows = (
+        ReviewEvent.objects.filter(user_id__in=user_ids)
+        .annotate(day=TruncDate('reviewed_at', tzinfo=timezone.get_current_timezone()))
+        .values('user_id', 'day')
+        .annotate(reviews=Count('id'), grade_total=Sum('grade'))
+        .order_by()
+    )
+    totals = defaultdict(lambda: [0, 0])
+    for row in rows:
+        for key in (('day', row['day']), ('week', week_start(row['day']))):
+            totals[(row['user_id'], *key)][0] += row['reviews']
+            totals[(row['user_id'], *key)][1] += row['grade_total']
+
+    with transaction.atomic():
+        ReviewRollup.objects.filter(user_id__in=user_ids).delete()
+        ReviewRollup.objects.bulk_create([
+            ReviewRollup(user_id=user_id, period=period, start=start, reviews=reviews, grade_total=grade_total)
+            for (user_id, period, start), (reviews, grade_total) in totals.items()
+        ], batch_size=500)
+    return len(totals)
+
+
+def _runs(days):
+    """Lengths of the consecutive-day runs in a sorted list of dates"""
+    runs, previous = [], None
+    for day in days:
+        if previous is not None and day - previous == timedelta(days=1):
+            runs[-1] += 1
+        else:
+            runs.append(1)
+        previous = day
+    return runs
+
+
+def activity_summary(user, days=HEATMAP_DAYS):
+    """Heatmap, weekly totals and streaks for the last `days` days, from one rollup query"""
+    end = timezone.localdate()
+    start = end - timedelta(days=days - 1)
+    rows = ReviewRollup.objects.filter(
+        user=user, period__in=['day', 'week'], start__gte=week_start(start),
+    ).values_list('period', 'start', 'reviews', 'grade_total')
+
+    day_rows, week_rows = [], []
+    for period, day, reviews, grade_total in rows:
+        if period == 'week':
+            week_rows.append({
+                'start': day, 'reviews': reviews,
+                'average_grade': round(grade_total / reviews, 2) if reviews else None,
+            })
+        elif day >= start:
+            day_rows.append({'date': day, 'reviews': reviews})
+    day_rows.sort(key=lambda row: row['date'])
+    week_rows.sort(key=lambda row: row['start'])
+
+    active = [row['date'] for row in day_rows if row['reviews']]
+    runs = _runs(active)
+    # A streak is still current until a full day passes without reviews
+    current = runs[-1] if active and active[-1] >= end - timedelta(days=1) else 0
+    return {
+        'start': start,
+        'end': end,
+        'days': day_rows,
+        'weeks': week_rows,
+        'total_reviews': sum(row['reviews'] for row in day_rows),
+        'active_days': len(active),
+        'current_streak': current,
+        'longest_streak': max(runs, default=0),
+    }
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Tag, Note, Attachment, LearningProgress
+from .models import Category, Tag, Note, Attachment, LearningProgress, ReviewEvent, ReviewRollup, Tombstone, UploadSession, Blob
 
 
 @admin.register(Category)
@@ -7,11 +7,7 @@ class CategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'user', 'created_at', 'notes_count']
     list_filter = ['created_at', 'user']
     search_fields = ['name', 'description']
-    readonly_fields = ['created_at', 'updated_at']
-    
-    def notes_count(self, obj):
-        return obj.notes.count()
-    notes_count.short_description = 'Notes Count'
+    readonly_fields = ['created_at', 'updated_at', 'notes_count']
 
 
 @admin.register(Tag)
@@ -19,11 +15,7 @@ class TagAdmin(admin.ModelAdmin):
     list_display = ['name', 'user', 'created_at', 'notes_count']
     list_filter = ['created_at', 'user']
     search_fields = ['name']
-    readonly_fields = ['created_at']
-    
-    def notes_count(self, obj):
-        return obj.notes.count()
-    notes_count.short_description = 'Notes Count'
+    readonly_fields = ['created_at', 'updated_at', 'notes_count']
 
 
 @admin.register(Note)
@@ -44,6 +36,10 @@ class NoteAdmin(admin.ModelAdmin):
         ('Status', {
             'fields': ('is_favorite', 'is_archived')
         }),
+        ('Review schedule', {
+            'fields': ('due_at', 'interval_days', 'ease', 'repetitions'),
+            'classes': ('collapse',)
+        }),
         ('Metadata', {
             'fields': ('user', 'created_at', 'updated_at', 'last_reviewed'),
             'classes': ('collapse',)
@@ -56,7 +52,7 @@ class AttachmentAdmin(admin.ModelAdmin):
     list_display = ['original_name', 'note', 'file_type', 'get_file_size_display', 'uploaded_at']
     list_filter = ['file_type', 'uploaded_at']
     search_fields = ['original_name', 'description', 'note__title']
-    readonly_fields = ['uploaded_at', 'file_size']
+    readonly_fields = ['uploaded_at', 'file_size', 'blob']
 
 
 @admin.register(LearningProgress)
@@ -65,3 +61,41 @@ class LearningProgressAdmin(admin.ModelAdmin):
     list_filter = ['last_activity_date']
     readonly_fields = ['created_at', 'updated_at']
     search_fields = ['user__username']
+
+
+@admin.register(Tombstone)
+class TombstoneAdmin(admin.ModelAdmin):
+    list_display = ['model', 'object_id', 'user', 'deleted_at']
+    list_filter = ['model', 'deleted_at']
+    search_fields = ['user__username']
+
+
+@admin.register(ReviewEvent)
+class ReviewEventAdmin(admin.ModelAdmin):
+    list_display = ['note', 'user', 'grade', 'interval_days', 'reviewed_at']
+    list_filter = ['grade', 'reviewed_at']
+    search_fields = ['user__username', 'note__title']
+    raw_id_fields = ['note']
+
+
+@admin.register(ReviewRollup)
+class ReviewRollupAdmin(admin.ModelAdmin):
+    list_display = ['user', 'period', 'start', 'reviews', 'grade_total']
+    list_filter = ['period', 'start']
+    search_fields = ['user__username']
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ['original_name', 'user', 'received', 'total_size', 'updated_at']
+    list_filter = ['updated_at']
+    search_fields = ['user__username', 'original_name']
+    raw_id_fields = ['note']
+
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ['sha256', 'size', 'refcount', 'created_at', 'last_used_at']
+    list_filter = ['created_at']
+    search_fields = ['sha256']
+    readonly_fields = ['sha256', 'file', 'size', 'refcount', 'created_at', 'last_used_at']
@@ -0,0 +1,193 @@
+"""
+Async read path for the ASGI profile.
+
+With ASYNC_VIEWS (on by default under ASGI, see learning_backend/asgi.py) the
+dashboard, learning progress and note list/detail GETs are answered by the
+views below, so a slow client holds no worker thread while its request
+trickles in or its response drains. Other methods on those URLs go to the
+usual DRF views.
+
+Each view first runs DRF's own setup for its DRF counterpart (authentication,
+permissions, throttles, content negotiation) on a worker thread, then awaits
+its queries: independent ones together through ``api.asyncdb.concurrently``,
+the rest through Django's async ORM. Responses, validators and errors are the
+DRF views'. Requests the async path does not cover (keyset pages, the
+browsable API) are handed to the DRF handler.
+"""
+from functools import partial, wraps
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage
+from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+from .asyncdb import concurrently
+from .conditional import conditional_response, set_validators
+from .models import LearningProgress, Note
+from .stats import aget_dashboard_stats
+from . import views
+
+
+PRECONDITION_HEADERS = (
+    'HTTP_IF_MATCH', 'HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE', 'HTTP_IF_UNMODIFIED_SINCE',
+)
+
+# As registered by the router in api/urls.py
+NOTE_LIST = views.NoteViewSet.as_view(
+    {'get': 'list', 'post': 'create'}, basename='note', detail=False, suffix='List'
+)
+NOTE_DETAIL = views.NoteViewSet.as_view(
+    {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'},
+    basename='note', detail=True, suffix='Instance'
+)
+
+
+def _setup(view, request, args, kwargs):
+    """
+    An instance of the DRF view prepared for request as its dispatch() would.
+
+    Returns (instance, DRF request, response), the response being set when
+    authentication, permissions or throttling refused the request.
+    """
+    instance = view.cls(**view.initkwargs)
+    actions = getattr(view, 'actions', None)
+    if actions:
+        instance.action_map = actions
+        for method, action in actions.items():
+            setattr(instance, method, getattr(instance, action))
+    instance.setup(request, *args, **kwargs)
+
+    request = instance.initialize_request(request, *args, **kwargs)
+    instance.request = request
+    instance.headers = instance.default_response_headers
+    try:
+        instance.initial(request, *args, **kwargs)
+    except Exception as exc:
+        response = instance.handle_exception(exc)
+        return instance, request, instance.finalize_response(request, response, *args, **kwargs)
+    return instance, request, None
+
+
+def serves(view):
+    """Answer GETs for the DRF view with the decorated coroutine, other methods with the view itself"""
+    fallback = sync_to_async(view)
+
+    def decorator(handler):
+        @csrf_exempt
+        @wraps(handler)
+        async def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return await fallback(request, *args, **kwargs)
+
+            instance, request, response = await sync_to_async(_setup)(view, request, args, kwargs)
+            if response is not None:
+                return response
+            try:
+                if request.accepted_renderer.format == 'json':
+                    response = await handler(instance, request, *args, **kwargs)
+                else:
+                    # The browsable API builds its forms from the database
+                    response = await sync_to_async(instance.get)(request, *args, **kwargs)
+            except Exception as exc:
+                response = instance.handle_exception(exc)
+            return instance.finalize_response(request, response, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def fetch_with_validators(request, validators, *funcs):
+    """
+    (precondition response, (etag, last_modified), results of funcs).
+
+    The validator query runs alongside funcs unless the request carries a
+    precondition, which may make their work unnecessary: then it runs first
+    and a 304/412 is returned without running funcs.
+    """
+    if not any(header in request.META for header in PRECONDITION_HEADERS):
+        validated, *results = await concurrently(partial(validators, request), *funcs)
+        return None, validated, results
+
+    etag, last_modified = await sync_to_async(validators)(request)
+    if etag is not None:
+        precondition = conditional_response(request, etag, last_modified)
+        if precondition is not None:
+            return set_validators(precondition, etag, last_modified), (etag, last_modified), None
+    return None, (etag, last_modified), await concurrently(*funcs)
+
+
+@serves(views.learning_progress)
+async def learning_progress(view, request):
+    progress = await LearningProgress.objects.filter(user=request.user).afirst()
+    if progress is None:
+        progress = LearningProgress(total_notes=await Note.objects.filter(user=request.user).acount())
+    progress.user = request.user
+    return views.progress_response(request, progress)
+
+
+@serves(views.dashboard_stats)
+async def dashboard_stats(view, request):
+    return views.dashboard_response(request, await aget_dashboard_stats(request.user))
+
+
+@serves(NOTE_LIST)
+async def note_list(view, request):
+    """Page-number pages: the count, the page and the list validators are read concurrently"""
+    paginator = view.paginator
+    page_size = paginator.get_page_size(request)
+    number = request.query_params.get(paginator.page_query_param, '1')
+    if paginator.cursor_query_param in request.query_params or not page_size or not number.isdigit() or number == '0':
+        # Keyset pages, "last", and the 404 for invalid numbers
+        return await sync_to_async(view.list)(request)
+    number = int(number)
+
+    # Filter validation may look up the filtered category
+    queryset = await sync_to_async(lambda: view.filter_queryset(view.get_queryset()))()
+    queryset = paginator.with_tiebreaker(queryset)
+    bottom = (number - 1) * page_size
+
+    def page():
+        return view.get_serializer(list(queryset[bottom:bottom + page_size]), many=True).data
+
+    precondition, (etag, last_modified), results = await fetch_with_validators(
+        request, view.get_list_validators, queryset.count, page
+    )
+    if precondition is not None:
+        return precondition
+    count, data = results
+
+    django_paginator = paginator.django_paginator_class(queryset, page_size)
+    django_paginator.count = count
+    try:
+        paginator.page = django_paginator.page(number)
+    except InvalidPage as exc:
+        raise NotFound(paginator.invalid_page_message.format(page_number=number, message=str(exc)))
+    paginator.request = request
+    paginator.keyset = False
+    return set_validators(paginator.get_paginated_response(data), etag, last_modified)
+
+
+@serves(NOTE_DETAIL)
+async def note_detail(view, request, pk):
+    def data():
+        return view.get_serializer(view.get_object()).data
+
+    precondition, (etag, last_modified), results = await fetch_with_validators(
+        request, view.get_object_validators, data
+    )
+    if precondition is not None:
+        return precondition
+    response = Response(results[0])
+    if etag is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+# Ahead of the router's routes when ASYNC_VIEWS is on (api/urls.py)
+urlpatterns = [
+    path('progress/', learning_progress, name='learning_progress'),
+    path('dashboard/', dashboard_stats, name='dashboard_stats'),
+    path('notes/', note_list, name='note-list'),
+    path('notes/<int:pk>/', note_detail, name='note-detail'),
+]
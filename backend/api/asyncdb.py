@@ -0,0 +1,66 @@
+"""
+Independent queries run concurrently from async views.
+
+Django's async ORM (acount(), afirst(), async for, ...) runs every query of a
+request on that request's one sync thread, so gathering several of them
+still runs them one after another. concurrently() gives each function a
+thread from a pool of ASYNC_QUERY_WORKERS, and with it that thread's own
+database connection, then awaits them together. SQLite serves readers on
+separate connections in parallel (WAL in the production profile).
+
+Another connection cannot see uncommitted writes, so when the caller's
+connection is inside a transaction (ATOMIC_REQUESTS, a test case) the
+functions run in order on the caller's connection instead.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ASYNC_QUERY_WORKERS, thread_name_prefix='async-queries'
+            )
+    return _executor
+
+
+def _in_transaction():
+    return connection.in_atomic_block
+
+
+def _on_pool_thread(func):
+    def run():
+        try:
+            return func()
+        finally:
+            # Pool threads are long-lived, so their connections are kept
+            # open across calls; only a broken one is dropped
+            if connection.errors_occurred:
+                connection.close_if_unusable_or_obsolete()
+    return run
+
+
+def _in_order(funcs):
+    return [func() for func in funcs]
+
+
+async def concurrently(*funcs):
+    """Results of calling each of funcs (which may query), run in parallel where that is safe"""
+    if await sync_to_async(_in_transaction)():
+        return await sync_to_async(_in_order)(funcs)
+    executor = get_executor()
+    return list(await asyncio.gather(*(
+        sync_to_async(_on_pool_thread(func), thread_sensitive=False, executor=executor)()
+        for func in funcs
+    )))
@@ -0,0 +1,66 @@
+"""
+JWT authentication without a user query per request.
+
+simplejwt's JWTAuthentication loads the User row on every authenticated
+request. CachedJWTAuthentication keeps the loaded user in the configured
+cache (the in-process LocMemCache by default, a shared one when
+CACHE_BACKEND points at one) for AUTH_USER_CACHE_TIMEOUT seconds.
+
+Tokens carry simplejwt's ``hash_password`` claim (CHECK_REVOKE_TOKEN), a
+version of the user that changes with the password. A cached user is only
+used for a token whose claim matches it; on a mismatch the row is reloaded
+before the token is rejected. Saving or deleting a user drops the cached
+copy, so password changes and deactivation take effect on the next request.
+With a per-process cache, other workers may serve the old copy until the
+timeout, which is why it is short.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+def user_cache_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def forget_user(user_id):
+    """Drop a user's cached copy once the current transaction commits"""
+    transaction.on_commit(lambda: cache.delete(user_cache_key(user_id)))
+
+
+def user_version(user):
+    return get_md5_hash_password(user.password)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from e
+
+        # Tokens issued before the claim was added are checked for activity only
+        version = validated_token.get(api_settings.REVOKE_TOKEN_CLAIM)
+        user = cache.get(user_cache_key(user_id)) if settings.AUTH_USER_CACHE_TIMEOUT else None
+        if user is None or (version is not None and version != user_version(user)):
+            user = self.load_user(user_id)
+
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if version is not None and version != user_version(user):
+            raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return user
+
+    def load_user(self, user_id):
+        try:
+            user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found') from e
+        if settings.AUTH_USER_CACHE_TIMEOUT:
+            cache.set(user_cache_key(user_id), user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return user
@@ -0,0 +1,158 @@
+"""
+Batched API calls for ``POST /api/batch/``.
+
+A request carries up to MAX_REQUESTS sub-requests against the other API
+routes, e.g. everything the dashboard page loads::
+
+    {"requests": [
+        {"method": "GET", "path": "/api/dashboard/"},
+        {"method": "GET", "path": "/api/notes/recent/"},
+        {"method": "GET", "path": "/api/categories/", "headers": {"If-None-Match": "\\"...\\""}},
+        {"method": "PATCH", "path": "/api/notes/12/", "body": {"summary": "..."}}
+    ],
+     "snapshot": false}
+
+The batch is authenticated once. Each sub-request is then dispatched straight
+to its view as the same user, without running the middleware or decoding the
+token again, and the responses come back in order as ``{"status": ...,
+"headers": {...}, "body": ...}``. Sub-requests run one after another, so a
+later one sees the writes of an earlier one.
+
+With ``"snapshot": true`` (GET sub-requests only) the views run in one read
+transaction, so the responses describe a single state of the data. On
+SQLite it is begun DEFERRED, which takes no write lock.
+"""
+import io
+import json
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.db import connection, transaction
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+from rest_framework.response import Response
+
+
+MAX_REQUESTS = 20
+# Sub-requests resolve against api.urls only, mounted here by the root URLconf
+API_PREFIX = '/api/'
+METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+# Routes that stream, read raw request bodies, or would recurse
+UNBATCHABLE = {'batch', 'export_data', 'import_data', 'metrics'}
+RESPONSE_HEADERS = ('ETag', 'Last-Modified', 'Location', 'Retry-After')
+
+
+class BatchError(Exception):
+    status = 400
+
+
+@contextmanager
+def read_snapshot():
+    """A transaction for reads only: deferred on SQLite even in the production profile"""
+    mode = getattr(connection, 'transaction_mode', None)
+    if connection.vendor == 'sqlite':
+        # BEGIN IMMEDIATE would take the write lock for the whole batch
+        connection.transaction_mode = 'DEFERRED'
+    try:
+        with transaction.atomic():
+            connection.transaction_mode = mode
+            yield
+    finally:
+        connection.transaction_mode = mode
+
+
+def _validate(items, snapshot):
+    if not isinstance(items, list) or not items:
+        raise BatchError('requests must be a non-empty list')
+    if len(items) > MAX_REQUESTS:
+        raise BatchError(f'At most {MAX_REQUESTS} requests per batch')
+
+    parsed = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            raise BatchError(f'requests[{i}] must be an object with a path')
+        method = str(item.get('method', 'GET')).upper()
+        if method not in METHODS:
+            raise BatchError(f'requests[{i}]: method must be one of {", ".join(METHODS)}')
+        if snapshot and method != 'GET':
+            raise BatchError(f'requests[{i}]: only GET requests can run in a snapshot')
+        headers = item.get('headers') or {}
+        if not isinstance(headers, dict):
+            raise BatchError(f'requests[{i}]: headers must be an object')
+        parsed.append((method, item['path'], item.get('body'), headers))
+    return parsed
+
+
+def _subrequest(parent, method, path, query, body, headers):
+    request = HttpRequest()
+    request.method = method
+    request.path = request.path_info = path
+    # Conditional headers belong to the batch, not to its parts
+    request.META = {key: value for key, value in parent.META.items() if not key.startswith('HTTP_IF_')}
+    content = b'' if body is None else json.dumps(body).encode()
+    request.META.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(content)),
+    })
+    for name, value in headers.items():
+        key = 'HTTP_' + name.upper().replace('-', '_')
+        if key != 'HTTP_AUTHORIZATION':
+            request.META[key] = str(value)
+    request.GET = QueryDict(query)
+    request.COOKIES = parent.COOKIES
+    request._stream = io.BytesIO(content)
+    request._read_started = False
+
+    # DRF authenticates a request carrying _force_auth_user as that user
+    request.user = request._force_auth_user = parent.user
+    return request
+
+
+def _body(response):
+    if isinstance(response, Response):
+        return response.data
+    if response.streaming or not response.content:
+        return None
+    if response.get('Content-Type', '').startswith('application/json'):
+        return json.loads(response.content)
+    return response.content.decode(response.charset, errors='replace')
+
+
+def _dispatch(parent, method, path, body, headers):
+    url = urlsplit(path)
+    if not url.path.startswith(API_PREFIX):
+        return {'status': 400, 'headers': {}, 'body': {'error': f'Only {API_PREFIX} routes can be batched'}}
+    try:
+        match = resolve(url.path[len(API_PREFIX) - 1:], urlconf='api.urls')
+    except Resolver404:
+        return {'status': 404, 'headers': {}, 'body': {'detail': 'Not found.'}}
+    if match.url_name in UNBATCHABLE:
+        return {'status': 400, 'headers': {}, 'body': {'error': f'{url.path} cannot be batched'}}
+
+    request = _subrequest(parent, method, url.path, url.query, body, headers)
+    request.resolver_match = match
+    view = async_to_sync(match.func) if iscoroutinefunction(match.func) else match.func
+    response = view(request, *match.args, **match.kwargs)
+    return {
+        'status': response.status_code,
+        'headers': {name: response[name] for name in RESPONSE_HEADERS if name in response},
+        'body': _body(response),
+    }
+
+
+def run_batch(request, payload):
+    """Responses to the sub-requests in payload, made as request.user"""
+    if not isinstance(payload, dict):
+        raise BatchError('Expected an object with a requests list')
+    snapshot = bool(payload.get('snapshot', False))
+    items = _validate(payload.get('requests'), snapshot)
+
+    parent = request._request
+    if not snapshot:
+        return [_dispatch(parent, *item) for item in items]
+    with read_snapshot():
+        return [_dispatch(parent, *item) for item in items]
@@ -0,0 +1,177 @@
+"""
+Content-addressed attachment storage.
+
+Attachment content is stored once per SHA-256 as a Blob, at
+``blobs/<aa>/<bb>/<sha256><ext>`` in the default storage, and every
+Attachment with that content points at it (its ``file`` is the blob's file).
+Uploading content that is already stored only inserts the Attachment row.
+``Blob.refcount`` is kept by the counters in ``api.counters``;
+``python manage.py gc_blobs`` deletes the blobs nothing references.
+
+The hash is computed while the upload streams in: the upload handlers below
+feed every chunk Django receives to a SHA-256, and chunked uploads
+(``api.uploads``) hash their chunks as they are written.
+"""
+import hashlib
+import os
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Blob
+from . import counters
+
+
+BLOB_DIR = 'blobs'
+# Unreferenced blobs younger than this are kept: an upload may be about to use them
+GC_GRACE_PERIOD = timedelta(hours=1)
+GC_BATCH_SIZE = 500
+
+
+class HashingUploadMixin:
+    """Set file.sha256 on the uploaded file from the chunks as they arrive"""
+
+    def new_file(self, *args, **kwargs):
+        self.hasher = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        # An inactive memory handler passes the chunk on to the next handler
+        if getattr(self, 'activated', True):
+            self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.hasher.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def blob_name(sha256, filename):
+    extension = os.path.splitext(filename)[1].lower()[:10]
+    return f'{BLOB_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}'
+
+
+def file_sha256(file):
+    """SHA-256 of file, from the upload handlers when they computed it"""
+    digest = getattr(file, 'sha256', None)
+    if digest is None:
+        hasher = hashlib.sha256()
+        for chunk in file.chunks():
+            hasher.update(chunk)
+        digest = hasher.hexdigest()
+        file.seek(0)
+    return digest
+
+
+def store_blob(file, sha256=None):
+    """Return the Blob holding file's content, writing the content only if it is new"""
+    sha256 = sha256 or file_sha256(file)
+    now = timezone.now()
+    if Blob.objects.filter(pk=sha256).update(last_used_at=now):
+        return Blob.objects.get(pk=sha256)
+
+    size = file.size
+    name = default_storage.save(blob_name(sha256, file.name), file)
+    try:
+        with transaction.atomic():
+            return Blob.objects.create(sha256=sha256, file=name, size=size, last_used_at=now)
+    except IntegrityError:
+        # The same content was stored concurrently: keep that copy
+        default_storage.delete(name)
+        Blob.objects.filter(pk=sha256).update(last_used_at=now)
+        return Blob.objects.get(pk=sha256)
+
+
+def reserve_blob(sha256, filename, size):
+    """
+    The Blob for content whose file is not in storage yet.
+
+    Only the row is written, so this can run inside the caller's
+    transaction; put the file in place with place_blob_file() once it
+    commits.
+    """
+    now = timezone.now()
+    if Blob.objects.filter(pk=sha256).update(last_used_at=now):
+        return Blob.objects.get(pk=sha256)
+    try:
+        with transaction.atomic():
+            return Blob.objects.create(
+                sha256=sha256, file=blob_name(sha256, filename), size=size, last_used_at=now,
+            )
+    except IntegrityError:
+        Blob.objects.filter(pk=sha256).update(last_used_at=now)
+        return Blob.objects.get(pk=sha256)
+
+
+def place_blob_file(blob, file):
+    """Save file as blob's content unless a copy is already stored"""
+    if default_storage.exists(blob.file.name):
+        return
+    name = default_storage.save(blob.file.name, file)
+    if name != blob.file.name:
+        # Stored concurrently under the blob's name: keep that copy
+        default_storage.delete(name)
+
+
+def _walk(directory):
+    directories, files = default_storage.listdir(directory)
+    for name in files:
+        yield f'{directory}/{name}'
+    for name in directories:
+        yield from _walk(f'{directory}/{name}')
+
+
+def collect_garbage(dry_run=False, now=None):
+    """
+    Delete unreferenced blobs and stray files under BLOB_DIR.
+
+    Refcounts are rebuilt first, so drift can only delay collection, never
+    delete content in use. Returns counts of blobs and files and bytes freed.
+    """
+    cutoff = (now or timezone.now()) - GC_GRACE_PERIOD
+    report = {'repaired': 0, 'blobs': 0, 'files': 0, 'bytes': 0}
+    if not dry_run:
+        report['repaired'] = counters.recount_blobs()
+
+    garbage = Blob.objects.filter(refcount=0, last_used_at__lt=cutoff)
+    if dry_run:
+        garbage = garbage.filter(attachments__isnull=True)
+    rows = list(garbage.values_list('pk', 'file', 'size'))
+    for start in range(0, len(rows), GC_BATCH_SIZE):
+        batch = rows[start:start + GC_BATCH_SIZE]
+        if not dry_run:
+            # Re-checked in the DELETE: a blob reused since the SELECT survives
+            Blob.objects.filter(
+                pk__in=[pk for pk, _, _ in batch], refcount=0, last_used_at__lt=cutoff
+            ).delete()
+            survivors = set(Blob.objects.filter(pk__in=[pk for pk, _, _ in batch]).values_list('pk', flat=True))
+            batch = [row for row in batch if row[0] not in survivors]
+            for _, name, _ in batch:
+                default_storage.delete(name)
+        report['blobs'] += len(batch)
+        report['bytes'] += sum(size for _, _, size in batch)
+
+    # Files with no Blob row: left by an upload that failed between write and insert
+    if default_storage.exists(BLOB_DIR):
+        known = set(Blob.objects.values_list('file', flat=True).iterator())
+        for name in _walk(BLOB_DIR):
+            if name in known or default_storage.get_modified_time(name) >= cutoff:
+                continue
+            report['files'] += 1
+            report['bytes'] += default_storage.size(name)
+            if not dry_run:
+                default_storage.delete(name)
+    return report
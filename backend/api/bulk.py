@@ -0,0 +1,302 @@
+"""
+Bulk note operations for ``POST /api/notes/bulk/``.
+
+A request carries a list of operations::
+
+    {"operations": [
+        {"op": "create", "data": {"title": "...", "content": "...", "category": 1}},
+        {"op": "update", "id": 12, "data": {"summary": "..."}},
+        {"op": "archive", "id": 13, "value": true},
+        {"op": "favorite", "id": 14, "value": false},
+        {"op": "tags", "id": 15, "tag_ids": [2, 3], "mode": "add"},
+        {"op": "delete", "id": 16}
+    ]}
+
+Everything is validated up front and applied in one transaction, grouped by
+operation type (create, update, tags, favorite, archive, delete) so that the
+number of queries does not depend on the number of operations. Because the
+writes go through bulk_create/bulk_update/queryset.update(), model signals do
+not fire. The counters are instead adjusted by the difference between what
+the touched notes contributed before and after the batch, so the work is
+proportional to the batch rather than to the account; the search index and
+the dashboard cache are refreshed explicitly at the end.
+"""
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Category, Tag, Note, Attachment, ReviewEvent, Tombstone
+from .serializers import NoteBulkOperationSerializer, NoteBulkDataSerializer
+from . import counters, search, stats
+from .rendering import content_hash
+from .uploads import discard_note_uploads
+
+
+MAX_OPERATIONS = 500
+
+NoteTag = Note.tags.through
+
+
+def apply_bulk_operations(user, operations):
+    """
+    Validate and apply operations for user.
+
+    Returns (results, applied): one result dict per operation, and whether
+    the batch was applied. Nothing is written if any operation is invalid.
+    """
+    results = [{'index': i, 'status': 'ok'} for i in range(len(operations))]
+    items = _validate(user, operations, results)
+    if items is None:
+        return results, False
+
+    with transaction.atomic():
+        _apply(user, items, results)
+    return results, True
+
+
+def _validate(user, operations, results):
+    parsed = []
+    for i, raw in enumerate(operations):
+        serializer = NoteBulkOperationSerializer(data=raw)
+        if serializer.is_valid():
+            parsed.append((i, serializer.validated_data))
+        else:
+            _fail(results, i, serializer.errors)
+
+    # Load everything the batch refers to with one query per table
+    note_ids, category_ids, tag_ids = set(), set(), set()
+    for i, item in parsed:
+        if item['op'] != 'create':
+            note_ids.add(item['id'])
+        data = item.get('data') or {}
+        if isinstance(data.get('category'), int):
+            category_ids.add(data['category'])
+        for tag_id in list(data.get('tag_ids') or []) + list(item.get('tag_ids') or []):
+            if isinstance(tag_id, int):
+                tag_ids.add(tag_id)
+
+    notes = Note.objects.filter(user=user).in_bulk(note_ids) if note_ids else {}
+    own_categories = set(
+        Category.objects.filter(user=user, pk__in=category_ids).values_list('pk', flat=True)
+    ) if category_ids else set()
+    own_tags = set(
+        Tag.objects.filter(user=user, pk__in=tag_ids).values_list('pk', flat=True)
+    ) if tag_ids else set()
+
+    items = []
+    seen = set()
+    for i, item in parsed:
+        op = item['op']
+        results[i]['op'] = op
+
+        if op != 'create':
+            results[i]['id'] = item['id']
+            if item['id'] not in notes:
+                _fail(results, i, {'id': 'Note not found.'})
+                continue
+            if (op, item['id']) in seen:
+                _fail(results, i, {'id': f'Note appears in more than one {op} operation.'})
+                continue
+            seen.add((op, item['id']))
+
+        if op in ('create', 'update'):
+            data_serializer = NoteBulkDataSerializer(data=item['data'], partial=(op == 'update'))
+            if not data_serializer.is_valid():
+                _fail(results, i, data_serializer.errors)
+                continue
+            item['data'] = data_serializer.validated_data
+            category_id = item['data'].get('category')
+            if category_id is not None and category_id not in own_categories:
+                _fail(results, i, {'category': 'Category must belong to the current user.'})
+                continue
+            if 'tag_ids' in item['data']:
+                # Like NoteSerializer, silently drop tags owned by someone else
+                item['data']['tag_ids'] = [t for t in item['data']['tag_ids'] if t in own_tags]
+
+        if op == 'tags':
+            item['tag_ids'] = [t for t in item['tag_ids'] if t in own_tags]
+
+        if op != 'create':
+            item['note'] = notes[item['id']]
+        items.append((i, item))
+
+    if any(result['status'] == 'error' for result in results):
+        return None
+    return items
+
+
+def _fail(results, index, errors):
+    results[index]['status'] = 'error'
+    results[index]['errors'] = errors
+
+
+def _apply(user, items, results):
+    now = timezone.now()
+    by_op = defaultdict(list)
+    for i, item in items:
+        by_op[item['op']].append((i, item))
+
+    # Only these change what notes contribute to the counters (favorite does not)
+    counted = {item['id'] for i, item in items if item['op'] in ('update', 'tags', 'archive', 'delete')}
+    before = _contributions(counted)
+
+    tags_add = defaultdict(set)     # note id -> tag ids to link
+    tags_remove = defaultdict(set)  # note id -> tag ids to unlink
+    tags_set = {}                   # note id -> exact tag ids
+    reindex = set()
+
+    # create
+    created = []
+    for i, item in by_op['create']:
+        data = dict(item['data'])
+        tag_ids = data.pop('tag_ids', None)
+        category_id = data.pop('category')
+        note = Note(user=user, category_id=category_id, created_at=now, updated_at=now, **data)
+        created.append((i, note, tag_ids))
+    if created:
+        Note.objects.bulk_create([note for _, note, _ in created])
+        for i, note, tag_ids in created:
+            results[i]['id'] = note.pk
+            reindex.add(note.pk)
+            if tag_ids:
+                tags_add[note.pk].update(tag_ids)
+
+    # update
+    updated, update_fields = [], set()
+    for i, item in by_op['update']:
+        note, data = item['note'], dict(item['data'])
+        tag_ids = data.pop('tag_ids', None)
+        if 'category' in data:
+            note.category_id = data.pop('category')
+            update_fields.add('category')
+        for field, value in data.items():
+            setattr(note, field, value)
+            update_fields.add(field)
+        note.updated_at = now
+        updated.append(note)
+        reindex.add(note.pk)
+        if tag_ids is not None:
+            tags_set[note.pk] = set(tag_ids)
+    if 'content' in update_fields:
+        # bulk_update() does not run pre_save()
+        for note in updated:
+            note.content_hash = content_hash(note.content)
+        update_fields.add('content_hash')
+    if updated:
+        Note.objects.bulk_update(updated, sorted(update_fields | {'updated_at'}))
+
+    # tags
+    for i, item in by_op['tags']:
+        note_id, tag_ids = item['id'], set(item['tag_ids'])
+        reindex.add(note_id)
+        if item['mode'] == 'add':
+            tags_add[note_id].update(tag_ids)
+        elif item['mode'] == 'remove':
+            tags_remove[note_id].update(tag_ids)
+        else:
+            tags_set[note_id] = tag_ids
+    _apply_tag_changes(tags_add, tags_remove, tags_set)
+    tagged = [item['id'] for i, item in by_op['tags']]
+    if tagged:
+        Note.objects.filter(pk__in=tagged).update(updated_at=now)
+
+    # favorite / archive
+    for op, field in (('favorite', 'is_favorite'), ('archive', 'is_archived')):
+        ids_by_value = defaultdict(list)
+        for i, item in by_op[op]:
+            ids_by_value[item['value']].append(item['id'])
+            results[i][field] = item['value']
+        for value, ids in ids_by_value.items():
+            Note.objects.filter(pk__in=ids).update(**{field: value, 'updated_at': now})
+
+    # delete
+    deleted = [item['id'] for i, item in by_op['delete']]
+    if deleted:
+        delete_notes(deleted)
+        reindex.difference_update(deleted)
+
+    after = _contributions((counted - set(deleted)) | {note.pk for _, note, _ in created})
+    for model, index in ((Category, 0), (Tag, 1)):
+        deltas = defaultdict(int)
+        for pk, count in after[index].items():
+            deltas[pk] += count
+        for pk, count in before[index].items():
+            deltas[pk] -= count
+        counters.apply_notes_count_deltas(model, deltas)
+    counters.adjust_total_notes(user.pk, len(created) - len(deleted))
+
+    search.index_notes(reindex)
+    search.unindex_notes(deleted)
+    stats.invalidate_dashboard(user.pk)
+
+
+def _contributions(note_ids):
+    """What notes add to the counters: ({category id: count}, {tag id: count}) of the active ones"""
+    if not note_ids:
+        return {}, {}
+    active = Note.objects.filter(pk__in=note_ids, is_archived=False)
+    categories, tags = defaultdict(int), defaultdict(int)
+    for category_id in active.values_list('category_id', flat=True):
+        categories[category_id] += 1
+    for tag_id in NoteTag.objects.filter(note__in=active).values_list('tag_id', flat=True):
+        tags[tag_id] += 1
+    return categories, tags
+
+
+def _apply_tag_changes(tags_add, tags_remove, tags_set):
+    unlink = Q()
+    for note_id, tag_ids in tags_remove.items():
+        unlink |= Q(note_id=note_id, tag_id__in=tag_ids)
+    for note_id, tag_ids in tags_set.items():
+        unlink |= Q(note_id=note_id) & ~Q(tag_id__in=tag_ids)
+        tags_add[note_id].update(tag_ids)
+    if unlink:
+        NoteTag.objects.filter(unlink).delete()
+
+    links = [
+        NoteTag(note_id=note_id, tag_id=tag_id)
+        for note_id, tag_ids in tags_add.items()
+        for tag_id in tag_ids
+        if tag_id not in tags_remove.get(note_id, ())
+    ]
+    if links:
+        NoteTag.objects.bulk_create(links, ignore_conflicts=True)
+
+
+# Every relation to Note, and how delete_notes() deals with it
+NOTE_DEPENDENTS = {'tags', 'attachments', 'review_events', 'upload_sessions'}
+
+
+def delete_notes(note_ids):
+    """
+    Delete notes and their dependent rows with a fixed number of queries.
+
+    queryset.delete() would send per-note (and per-attachment) delete signals,
+    so the rows are deleted directly and every relation in NOTE_DEPENDENTS is
+    handled here first. Tombstones and blob references are maintained as
+    well; callers adjust the other counters and the search index themselves.
+    """
+    Tombstone.objects.bulk_create([
+        Tombstone(user_id=user_id, model='note', object_id=note_id)
+        for note_id, user_id in Note.objects.filter(pk__in=note_ids).values_list('pk', 'user_id')
+    ])
+    NoteTag.objects.filter(note_id__in=note_ids).delete()
+    counters.release_blobs(Attachment.objects.filter(note_id__in=note_ids))
+    _delete_where(Attachment, 'note_id', note_ids)
+    # The review log outlives its notes
+    ReviewEvent.objects.filter(note_id__in=note_ids).update(note=None)
+    discard_note_uploads(note_ids)
+    _delete_where(Note, 'id', note_ids)
+
+
+def _delete_where(model, column, values):
+    """DELETE model rows whose column is in values, without the deletion collector"""
+    quote = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(values))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} WHERE {quote(column)} IN ({placeholders})',
+            list(values),
+        )
@@ -0,0 +1,137 @@
+"""
+ETag / Last-Modified validators and conditional request handling.
+
+Validators are computed from timestamps and counts, never by serializing
+the response, so a ``304 Not Modified`` costs one small indexed query:
+
+* list endpoints use a per-user fingerprint: note count and the latest
+  ``updated_at`` across the user's notes, categories and tags, plus the latest
+  deletion tombstone. Any write to the user's data therefore changes every
+  list validator, which keeps them simple and always correct.
+* detail endpoints use the object's own ``updated_at`` (for notes also that of
+  its category and tags, which are nested in the payload).
+
+``If-Match`` on PUT/PATCH is checked against the detail validator before the
+update runs, so clients can write without re-reading first and get ``412
+Precondition Failed`` if someone else changed the object in between.
+"""
+import hashlib
+
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .models import Category, Tag, Note, Tombstone
+
+
+def make_etag(*parts):
+    digest = hashlib.md5('|'.join(str(part) for part in parts).encode(), usedforsecurity=False)
+    return quote_etag(digest.hexdigest())
+
+
+def _latest(queryset, field):
+    return Subquery(
+        queryset.filter(user=OuterRef('pk')).order_by().values('user').annotate(m=Max(field)).values('m')[:1]
+    )
+
+
+def user_data_fingerprint(user):
+    """(parts, last_modified) describing the state of all of a user's notes, categories and tags"""
+    row = (
+        type(user).objects.filter(pk=user.pk)
+        .annotate(
+            notes_total=Subquery(
+                Note.objects.filter(user=OuterRef('pk')).order_by().values('user')
+                .annotate(c=Count('id')).values('c')[:1]
+            ),
+            notes_latest=_latest(Note.objects.all(), 'updated_at'),
+            categories_latest=_latest(Category.objects.all(), 'updated_at'),
+            tags_latest=_latest(Tag.objects.all(), 'updated_at'),
+            deleted_latest=_latest(Tombstone.objects.all(), 'deleted_at'),
+        )
+        .values('notes_total', 'notes_latest', 'categories_latest', 'tags_latest', 'deleted_latest')
+        .get()
+    )
+    timestamps = [value for key, value in row.items() if key != 'notes_total' and value is not None]
+    return list(row.values()), max(timestamps) if timestamps else None
+
+
+def _timestamp(value):
+    return int(value.timestamp()) if value is not None else None
+
+
+def conditional_response(request, etag, last_modified=None):
+    """The 304/412 response the request's preconditions call for, or None"""
+    return get_conditional_response(request, etag=etag, last_modified=_timestamp(last_modified))
+
+
+def set_validators(response, etag, last_modified=None):
+    if not 200 <= response.status_code < 300:
+        return response
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(_timestamp(last_modified))
+    # Validators are per user: make caches revalidate and key on credentials
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+class ConditionalViewSetMixin:
+    """
+    Conditional GET for list/retrieve and If-Match for update/partial_update.
+
+    Viewsets can override get_object_validator_parts() when their detail
+    payload depends on more than the object's own updated_at.
+    """
+
+    def get_list_validators(self, request):
+        parts, last_modified = user_data_fingerprint(request.user)
+        etag = make_etag(
+            request.user.pk, request.get_full_path(), request.accepted_renderer.format, *parts
+        )
+        return etag, last_modified
+
+    def get_object_validator_parts(self, pk):
+        """(parts, last_modified) for one object, or None if it is not visible"""
+        updated_at = self.get_queryset().filter(pk=pk).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            return None
+        return [updated_at], updated_at
+
+    def get_object_validators(self, request):
+        lookup = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        try:
+            result = self.get_object_validator_parts(lookup)
+        except ValueError:
+            # Malformed lookup; let the handler produce its usual 404
+            result = None
+        if result is None:
+            return None, None
+        parts, last_modified = result
+        etag = make_etag(self.basename, lookup, request.accepted_renderer.format, *parts)
+        return etag, last_modified
+
+    def _conditional(self, request, validators, handler, *args, **kwargs):
+        etag, last_modified = validators(request)
+        if etag is not None:
+            precondition = conditional_response(request, etag, last_modified)
+            if precondition is not None:
+                return set_validators(precondition, etag, last_modified)
+        response = handler(request, *args, **kwargs)
+        if request.method not in ('GET', 'HEAD'):
+            # Describe the state after the write
+            etag, last_modified = validators(request)
+        if etag is not None:
+            set_validators(response, etag, last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(request, self.get_list_validators, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(request, self.get_object_validators, super().retrieve, *args, **kwargs)
+
+    def update(self, request, *args, **kwargs):
+        # partial_update() goes through update() as well
+        return self._conditional(request, self.get_object_validators, super().update, *args, **kwargs)
@@ -0,0 +1,164 @@
+"""
+Maintenance of denormalized counters.
+
+``Category.notes_count`` and ``Tag.notes_count`` hold the number of active
+(non-archived) notes; ``LearningProgress.total_notes`` holds all of a user's
+notes; ``Blob.refcount`` the number of attachments sharing a blob. They are
+kept up to date by the signal handlers in ``api.signals`` and can be rebuilt
+from scratch with ``python manage.py recount`` (refcounts by ``gc_blobs``).
+"""
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import Category, Tag, Note, Attachment, Blob, LearningProgress
+
+
+NoteTag = Note.tags.through
+
+
+def adjust_category(category_id, delta):
+    """Add delta to a category's notes_count"""
+    if category_id is None or not delta:
+        return
+    categories = Category.objects.filter(pk=category_id)
+    if delta < 0:
+        # A drifted counter must not fail the write that triggered it
+        categories = categories.filter(notes_count__gte=-delta)
+    # The serialized category changed, so bump updated_at for sync clients
+    categories.update(
+        notes_count=F('notes_count') + delta, updated_at=timezone.now()
+    )
+
+
+def adjust_tags(tag_ids, delta):
+    """Add delta to the notes_count of every tag in tag_ids"""
+    tag_ids = list(tag_ids)
+    if not tag_ids or not delta:
+        return
+    tags = Tag.objects.filter(pk__in=tag_ids)
+    if delta < 0:
+        tags = tags.filter(notes_count__gte=-delta)
+    tags.update(
+        notes_count=F('notes_count') + delta, updated_at=timezone.now()
+    )
+
+
+def apply_notes_count_deltas(model, deltas):
+    """Add {pk: delta} to notes_count of Category or Tag rows in one UPDATE, stopping at zero"""
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    change = Case(
+        *(When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()),
+        default=Value(0), output_field=IntegerField(),
+    )
+    model.objects.filter(pk__in=deltas).update(
+        notes_count=Greatest(F('notes_count') + change, Value(0)), updated_at=timezone.now()
+    )
+
+
+def adjust_total_notes(user_id, delta):
+    """Add delta to a user's LearningProgress.total_notes"""
+    if not delta:
+        return
+    progress = LearningProgress.objects.filter(user_id=user_id)
+    if delta < 0:
+        progress = progress.filter(total_notes__gte=-delta)
+    # Last-Modified of /api/progress/ must move with total_notes
+    progress.update(total_notes=F('total_notes') + delta, updated_at=timezone.now())
+
+
+def adjust_blob(blob_id, delta):
+    """Add delta to a blob's refcount"""
+    if blob_id is None or not delta:
+        return
+    blobs = Blob.objects.filter(pk=blob_id)
+    if delta < 0:
+        blobs = blobs.filter(refcount__gte=-delta)
+    blobs.update(refcount=F('refcount') + delta)
+
+
+def release_blobs(attachments):
+    """Drop the references held by an attachment queryset that is about to be raw-deleted"""
+    held = _count_subquery(attachments, 'blob')
+    Blob.objects.filter(pk__in=attachments.values('blob')).update(
+        refcount=Greatest(F('refcount') - held, Value(0))
+    )
+
+
+def note_tag_ids(note_id):
+    """Tag ids currently linked to a note"""
+    return list(NoteTag.objects.filter(note_id=note_id).values_list('tag_id', flat=True))
+
+
+def _count_subquery(queryset, group_field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{group_field: OuterRef('pk')})
+            .order_by()
+            .values(group_field)
+            .annotate(c=Count('*'))
+            .values('c')[:1],
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def recount_categories(queryset=None):
+    """Rebuild Category.notes_count, returning the number of rows that had drifted"""
+    if queryset is None:
+        queryset = Category.objects.all()
+    actual = _count_subquery(Note.objects.filter(is_archived=False), 'category')
+    return _repair(queryset, actual)
+
+
+def recount_tags(queryset=None):
+    """Rebuild Tag.notes_count, returning the number of rows that had drifted"""
+    if queryset is None:
+        queryset = Tag.objects.all()
+    actual = _count_subquery(NoteTag.objects.filter(note__is_archived=False), 'tag')
+    return _repair(queryset, actual)
+
+
+def recount_progress(queryset=None):
+    """Rebuild LearningProgress.total_notes, returning the number of rows that had drifted"""
+    if queryset is None:
+        queryset = LearningProgress.objects.all()
+    actual = Coalesce(
+        Subquery(
+            Note.objects.filter(user=OuterRef('user'))
+            .order_by()
+            .values('user')
+            .annotate(c=Count('*'))
+            .values('c')[:1],
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+    return _repair(queryset, actual, 'total_notes')
+
+
+def recount_blobs(queryset=None):
+    """Rebuild Blob.refcount, returning the number of rows that had drifted"""
+    if queryset is None:
+        queryset = Blob.objects.all()
+    actual = _count_subquery(Attachment.objects.all(), 'blob')
+    return _repair(queryset, actual, 'refcount', touch=False)
+
+
+def _repair(queryset, actual, field='notes_count', touch=True):
+    fields = [field, 'updated_at'] if touch else [field]
+    drifted = list(
+        queryset.annotate(actual_count=actual)
+        .exclude(**{field: F('actual_count')})
+        .only('pk', *fields)
+    )
+    now = timezone.now()
+    for obj in drifted:
+        setattr(obj, field, obj.actual_count)
+        if touch:
+            obj.updated_at = now
+    queryset.model.objects.bulk_update(drifted, fields, batch_size=500)
+    return len(drifted)
@@ -0,0 +1,165 @@
+"""
+Sparse fieldsets: ``?fields=`` and ``?expand=`` on read endpoints.
+
+``?fields=id,title`` limits a response to the named fields. ``?expand=tags``
+adds fields a serializer leaves out by default, listed in its
+``Meta.expandable_fields`` (naming one in ``?fields=`` includes it as well).
+
+The pruned serializer then decides what is loaded: concrete fields go into
+``only()``, ``a.b`` sources into ``select_related()``, nested many=True
+serializers into a ``Prefetch`` whose queryset is pruned the same way. Method
+fields declare what they read in ``Meta.field_requirements``. A titles-only
+list therefore never reads ``content`` or touches the tag and attachment
+tables.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+def parse_field_list(value):
+    if not value:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class SparseFieldsetSerializerMixin:
+    """
+    Prune fields according to context['fields'] / context['expand'].
+
+    Meta.expandable_fields maps a name to (field_class, kwargs); the field is
+    only built when expanded.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = self.context.get('fields')
+        expand = self.context.get('expand') or set()
+        if requested is None and not expand:
+            return
+
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        unknown = ((requested or set()) | expand) - set(self.fields) - set(expandable)
+        if unknown:
+            raise serializers.ValidationError(
+                {'fields': f"Unknown field(s): {', '.join(sorted(unknown))}"}
+            )
+
+        for name, (field_class, field_kwargs) in expandable.items():
+            if name in expand or (requested and name in requested):
+                self.fields[name] = field_class(**field_kwargs)
+        if requested is not None:
+            for name in list(self.fields):
+                if name not in requested:
+                    self.fields.pop(name)
+
+
+def _model_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+
+def optimize_queryset(queryset, serializer, extra_fields=()):
+    """
+    Restrict queryset to what serializer reads.
+
+    extra_fields are loaded as well (e.g. the pagination ordering columns).
+    """
+    model = queryset.model
+    only = {model._meta.pk.name, *extra_fields}
+    select = set()
+    prefetch = {}
+    requirements = getattr(getattr(serializer, 'Meta', None), 'field_requirements', {})
+
+    def require(path):
+        name, _, rest = path.partition('__')
+        field = _model_field(model, name)
+        if field is None:
+            return
+        if field.many_to_many or field.one_to_many:
+            # Method fields such as counts only need the related keys
+            keep = [field.related_model._meta.pk.name]
+            if field.one_to_many:
+                keep.append(field.field.attname)
+            related = field.related_model._default_manager.only(*keep)
+            prefetch.setdefault(name, Prefetch(name, queryset=related))
+        elif field.is_relation and rest:
+            select.add(name)
+            only.update((name, path))
+        elif field.concrete:
+            only.add(name)
+
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        for path in requirements.get(name, ()):
+            require(path)
+        if field.source == '*':
+            continue
+
+        if isinstance(field, serializers.ListSerializer):
+            relation = _model_field(model, field.source)
+            if relation is None:
+                continue
+            related = relation.related_model._default_manager.all()
+            # The reverse FK is how the prefetch matches rows to their parent
+            keep = [relation.field.attname] if relation.one_to_many else []
+            prefetch[field.source] = Prefetch(
+                field.source, queryset=optimize_queryset(related, field.child, keep)
+            )
+        elif isinstance(field, serializers.BaseSerializer):
+            relation = _model_field(model, field.source)
+            if relation is None:
+                continue
+            select.add(field.source)
+            only.add(field.source)
+            only.update(f'{field.source}__{n}' for n in _concrete_sources(relation.related_model, field))
+        elif isinstance(field, serializers.ManyRelatedField):
+            require(field.source)
+        else:
+            require(field.source.replace('.', '__'))
+
+    queryset = queryset.only(*only)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch.values())
+    return queryset
+
+
+def _concrete_sources(model, serializer):
+    names = {model._meta.pk.name}
+    for field in serializer.fields.values():
+        model_field = _model_field(model, field.source)
+        if model_field is not None and model_field.concrete and not field.write_only:
+            names.add(field.source)
+    return names
+
+
+class SparseFieldsetViewSetMixin:
+    """
+    Read ?fields= / ?expand= on safe requests and shape both the serializer
+    and the queryset. Viewsets call optimize_queryset() at the end of
+    get_queryset() with their base queryset.
+    """
+    optimize_extra_fields = ()
+
+    def get_sparse_fieldset(self):
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in SAFE_METHODS:
+            return None, set()
+        params = request.query_params
+        return parse_field_list(params.get('fields')), parse_field_list(params.get('expand')) or set()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'], context['expand'] = self.get_sparse_fieldset()
+        return context
+
+    def optimize_queryset(self, queryset):
+        if getattr(self, 'request', None) is None or self.request.method not in SAFE_METHODS:
+            return queryset
+        return optimize_queryset(queryset, self.get_serializer(), self.optimize_extra_fields)
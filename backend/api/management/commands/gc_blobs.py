@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api.blobs import collect_garbage
+
+
+class Command(BaseCommand):
+    help = "Delete attachment blobs no attachment references, and stray blob files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be deleted")
+
+    def handle(self, *args, **options):
+        report = collect_garbage(dry_run=options['dry_run'])
+        verb = "Would delete" if options['dry_run'] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {report['blobs']} blobs and {report['files']} stray files "
+            f"({report['bytes']} bytes); repaired {report['repaired']} refcounts"
+        ))
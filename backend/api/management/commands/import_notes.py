@@ -0,0 +1,39 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api.transfer import CHUNK_SIZE, NDJSONImporter
+
+
+class Command(BaseCommand):
+    help = "Import an NDJSON export (from /api/export/) into a user's account"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path', help="Export file, or - for stdin")
+        parser.add_argument('--batch-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']!r} does not exist")
+
+        importer = NDJSONImporter(user, batch_size=options['batch_size'])
+        if options['path'] == '-':
+            report = importer.feed(sys.stdin.buffer)
+        else:
+            with open(options['path'], 'rb') as stream:
+                report = importer.feed(stream)
+
+        counts = report['imported']
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {counts['note']} notes, {counts['category']} categories, "
+            f"{counts['tag']} tags and {counts['attachment']} attachments "
+            f"in {report['seconds']}s ({report['rows_per_second']} rows/s)"
+        ))
+        for error in report['errors']:
+            self.stderr.write(f"  {error}")
+        if report['error_count'] > len(report['errors']):
+            self.stderr.write(f"  ... {report['error_count'] - len(report['errors'])} more errors")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.uploads import prune_uploads
+
+
+class Command(BaseCommand):
+    help = "Delete chunked upload sessions idle for UPLOAD_SESSION_TTL_HOURS and their staged files"
+
+    def handle(self, *args, **options):
+        pruned = prune_uploads()
+        self.stdout.write(self.style.SUCCESS(f"Pruned {pruned} uploads"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.activity import rebuild_rollups
+from api.models import ReviewEvent
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily and weekly review rollups from the review event log"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="Only rebuild this user id's rollups")
+
+    def handle(self, *args, **options):
+        events = ReviewEvent.objects.all()
+        if options['user']:
+            events = events.filter(user_id=options['user'])
+
+        written = rebuild_rollups(events)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} rollup rows"))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from api.search import CREATE_SQL, fts_enabled, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for notes"
+
+    def handle(self, *args, **options):
+        if not fts_enabled():
+            self.stdout.write(self.style.WARNING("Full-text index is only available on SQLite; nothing to do"))
+            return
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(CREATE_SQL)
+            indexed = rebuild_index()
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} notes"))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.counters import recount_categories, recount_tags, recount_progress
+from api.models import Category, Tag, LearningProgress
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized note counters on categories, tags and learning progress"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help="Only recount rows owned by this user id")
+
+    def handle(self, *args, **options):
+        categories = Category.objects.all()
+        tags = Tag.objects.all()
+        progress = LearningProgress.objects.all()
+        if options['user']:
+            categories = categories.filter(user_id=options['user'])
+            tags = tags.filter(user_id=options['user'])
+            progress = progress.filter(user_id=options['user'])
+
+        with transaction.atomic():
+            fixed_categories = recount_categories(categories)
+            fixed_tags = recount_tags(tags)
+            fixed_progress = recount_progress(progress)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Repaired {fixed_categories} categories, {fixed_tags} tags "
+            f"and {fixed_progress} progress rows"
+        ))
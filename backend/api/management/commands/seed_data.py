@@ -0,0 +1,40 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api.seeding import DEFAULT_PASSWORD, delete_dataset, generate_dataset
+
+
+class Command(BaseCommand):
+    help = "Generate a reproducible synthetic dataset (users, categories, tags, notes) for benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1)
+        parser.add_argument('--categories', type=int, default=5, help="Categories per user")
+        parser.add_argument('--tags', type=int, default=20, help="Tags per user")
+        parser.add_argument('--notes', type=int, default=100, help="Notes per user")
+        parser.add_argument('--content-size', type=int, default=2000, help="Approximate note content length")
+        parser.add_argument('--tag-fanout', type=int, default=3, help="Tags per note")
+        parser.add_argument('--attachments', type=float, default=0.2, help="Fraction of notes with an attachment")
+        parser.add_argument('--prefix', default='bench', help="Usernames are <prefix>-<n>")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--reset', action='store_true', help="Delete an existing dataset with this prefix first")
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['reset']:
+            delete_dataset(prefix)
+        elif User.objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(f"Users named {prefix}-* already exist; use --reset or another --prefix")
+
+        summary = generate_dataset(
+            users=options['users'], categories=options['categories'], tags=options['tags'],
+            notes=options['notes'], content_size=options['content_size'],
+            tag_fanout=options['tag_fanout'], attachments=options['attachments'],
+            prefix=prefix, seed=options['seed'], batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {summary['users']} users, {summary['categories']} categories, {summary['tags']} tags, "
+            f"{summary['notes']} notes, {summary['note_tags']} tag links and {summary['attachments']} "
+            f"attachments in {summary['seconds']}s (password: {DEFAULT_PASSWORD!r})"
+        ))
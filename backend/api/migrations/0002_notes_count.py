@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:20
+
+from django.db import migrations, models
+
+
+def backfill_notes_count(apps, schema_editor):
+    Category = apps.get_model("api", "Category")
+    Tag = apps.get_model("api", "Tag")
+    Note = apps.get_model("api", "Note")
+    NoteTag = Note.tags.through
+
+    active = Note.objects.filter(is_archived=False)
+    for row in active.values("category_id").annotate(c=models.Count("id")):
+        Category.objects.filter(pk=row["category_id"]).update(notes_count=row["c"])
+
+    links = NoteTag.objects.filter(note__is_archived=False)
+    for row in links.values("tag_id").annotate(c=models.Count("id")):
+        Tag.objects.filter(pk=row["tag_id"]).update(notes_count=row["c"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="notes_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="tag",
+            name="notes_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_notes_count, migrations.RunPython.noop),
+    ]
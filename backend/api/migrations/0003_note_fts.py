@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-17 07:05
+
+from django.db import migrations
+
+
+CREATE_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS api_note_fts USING fts5("
+    "title, content, summary, tags, category, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+POPULATE_SQL = (
+    "INSERT INTO api_note_fts (rowid, title, content, summary, tags, category) "
+    "SELECT n.id, n.title, n.content, n.summary, "
+    "COALESCE((SELECT group_concat(t.name, ' ') FROM api_note_tags nt "
+    "JOIN api_tag t ON t.id = nt.tag_id WHERE nt.note_id = n.id), ''), "
+    "COALESCE(c.name, '') "
+    "FROM api_note n LEFT JOIN api_category c ON c.id = n.category_id"
+)
+
+
+def has_fts5(connection):
+    if connection.vendor != "sqlite":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def create_fts_table(apps, schema_editor):
+    # Without FTS5 search falls back to icontains (see api.search)
+    if not has_fts5(schema_editor.connection):
+        return
+    schema_editor.execute(CREATE_SQL)
+    schema_editor.execute(POPULATE_SQL)
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS api_note_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0002_notes_count"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
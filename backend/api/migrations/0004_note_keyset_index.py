@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0003_note_fts"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="note",
+            index=models.Index(fields=["user", "updated_at", "id"], name="note_user_updated_id_idx"),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0004_note_keyset_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="attachment",
+            index=models.Index(fields=["note", "uploaded_at"], name="attachment_note_uploaded_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="note",
+            index=models.Index(fields=["user", "is_archived", "updated_at"], name="note_user_archived_upd_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="note",
+            index=models.Index(condition=models.Q(("is_archived", False)), fields=["user", "is_favorite"], name="note_user_favorite_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="note",
+            index=models.Index(fields=["user", "created_at"], name="note_user_created_idx"),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.6 on 2026-10-17 08:10
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def backfill_total_notes(apps, schema_editor):
+    LearningProgress = apps.get_model("api", "LearningProgress")
+    Note = apps.get_model("api", "Note")
+
+    LearningProgress.objects.update(total_notes=0)
+    for row in Note.objects.values("user_id").annotate(c=Count("id")):
+        LearningProgress.objects.filter(user_id=row["user_id"]).update(total_notes=row["c"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_query_pattern_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_total_notes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:29
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_backfill_total_notes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tag",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.CreateModel(
+            name="Tombstone",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("model", models.CharField(choices=[("note", "Note"), ("category", "Category"), ("tag", "Tag")], max_length=10)),
+                ("object_id", models.BigIntegerField()),
+                ("deleted_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="tombstones", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "ordering": ["deleted_at"],
+                "indexes": [models.Index(fields=["user", "deleted_at"], name="tombstone_user_deleted_idx")],
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:36
+
+from datetime import timedelta
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_due_at(apps, schema_editor):
+    Note = apps.get_model("api", "Note")
+
+    # Never reviewed: due since creation. Reviewed: treat as a first review.
+    Note.objects.filter(last_reviewed__isnull=True).update(due_at=F("created_at"))
+    Note.objects.filter(last_reviewed__isnull=False).update(
+        due_at=F("last_reviewed") + timedelta(days=1), repetitions=1, interval_days=1
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_sync_tombstones"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="note",
+            name="due_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name="note",
+            name="ease",
+            field=models.FloatField(default=2.5),
+        ),
+        migrations.AddField(
+            model_name="note",
+            name="interval_days",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="note",
+            name="repetitions",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_due_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="note",
+            index=models.Index(condition=models.Q(("is_archived", False)), fields=["user", "due_at"], name="note_user_due_idx"),
+        ),
+    ]
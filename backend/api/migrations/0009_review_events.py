@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:37
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_review_scheduling"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReviewEvent",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("grade", models.PositiveSmallIntegerField()),
+                ("interval_days", models.PositiveIntegerField(default=0)),
+                ("reviewed_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("note", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="review_events", to="api.note")),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="review_events", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "ordering": ["-reviewed_at"],
+                "indexes": [models.Index(fields=["user", "reviewed_at"], name="reviewevent_user_time_idx")],
+            },
+        ),
+        migrations.CreateModel(
+            name="ReviewRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("period", models.CharField(choices=[("day", "Day"), ("week", "Week")], max_length=4)),
+                ("start", models.DateField()),
+                ("reviews", models.PositiveIntegerField(default=0)),
+                ("grade_total", models.PositiveIntegerField(default=0)),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="review_rollups", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "ordering": ["period", "start"],
+                "constraints": [models.UniqueConstraint(fields=("user", "period", "start"), name="reviewrollup_user_period_start_uniq")],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-17 06:45
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0009_review_events"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UploadSession",
+            fields=[
+                ("id", models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ("original_name", models.CharField(max_length=255)),
+                ("description", models.TextField(blank=True)),
+                ("total_size", models.PositiveBigIntegerField()),
+                ("received", models.PositiveBigIntegerField(default=0)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("note", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="upload_sessions", to="api.note")),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="upload_sessions", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "ordering": ["-created_at"],
+                "indexes": [models.Index(fields=["updated_at"], name="uploadsession_updated_idx")],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-17 07:11
+
+import hashlib
+
+import api.models
+from django.db import migrations
+
+
+def backfill_content_hash(apps, schema_editor):
+    Note = apps.get_model("api", "Note")
+    notes = [
+        Note(pk=pk, content_hash=hashlib.sha256(content.encode()).hexdigest())
+        for pk, content in Note.objects.values_list("pk", "content").iterator()
+    ]
+    Note.objects.bulk_update(notes, ["content_hash"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0011_content_addressed_blobs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="note",
+            name="content_hash",
+            field=api.models.ContentHashField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+    ]
@@ -1,13 +1,38 @@
-from django.db import models
+import uuid
+from datetime import timedelta
+
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.base import DEFERRED
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from .rendering import content_hash
+from .scheduling import DEFAULT_EASE, DEFAULT_GRADE, schedule
+
+
+def save_preserving_counters(instance, counter_fields, *args, **kwargs):
+    """
+    Save an existing row without writing its denormalized counters.
+
+    Counters are maintained with F() updates, so an instance loaded before
+    the last increment must not write its stale value back.
+    """
+    if not instance._state.adding and kwargs.get('update_fields') is None:
+        kwargs['update_fields'] = [
+            f.name for f in instance._meta.concrete_fields
+            if not f.primary_key and f.name not in counter_fields
+        ]
+    models.Model.save(instance, *args, **kwargs)
+
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     color = models.CharField(max_length=7, default='#3B82F6')  # Hex color code
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='categories')
+    notes_count = models.PositiveIntegerField(default=0, editable=False)  # Active (non-archived) notes
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -19,11 +44,16 @@ class Category(models.Model):
     def __str__(self):
         return f"{self.name} ({self.user.username})"
 
+    def save(self, *args, **kwargs):
+        save_preserving_counters(self, ['notes_count'], *args, **kwargs)
+
 
 class Tag(models.Model):
     name = models.CharField(max_length=50)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tags')
+    notes_count = models.PositiveIntegerField(default=0, editable=False)  # Active (non-archived) notes
     created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ('name', 'user')
@@ -32,6 +62,25 @@ class Tag(models.Model):
     def __str__(self):
         return f"{self.name} ({self.user.username})"
 
+    def save(self, *args, **kwargs):
+        save_preserving_counters(self, ['notes_count'], *args, **kwargs)
+
+
+class ContentHashField(models.CharField):
+    """SHA-256 of the instance's content, refreshed whenever the row is written"""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', 64)
+        kwargs.setdefault('editable', False)
+        kwargs.setdefault('blank', True)
+        super().__init__(*args, **kwargs)
+
+    def pre_save(self, model_instance, add):
+        # Also runs for bulk_create, which skips Model.save()
+        if 'content' not in model_instance.get_deferred_fields():
+            setattr(model_instance, self.attname, content_hash(model_instance.content))
+        return super().pre_save(model_instance, add)
+
 
 class Note(models.Model):
     DIFFICULTY_CHOICES = [
@@ -42,6 +91,8 @@ class Note(models.Model):
 
     title = models.CharField(max_length=200)
     content = models.TextField()
+    # Key of the content's rendering, see api.rendering
+    content_hash = ContentHashField()
     summary = models.TextField(blank=True, help_text="Brief summary of the note")
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='notes')
     tags = models.ManyToManyField(Tag, blank=True, related_name='notes')
@@ -53,19 +104,93 @@ class Note(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     last_reviewed = models.DateTimeField(null=True, blank=True)
+    # Spaced-repetition state, see api.scheduling
+    due_at = models.DateTimeField(default=timezone.now)
+    interval_days = models.PositiveIntegerField(default=0)
+    ease = models.FloatField(default=DEFAULT_EASE)
+    repetitions = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            # Keyset pagination of a user's notes by (updated_at, id)
+            models.Index(fields=['user', 'updated_at', 'id'], name='note_user_updated_id_idx'),
+            # Active/archived listings and `recent`, already in display order
+            models.Index(fields=['user', 'is_archived', 'updated_at'], name='note_user_archived_upd_idx'),
+            # `favorites` only ever looks at active notes
+            models.Index(
+                fields=['user', 'is_favorite'], name='note_user_favorite_idx',
+                condition=models.Q(is_archived=False),
+            ),
+            # Dashboard "created in the last 7 days" count
+            models.Index(fields=['user', 'created_at'], name='note_user_created_idx'),
+            # Review queue: an active user's notes in due order
+            models.Index(
+                fields=['user', 'due_at'], name='note_user_due_idx',
+                condition=models.Q(is_archived=False),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.user.username})"
 
-    def mark_as_reviewed(self):
-        """Mark note as reviewed with current timestamp"""
-        self.last_reviewed = timezone.now()
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded state so signal handlers can diff against it
+        instance._loaded_values = instance._snapshot()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_values = self._snapshot()
+
+    def _snapshot(self):
+        return {f.attname: self.__dict__.get(f.attname, DEFERRED) for f in self._meta.concrete_fields}
+
+    def has_changed(self, *attnames):
+        """Whether any of the given fields differ from the last loaded/saved state"""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return True
+        return any(
+            loaded.get(name, DEFERRED) is DEFERRED or loaded[name] != self.__dict__.get(name, DEFERRED)
+            for name in attnames
+        )
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'content' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'content_hash'}
+        # Keep the row and its denormalized counters/indexes in one transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        self._loaded_values = self._snapshot()
+
+    def mark_as_reviewed(self, grade=None):
+        """Record a review graded 0-5 and schedule the next one"""
+        schedule(self, DEFAULT_GRADE if grade is None else grade)
         self.save()
 
 
+class Blob(models.Model):
+    """Attachment content, stored once per SHA-256 and shared by identical uploads"""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    file = models.FileField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)  # Attachments pointing here
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['refcount', 'last_used_at'], name='blob_refcount_used_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.refcount} references)"
+
+
 class Attachment(models.Model):
     FILE_TYPE_CHOICES = [
         ('image', 'Image'),
@@ -74,9 +199,17 @@ class Attachment(models.Model):
         ('audio', 'Audio'),
         ('other', 'Other'),
     ]
+    FILE_TYPE_BY_EXTENSION = {
+        'jpg': 'image', 'jpeg': 'image', 'png': 'image', 'gif': 'image', 'svg': 'image',
+        'pdf': 'document', 'doc': 'document', 'docx': 'document', 'txt': 'document',
+        'mp4': 'video', 'avi': 'video', 'mov': 'video', 'wmv': 'video',
+        'mp3': 'audio', 'wav': 'audio', 'flac': 'audio'
+    }
 
     note = models.ForeignKey(Note, on_delete=models.CASCADE, related_name='attachments')
     file = models.FileField(upload_to='attachments/%Y/%m/%d/')
+    # Content-addressed attachments share their blob's file; older rows have none
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='attachments')
     original_name = models.CharField(max_length=255)
     file_type = models.CharField(max_length=10, choices=FILE_TYPE_CHOICES, default='other')
     file_size = models.PositiveIntegerField()  # Size in bytes
@@ -85,6 +218,9 @@ class Attachment(models.Model):
 
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            models.Index(fields=['note', 'uploaded_at'], name='attachment_note_uploaded_idx'),
+        ]
 
     def __str__(self):
         return f"{self.original_name} ({self.note.title})"
@@ -98,6 +234,57 @@ class Attachment(models.Model):
             size /= 1024.0
         return f"{size:.1f} TB"
 
+    @classmethod
+    def file_type_for(cls, filename):
+        """Determine file type based on extension"""
+        extension = filename.split('.')[-1].lower()
+        return cls.FILE_TYPE_BY_EXTENSION.get(extension, 'other')
+
+
+class UploadSession(models.Model):
+    """A chunked attachment upload in progress; the bytes are staged on disk"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    note = models.ForeignKey(Note, on_delete=models.CASCADE, related_name='upload_sessions')
+    original_name = models.CharField(max_length=255)
+    description = models.TextField(blank=True)
+    total_size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['updated_at'], name='uploadsession_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"Upload of {self.original_name}: {self.received}/{self.total_size} bytes"
+
+
+class Tombstone(models.Model):
+    """Record of a deleted note, category or tag, so sync clients can drop it"""
+    MODEL_CHOICES = [
+        ('note', 'Note'),
+        ('category', 'Category'),
+        ('tag', 'Tag'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tombstones')
+    model = models.CharField(max_length=10, choices=MODEL_CHOICES)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['deleted_at']
+        indexes = [
+            models.Index(fields=['user', 'deleted_at'], name='tombstone_user_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"Deleted {self.model} {self.object_id} ({self.user_id})"
+
 
 class LearningProgress(models.Model):
     """Track learning progress and statistics"""
@@ -113,26 +300,88 @@ class LearningProgress(models.Model):
     def __str__(self):
         return f"Progress for {self.user.username}"
 
-    def update_daily_progress(self):
-        """Update daily progress and streaks"""
-        today = timezone.now().date()
-        
-        if self.last_activity_date != today:
-            # Reset daily count for new day
-            self.notes_reviewed_today = 0
-            
-            # Update streak logic
-            if self.last_activity_date == today - timezone.timedelta(days=1):
-                # Consecutive day
-                self.current_streak += 1
-            else:
-                # Streak broken
-                self.current_streak = 1
-                
-            if self.current_streak > self.longest_streak:
-                self.longest_streak = self.current_streak
-                
-            self.last_activity_date = today
-            
-        self.notes_reviewed_today += 1
-        self.save()
+    def save(self, *args, **kwargs):
+        save_preserving_counters(self, ['total_notes'], *args, **kwargs)
+
+    @classmethod
+    def for_user(cls, user):
+        """Get or create a user's progress row, seeding total_notes on creation"""
+        progress, created = cls.objects.get_or_create(
+            user=user,
+            # Callable, so the count only runs when the row is created
+            defaults={'total_notes': lambda: Note.objects.filter(user=user).count()},
+        )
+        # Spare callers reading progress.user a query for the row they passed
+        progress.user = user
+        return progress
+
+    def update_daily_progress(self, day=None):
+        """
+        Count a review on day (default today) and advance the streaks.
+
+        One UPDATE with F()/Case expressions, all evaluated against the row
+        as it was, so concurrent reviews cannot overwrite each other.
+        """
+        day = day or timezone.localdate()
+        yesterday = day - timedelta(days=1)
+        streak = Case(
+            When(last_activity_date=day, then=F('current_streak')),
+            When(last_activity_date=yesterday, then=F('current_streak') + 1),
+            default=Value(1),
+        )
+        LearningProgress.objects.filter(pk=self.pk).update(
+            notes_reviewed_today=Case(
+                When(last_activity_date=day, then=F('notes_reviewed_today') + 1),
+                default=Value(1),
+            ),
+            current_streak=streak,
+            longest_streak=Greatest(F('longest_streak'), streak),
+            last_activity_date=day,
+            updated_at=timezone.now(),
+        )
+        self.refresh_from_db(fields=[
+            'notes_reviewed_today', 'current_streak', 'longest_streak',
+            'last_activity_date', 'updated_at',
+        ])
+
+
+class ReviewEvent(models.Model):
+    """One graded review; append-only, rolled up into ReviewRollup"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='review_events')
+    note = models.ForeignKey(Note, on_delete=models.SET_NULL, null=True, blank=True, related_name='review_events')
+    grade = models.PositiveSmallIntegerField()
+    interval_days = models.PositiveIntegerField(default=0)
+    reviewed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-reviewed_at']
+        indexes = [
+            models.Index(fields=['user', 'reviewed_at'], name='reviewevent_user_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"Review of {self.note_id} graded {self.grade} ({self.user_id})"
+
+
+class ReviewRollup(models.Model):
+    """Reviews per user per day or week (weeks start on Monday)"""
+    PERIOD_CHOICES = [
+        ('day', 'Day'),
+        ('week', 'Week'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='review_rollups')
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    start = models.DateField()
+    reviews = models.PositiveIntegerField(default=0)
+    grade_total = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['period', 'start']
+        constraints = [
+            # Also the index the activity endpoint reads through
+            models.UniqueConstraint(fields=['user', 'period', 'start'], name='reviewrollup_user_period_start_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.reviews} reviews in {self.period} of {self.start} ({self.user_id})"
@@ -0,0 +1,165 @@
+"""
+Pagination for note listings.
+
+``NotePagination`` behaves exactly like DRF's PageNumberPagination unless the
+client opts into keyset mode by sending a ``cursor`` query parameter (empty
+for the first page). Keyset pages are fetched with a ``WHERE (field, id) <
+(last_field, last_id)`` predicate instead of an OFFSET, so page 500 costs the
+same as page 1. Sending ``count=false`` additionally skips the COUNT(*).
+
+Page-number pages are ordered with ``id`` as the last key as well, so notes
+that tie on the ordering column (e.g. updated in one bulk operation) are
+neither repeated nor skipped between pages.
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class NotePagination(PageNumberPagination):
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+
+    # Orderings that can be paginated by keyset; `id` is always the tie-breaker
+    keyset_fields = ('updated_at', 'created_at', 'title', 'last_reviewed')
+    default_keyset_ordering = '-updated_at'
+
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = False
+        if self.cursor_query_param not in request.query_params:
+            return super().paginate_queryset(self.with_tiebreaker(queryset), request, view)
+
+        ordering = self.get_keyset_ordering(queryset)
+        if ordering is None:
+            # e.g. relevance-ranked search results; keep offset paging
+            return super().paginate_queryset(self.with_tiebreaker(queryset), request, view)
+
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        self.keyset = True
+        self.request = request
+        self.ordering = ordering
+        field_name = ordering.lstrip('-')
+        descending = ordering.startswith('-')
+        self.field = queryset.model._meta.get_field(field_name)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() not in ('0', 'false'):
+            self.count = queryset.count()
+
+        queryset = queryset.order_by(*self.get_order_by(field_name, descending))
+        cursor = self.decode_cursor(request.query_params[self.cursor_query_param])
+        if cursor is not None:
+            queryset = queryset.filter(self.get_seek_filter(field_name, descending, *cursor))
+
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.results = rows[:page_size]
+        return self.results
+
+    @staticmethod
+    def _is_pk(field):
+        return isinstance(field, str) and field.lstrip('-') in ('id', 'pk')
+
+    def with_tiebreaker(self, queryset):
+        """queryset with id as its last ordering key, in the direction of the first"""
+        order_by = list(queryset.query.order_by or queryset.model._meta.ordering)
+        if not order_by or any(self._is_pk(field) for field in order_by):
+            return queryset
+        first = order_by[0]
+        descending = first.startswith('-') if isinstance(first, str) else getattr(first, 'descending', False)
+        return queryset.order_by(*order_by, '-id' if descending else 'id')
+
+    def get_keyset_ordering(self, queryset):
+        order_by = queryset.query.order_by or queryset.model._meta.ordering or [self.default_keyset_ordering]
+        first = order_by[0]
+        if not isinstance(first, str) or first.lstrip('-') not in self.keyset_fields:
+            return None
+        if not all(self._is_pk(field) for field in order_by[1:]):
+            # The cursor only carries the first column and the id
+            return None
+        return first
+
+    def get_order_by(self, field_name, descending):
+        field = F(field_name)
+        if not self.field.null:
+            # NULLS LAST would stop SQLite from walking the index in order
+            return [field.desc() if descending else field.asc(), '-id' if descending else 'id']
+        if descending:
+            return [field.desc(nulls_last=True), '-id']
+        return [field.asc(nulls_last=True), 'id']
+
+    def get_seek_filter(self, field_name, descending, value, pk):
+        """Rows strictly after (value, pk) in the page ordering (NULLs sort last)"""
+        beyond = 'lt' if descending else 'gt'
+        if value is None:
+            return Q(**{f'{field_name}__isnull': True, f'id__{beyond}': pk})
+        after = (
+            Q(**{f'{field_name}__{beyond}': value}) |
+            Q(**{field_name: value, f'id__{beyond}': pk})
+        )
+        if self.field.null:
+            after |= Q(**{f'{field_name}__isnull': True})
+        return after
+
+    def encode_cursor(self, obj):
+        value = getattr(obj, self.field.attname)
+        payload = {
+            'o': self.ordering,
+            'v': None if value is None else self.field.value_to_string(obj),
+            'id': obj.pk,
+        }
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    def decode_cursor(self, encoded):
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if payload['o'] != self.ordering:
+                raise ValueError('cursor was issued for a different ordering')
+            value = payload['v']
+            if value is not None:
+                value = self.field.to_python(value)
+            return value, int(payload['id'])
+        except (binascii.Error, ValueError, TypeError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.results[-1]))
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        return None
+
+    def get_html_context(self):
+        if not self.keyset:
+            return super().get_html_context()
+        return {'previous_url': None, 'next_url': self.get_next_link()}
@@ -0,0 +1,96 @@
+"""
+Password hashing off the request path.
+
+Hashing is deliberately slow, and a burst of logins used to occupy every
+worker thread at once. Here the hashing runs in a small thread pool of
+PASSWORD_HASHING_WORKERS threads (hashlib's PBKDF2 and argon2-cffi release
+the GIL while they work). At most PASSWORD_HASHING_QUEUE more calls may wait
+for a thread; past that PasswordWorkBusy is raised at once and the views
+answer 429 instead of queueing. Database access stays on the request thread.
+
+authenticate_user() is ModelBackend.authenticate with the hashing moved to
+the pool. After a successful login a hash made with an older hasher or
+weaker parameters is replaced by one from the preferred hasher
+(PASSWORD_HASHER), so changing the setting migrates users as they sign in.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher, check_password, get_hasher, identify_hasher, make_password,
+)
+from django.contrib.auth.models import User
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Argon2 with the cost parameters from settings"""
+    time_cost = settings.ARGON2_TIME_COST
+    memory_cost = settings.ARGON2_MEMORY_COST
+    parallelism = settings.ARGON2_PARALLELISM
+
+
+class PasswordWorkBusy(Exception):
+    """The hashing pool and its queue are full"""
+
+
+class HashingPool:
+    def __init__(self, workers, queue_depth):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+        self.slots = threading.BoundedSemaphore(workers + queue_depth)
+
+    def run(self, func, *args):
+        if not self.slots.acquire(blocking=False):
+            raise PasswordWorkBusy('Too many sign-ins in progress, retry shortly')
+        try:
+            future = self.executor.submit(func, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future.result()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = HashingPool(settings.PASSWORD_HASHING_WORKERS, settings.PASSWORD_HASHING_QUEUE)
+    return _pool
+
+
+def hash_password(raw_password):
+    return get_pool().run(make_password, raw_password)
+
+
+def needs_rehash(encoded):
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    preferred = get_hasher('default')
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def authenticate_user(username, password):
+    """The active user with these credentials, or None"""
+    try:
+        user = User._default_manager.get_by_natural_key(username)
+    except User.DoesNotExist:
+        # Hash anyway so unknown usernames take as long as wrong passwords
+        hash_password(password)
+        return None
+
+    if not get_pool().run(check_password, password, user.password):
+        return None
+    if not user.is_active:
+        return None
+
+    if needs_rehash(user.password):
+        user.password = hash_password(password)
+        user.save(update_fields=['password'])
+    return user
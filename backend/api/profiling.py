@@ -0,0 +1,217 @@
+"""
+Opt-in per-request profiling.
+
+With PROFILING_ENABLED, ProfilingMiddleware records for every request, keyed
+by URL name and method:
+
+* total latency,
+* number of SQL queries and time spent in them (via execute_wrapper),
+* serialization time, spent building serializer ``.data`` (including any
+  queries it triggers, which is where an N+1 usually hides),
+* response rendering (JSON encoding) time,
+
+into in-process histograms exported in Prometheus text format at
+``/api/_metrics``. Requests that run more than PROFILING_QUERY_BUDGET queries
+are logged to the ``api.profiling`` logger together with their most repeated
+statements, which is what an N+1 looks like.
+
+When profiling is disabled the middleware raises MiddlewareNotUsed, so
+Django drops it from the chain at startup and requests pay nothing; the
+serializer ``.data`` timing is only installed once the middleware is in use.
+Histograms live in the worker process; with several workers, each one
+exports its own.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework import serializers
+
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+METRICS = {
+    # name: (help, buckets)
+    'api_request_duration_seconds': ('Total request latency', LATENCY_BUCKETS),
+    'api_request_queries': ('SQL queries per request', QUERY_COUNT_BUCKETS),
+    'api_request_query_duration_seconds': ('Time spent in SQL per request', LATENCY_BUCKETS),
+    'api_request_serialization_duration_seconds': ('Serializer .data time per request', LATENCY_BUCKETS),
+    'api_request_render_duration_seconds': ('Response rendering time per request', LATENCY_BUCKETS),
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Histograms keyed by (metric, view, method)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, labels, values):
+        with self.lock:
+            for name, value in values.items():
+                key = (name, *labels)
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram(METRICS[name][1])
+                histogram.observe(value)
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+
+    def export(self):
+        """Prometheus text exposition format"""
+        with self.lock:
+            items = sorted(self.histograms.items())
+        lines = []
+        for name, (help_text, _) in METRICS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for (metric, view, method), histogram in items:
+                if metric != name:
+                    continue
+                labels = f'view="{_escape(view)}",method="{method}"'
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.6f}')
+                lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+registry = Registry()
+
+
+class QueryRecorder:
+    """execute_wrapper that counts and times queries"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+
+# Seconds spent in serializer .data for the current request, if it is profiled
+_serialization = ContextVar('profiling_serialization', default=None)
+
+
+def _timed_data(data):
+    def timed(self):
+        spent = _serialization.get()
+        if spent is None:
+            return data.fget(self)
+        # Nested .data calls are already inside the outer measurement
+        token = _serialization.set(None)
+        start = time.perf_counter()
+        try:
+            return data.fget(self)
+        finally:
+            spent[0] += time.perf_counter() - start
+            _serialization.reset(token)
+    timed.profiled = True
+    return property(timed, doc=data.__doc__)
+
+
+def instrument_serializers():
+    """Time Serializer.data and ListSerializer.data for profiled requests"""
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        if not getattr(cls.data.fget, 'profiled', False):
+            cls.data = _timed_data(cls.data)
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.budget = settings.PROFILING_QUERY_BUDGET
+        instrument_serializers()
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        serialization = [0.0]
+        request._profiling_render = [0.0]
+        start = time.perf_counter()
+        token = _serialization.set(serialization)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                response = self.get_response(request)
+        finally:
+            _serialization.reset(token)
+        elapsed = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        if view == 'metrics':
+            return response
+
+        registry.observe((view, request.method), {
+            'api_request_duration_seconds': elapsed,
+            'api_request_queries': recorder.count,
+            'api_request_query_duration_seconds': recorder.duration,
+            'api_request_serialization_duration_seconds': serialization[0],
+            'api_request_render_duration_seconds': request._profiling_render[0],
+        })
+        if recorder.count > self.budget:
+            repeated = ', '.join(
+                f'{count}x {sql[:120]}' for sql, count in recorder.statements.most_common(3)
+            )
+            logger.warning(
+                '%s %s (%s) ran %d queries (budget %d, %.1f ms in SQL); most repeated: %s',
+                request.method, request.path, view, recorder.count, self.budget,
+                recorder.duration * 1000, repeated,
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time that step
+        started = time.perf_counter()
+
+        def rendered(response):
+            request._profiling_render[0] += time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
@@ -0,0 +1,225 @@
+"""
+Note content rendered to HTML and a plain-text excerpt, cached by content hash.
+
+render() handles the Markdown notes are written in: ATX headings, paragraphs,
+fenced code blocks, block quotes, bullet and numbered lists, horizontal rules,
+and inline code, emphasis, strong emphasis and links. All text is escaped
+before any tag is added and no other tags are ever produced, so the HTML is
+safe to insert into a page as is. Link targets are limited to http(s),
+mailto and relative URLs.
+
+Renderings live in the ``renderings`` cache under the SHA-256 of the content
+(``Note.content_hash``): notes with the same content share an entry, and an
+edit moves the note to a new key rather than invalidating anything. The
+backend evicts the least recently used entries (LocMemCache keeps
+RENDER_CACHE_MAX_ENTRIES). Saving a note renders it once the transaction
+commits; notes written in bulk are rendered on first read. attach_renderings()
+serves a page of notes from one cache read, plus one query for the content
+of misses when it was not loaded.
+"""
+import hashlib
+import re
+from urllib.parse import urlsplit
+
+from django.core.cache import caches
+from django.utils.html import escape
+
+
+CACHE_ALIAS = 'renderings'
+# Part of every cache key; bump when the output of render() changes
+RENDERER_VERSION = 1
+EXCERPT_LENGTH = 280
+SAFE_SCHEMES = ('', 'http', 'https', 'mailto')
+
+FENCE = re.compile(r'^(`{3,}|~{3,})\s*([\w+-]*)')
+HEADING = re.compile(r'^(#{1,6})\s+(.*?)(?:\s+#+)?\s*$')
+RULE = re.compile(r'^(?:(?:-\s*){3,}|(?:\*\s*){3,}|(?:_\s*){3,})$')
+QUOTE = re.compile(r'^>\s?(.*)$')
+LIST_ITEMS = (('ul', re.compile(r'^[-*+]\s+(.*)$')), ('ol', re.compile(r'^\d{1,9}[.)]\s+(.*)$')))
+INLINE = re.compile(
+    r'`(?P<code>[^`]+)`'
+    r'|\[(?P<label>[^\]]+)\]\((?P<url>[^)\s]+)\)'
+    r'|\*\*(?P<strong>.+?)\*\*|(?<!\w)__(?P<strong_>.+?)__(?!\w)'
+    r'|\*(?P<em>[^*\s](?:.*?[^*\s])?)\*|(?<!\w)_(?P<em_>[^_\s](?:.*?[^_\s])?)_(?!\w)'
+)
+WHITESPACE = re.compile(r'\s+')
+
+
+def content_hash(content):
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def _safe_url(url):
+    if any(ord(char) < 32 for char in url):
+        return False
+    try:
+        return urlsplit(url).scheme.lower() in SAFE_SCHEMES
+    except ValueError:
+        return False
+
+
+def _inline(text, plain=False):
+    """Inline markup of text as HTML, or as plain text"""
+    out, pos = [], 0
+    for match in INLINE.finditer(text):
+        out.append(text[pos:match.start()] if plain else escape(text[pos:match.start()]))
+        pos = match.end()
+        if match['code'] is not None:
+            out.append(match['code'] if plain else f"<code>{escape(match['code'])}</code>")
+        elif match['url'] is not None:
+            label = _inline(match['label'], plain)
+            if plain or not _safe_url(match['url']):
+                out.append(label)
+            else:
+                out.append(f'<a href="{escape(match["url"])}" rel="nofollow noopener">{label}</a>')
+        else:
+            tag = 'strong' if match['strong'] or match['strong_'] else 'em'
+            inner = _inline(match[match.lastgroup], plain)
+            out.append(inner if plain else f'<{tag}>{inner}</{tag}>')
+    out.append(text[pos:] if plain else escape(text[pos:]))
+    return ''.join(out)
+
+
+class _Renderer:
+    def __init__(self):
+        self.html = []
+        self.text = []
+        self.paragraph = []
+        self.list_tag = None
+        self.items = []
+        self.quote = []
+        self.fence = None
+        self.language = ''
+        self.code = []
+
+    def feed(self, content):
+        for line in content.replace('\r\n', '\n').replace('\r', '\n').split('\n'):
+            self.line(line)
+        if self.fence is not None:
+            self.close_code()
+        self.flush()
+
+    def line(self, line):
+        stripped = line.strip()
+        if self.fence is not None:
+            if stripped.startswith(self.fence) and not stripped.strip(self.fence[0]):
+                self.close_code()
+            else:
+                self.code.append(line)
+            return
+
+        fence = FENCE.match(stripped)
+        quote = QUOTE.match(stripped)
+        heading = HEADING.match(stripped)
+        if not stripped:
+            self.flush()
+        elif fence:
+            self.flush()
+            self.fence, self.language = fence.groups()
+        elif quote:
+            self.flush(keep='quote')
+            self.quote.append(quote.group(1))
+        elif heading:
+            self.flush()
+            level, text = len(heading.group(1)), heading.group(2)
+            self.html.append(f'<h{level}>{_inline(text)}</h{level}>')
+            self.text.append(_inline(text, plain=True))
+        elif RULE.match(stripped):
+            self.flush()
+            self.html.append('<hr>')
+        elif self.list_item(stripped):
+            pass
+        elif self.items and line[:1].isspace():
+            self.items[-1] += ' ' + stripped
+        else:
+            self.flush(keep='paragraph')
+            self.paragraph.append(stripped)
+
+    def list_item(self, stripped):
+        for tag, pattern in LIST_ITEMS:
+            match = pattern.match(stripped)
+            if match:
+                if self.list_tag != tag:
+                    self.flush()
+                self.list_tag = tag
+                self.items.append(match.group(1))
+                return True
+        return False
+
+    def close_code(self):
+        language = f' class="language-{escape(self.language)}"' if self.language else ''
+        self.html.append(f'<pre><code{language}>{escape(chr(10).join(self.code))}</code></pre>')
+        self.fence, self.language, self.code = None, '', []
+
+    def flush(self, keep=None):
+        """Close the open paragraph, list and quote, except keep"""
+        if self.paragraph and keep != 'paragraph':
+            text = '\n'.join(self.paragraph)
+            self.html.append(f'<p>{_inline(text)}</p>')
+            self.text.append(_inline(text, plain=True))
+            self.paragraph = []
+        if self.items:
+            body = ''.join(f'<li>{_inline(item)}</li>' for item in self.items)
+            self.html.append(f'<{self.list_tag}>{body}</{self.list_tag}>')
+            self.text.extend(_inline(item, plain=True) for item in self.items)
+            self.list_tag, self.items = None, []
+        if self.quote and keep != 'quote':
+            inner = _Renderer()
+            inner.feed('\n'.join(self.quote))
+            self.html.append(f"<blockquote>{''.join(inner.html)}</blockquote>")
+            self.text.extend(inner.text)
+            self.quote = []
+
+
+def excerpt(parts, length=EXCERPT_LENGTH):
+    text = WHITESPACE.sub(' ', ' '.join(parts)).strip()
+    if len(text) <= length:
+        return text
+    cut = text[:length].rsplit(' ', 1)[0] if ' ' in text[:length] else text[:length]
+    return cut.rstrip(' .,;:-') + '…'
+
+
+def render(content):
+    """{'html': ..., 'excerpt': ...} for Markdown content"""
+    renderer = _Renderer()
+    renderer.feed(content)
+    return {'html': '\n'.join(renderer.html), 'excerpt': excerpt(renderer.text)}
+
+
+def cache_key(sha256):
+    return f'render:{RENDERER_VERSION}:{sha256}'
+
+
+def warm(content):
+    """Render content into the cache unless it is there already"""
+    cache = caches[CACHE_ALIAS]
+    key = cache_key(content_hash(content))
+    if not cache.has_key(key):
+        cache.set(key, render(content))
+
+
+def attach_renderings(notes):
+    """Set note.rendering on each of notes, rendering only content not in the cache"""
+    pending = [note for note in notes if not hasattr(note, 'rendering')]
+    if not pending:
+        return
+    cache = caches[CACHE_ALIAS]
+    keys = {note.pk: cache_key(note.content_hash) for note in pending if note.content_hash}
+    found = cache.get_many(set(keys.values()))
+
+    misses = [note for note in pending if keys.get(note.pk) not in found]
+    if misses:
+        deferred = [note.pk for note in misses if 'content' in note.get_deferred_fields()]
+        contents = dict(
+            type(misses[0])._default_manager.filter(pk__in=deferred).values_list('pk', 'content')
+        ) if deferred else {}
+        fresh = {}
+        for note in misses:
+            content = contents.get(note.pk, '') if note.pk in deferred else note.content
+            key = keys[note.pk] = cache_key(content_hash(content))
+            if key not in found:
+                found[key] = fresh[key] = render(content)
+        cache.set_many(fresh)
+
+    for note in pending:
+        note.rendering = found[keys[note.pk]]
@@ -0,0 +1,60 @@
+"""
+SM-2 spaced-repetition scheduling.
+
+Each note carries ``repetitions`` (successful reviews in a row),
+``interval_days``, ``ease`` and ``due_at``. A review is graded 0-5 (or
+again/hard/good/easy); a grade below 3 is a lapse that restarts the note at a
+one-day interval, otherwise the interval grows 1 -> 6 -> interval * ease.
+Ease moves with the grade and never drops below MIN_EASE.
+
+``due_at`` is indexed together with the user (active notes only), so the
+review queue is a range read of the first k index entries whatever the
+size of the collection.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+
+
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+PASSING_GRADE = 3
+DEFAULT_GRADE = 4
+
+DUE_BATCH_SIZE = 20
+MAX_DUE_BATCH_SIZE = 200
+
+GRADE_NAMES = {'again': 1, 'hard': 3, 'good': 4, 'easy': 5}
+GRADE_CHOICES = list(range(6)) + list(GRADE_NAMES)
+
+
+def parse_grade(value):
+    """A 0-5 grade from an int, a numeric string or a grade name"""
+    if value in GRADE_NAMES:
+        return GRADE_NAMES[value]
+    return int(value)
+
+
+def next_review(repetitions, interval_days, ease, grade):
+    """(repetitions, interval_days, ease) after a review graded 0-5"""
+    ease = round(max(MIN_EASE, ease + 0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02)), 2)
+    if grade < PASSING_GRADE:
+        return 0, 1, ease
+    if repetitions == 0:
+        interval_days = 1
+    elif repetitions == 1:
+        interval_days = 6
+    else:
+        interval_days = max(1, round(interval_days * ease))
+    return repetitions + 1, interval_days, ease
+
+
+def schedule(note, grade, now=None):
+    """Apply a review to note's scheduling fields (without saving)"""
+    now = now or timezone.now()
+    note.repetitions, note.interval_days, note.ease = next_review(
+        note.repetitions, note.interval_days, note.ease, grade
+    )
+    note.last_reviewed = now
+    note.due_at = now + timedelta(days=note.interval_days)
+    return note
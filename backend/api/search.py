@@ -0,0 +1,179 @@
+"""
+Full-text search over notes backed by an SQLite FTS5 index.
+
+``api_note_fts`` holds one row per note (rowid = note id) with the note's
+title, content, summary, tag names and category name. It is kept in sync by
+the signal handlers in ``api.signals`` and can be rebuilt with
+``python manage.py rebuild_search_index``. On databases without FTS5 the
+search endpoint falls back to the old ``icontains`` scan.
+
+Highlights are produced with control-character markers, then the text is
+escaped and only the markers become ``<mark>`` tags, so note content can
+never inject markup.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+
+from .models import Category, Tag, Note
+
+
+FTS_TABLE = 'api_note_fts'
+
+# Column weights for bm25(): title, content, summary, tags, category
+RANK_WEIGHTS = (10.0, 1.0, 4.0, 6.0, 3.0)
+
+CREATE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "title, content, summary, tags, category, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+DROP_SQL = f"DROP TABLE IF EXISTS {FTS_TABLE}"
+
+# Wrapped around matches by highlight()/snippet(); see mark_matches()
+MARK_START, MARK_END = '\x02', '\x03'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# connection alias -> whether its SQLite library has FTS5, probed once
+_fts5_available = {}
+
+
+def fts_enabled():
+    """Whether the FTS5 index can be used on the default connection"""
+    if connection.vendor != 'sqlite':
+        return False
+    if connection.alias not in _fts5_available:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            _fts5_available[connection.alias] = bool(cursor.fetchone()[0])
+    return _fts5_available[connection.alias]
+
+
+def mark_matches(text):
+    """Escape highlighted text, turning its match markers into <mark> tags"""
+    if text is None:
+        return None
+    return escape(text).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+def build_match_query(query):
+    """
+    Turn free text into a safe FTS5 MATCH expression.
+
+    Every word must match, and each one is treated as a prefix so results
+    appear while the user is still typing ("pyth dec" -> python decorators).
+    """
+    tokens = _TOKEN_RE.findall(query)
+    return ' AND '.join(f'"{token}"*' for token in tokens)
+
+
+def _select_documents(where, params=()):
+    note = Note._meta.db_table
+    category = Category._meta.db_table
+    tag = Tag._meta.db_table
+    note_tags = Note.tags.through._meta.db_table
+    return (
+        f"SELECT n.id, n.title, n.content, n.summary, "
+        f"COALESCE((SELECT group_concat(t.name, ' ') FROM {note_tags} nt "
+        f"JOIN {tag} t ON t.id = nt.tag_id WHERE nt.note_id = n.id), ''), "
+        f"COALESCE(c.name, '') "
+        f"FROM {note} n LEFT JOIN {category} c ON c.id = n.category_id "
+        f"WHERE {where}"
+    ), list(params)
+
+
+def _reindex(where, params=()):
+    if not fts_enabled():
+        return
+    select_sql, select_params = _select_documents(where, params)
+    note = Note._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT n.id FROM {note} n WHERE {where})",
+            list(params),
+        )
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, content, summary, tags, category) {select_sql}",
+            select_params,
+        )
+
+
+def index_notes(note_ids):
+    """(Re)index the given notes"""
+    note_ids = list(note_ids)
+    if not note_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(note_ids))
+    _reindex(f"n.id IN ({placeholders})", note_ids)
+
+
+def index_category_notes(category_id):
+    """Reindex every note in a category, e.g. after it was renamed"""
+    _reindex("n.category_id = %s", [category_id])
+
+
+def index_tag_notes(tag_id):
+    """Reindex every note carrying a tag, e.g. after it was renamed"""
+    note_tags = Note.tags.through._meta.db_table
+    _reindex(f"n.id IN (SELECT note_id FROM {note_tags} WHERE tag_id = %s)", [tag_id])
+
+
+def unindex_notes(note_ids):
+    note_ids = list(note_ids)
+    if not note_ids or not fts_enabled():
+        return
+    placeholders = ', '.join(['%s'] * len(note_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", note_ids)
+
+
+def rebuild_index():
+    """Drop and repopulate the whole index, returning the number of notes indexed"""
+    if not fts_enabled():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    _reindex("1 = 1")
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT count(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
+
+
+def search_notes(queryset, query, highlight=False):
+    """
+    Restrict a Note queryset to rows matching query, ordered by relevance.
+
+    With highlight=True every note gets ``title_highlight`` and ``snippet``
+    attributes with matches between MARK_START and MARK_END (see mark_matches()).
+    """
+    if not fts_enabled():
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(content__icontains=query) |
+            Q(summary__icontains=query) |
+            Q(tags__name__icontains=query) |
+            Q(category__name__icontains=query)
+        ).distinct()
+
+    match = build_match_query(query)
+    if not match:
+        return queryset.none()
+
+    note = Note._meta.db_table
+    weights = ', '.join(str(w) for w in RANK_WEIGHTS)
+    select = {'search_rank': f"bm25({FTS_TABLE}, {weights})"}
+    if highlight:
+        markers = f"'{MARK_START}', '{MARK_END}'"
+        select['title_highlight'] = f"highlight({FTS_TABLE}, 0, {markers})"
+        select['snippet'] = f"snippet({FTS_TABLE}, -1, {markers}, '…', 16)"
+
+    return queryset.extra(
+        select=select,
+        tables=[FTS_TABLE],
+        where=[f"{FTS_TABLE}.rowid = {note}.id", f"{FTS_TABLE} MATCH %s"],
+        params=[match],
+    ).order_by('search_rank', '-updated_at')
@@ -0,0 +1,181 @@
+"""
+Synthetic datasets for benchmarks and load tests.
+
+generate_dataset() creates `users` accounts named ``<prefix>-<n>``, each with
+its own categories, tags and notes (plus attachment rows), inserting
+everything with bulk_create in batches. Content is markdown assembled from a
+fixed vocabulary with a seeded RNG, so the same arguments always produce the
+same data. Attachment rows share a pool of blob rows, as identical uploads
+would, but no files are written. Because bulk_create skips model signals,
+counters, blob refcounts, the search index and progress rows are rebuilt at
+the end.
+"""
+import hashlib
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .blobs import blob_name
+from .models import Category, Tag, Note, Attachment, Blob, LearningProgress
+from . import counters, search
+
+
+DEFAULT_PASSWORD = 'benchmark-password'
+
+WORDS = (
+    'index query cache latency python django model view serializer request response '
+    'transaction commit rollback schema migration cursor page token sync review recall '
+    'interval streak memory tree graph hash queue stack heap sort search vector matrix '
+    'function closure generator iterator decorator thread process lock event signal '
+    'network socket protocol header payload stream buffer file block page table column'
+).split()
+COLORS = ['#3B82F6', '#10B981', '#F59E0B', '#EF4444', '#8B5CF6', '#EC4899']
+DIFFICULTIES = [choice for choice, _ in Note.DIFFICULTY_CHOICES]
+FILE_TYPES = [('pdf', 'document'), ('png', 'image'), ('mp3', 'audio'), ('txt', 'document')]
+# Distinct attachment contents per dataset; attachments pick from these
+BLOB_POOL_SIZE = 50
+
+NoteTag = Note.tags.through
+
+
+def _sentence(rng, low=6, high=14):
+    words = rng.choices(WORDS, k=rng.randint(low, high))
+    return ' '.join(words).capitalize() + '.'
+
+
+def _content(rng, size):
+    """Markdown of roughly `size` characters"""
+    parts, length = [f'# {_sentence(rng, 3, 6)}'], 0
+    while length < size:
+        kind = rng.random()
+        if kind < 0.15:
+            block = f'## {_sentence(rng, 2, 5)}'
+        elif kind < 0.3:
+            block = '\n'.join(f'- {_sentence(rng, 3, 8)}' for _ in range(rng.randint(2, 5)))
+        elif kind < 0.4:
+            block = f"```python\n{rng.choice(WORDS)} = {rng.choice(WORDS)}({rng.choice(WORDS)})\n```"
+        else:
+            block = ' '.join(_sentence(rng) for _ in range(rng.randint(2, 6)))
+        parts.append(block)
+        length += len(block)
+    return '\n\n'.join(parts)[:max(size, 1)]
+
+
+def generate_dataset(users=1, categories=5, tags=20, notes=100, content_size=2000,
+                     tag_fanout=3, attachments=0.2, prefix='bench', seed=0, batch_size=1000):
+    """
+    Create the dataset and return a summary dict.
+
+    categories, tags and notes are per user; tag_fanout is the number of tags
+    per note and attachments the fraction of notes that get one.
+    """
+    rng = random.Random(seed)
+    started = time.monotonic()
+    now = timezone.now()
+    password = make_password(DEFAULT_PASSWORD)
+
+    with transaction.atomic():
+        owners = User.objects.bulk_create([
+            User(username=f'{prefix}-{n}', email=f'{prefix}-{n}@example.com', password=password)
+            for n in range(users)
+        ], batch_size=batch_size)
+        LearningProgress.objects.bulk_create(
+            [LearningProgress(user=owner) for owner in owners], batch_size=batch_size
+        )
+
+        category_rows = Category.objects.bulk_create([
+            Category(user=owner, name=f'{rng.choice(WORDS).title()} {i}', color=rng.choice(COLORS),
+                     description=_sentence(rng))
+            for owner in owners for i in range(categories)
+        ], batch_size=batch_size)
+        tag_rows = Tag.objects.bulk_create([
+            Tag(user=owner, name=f'{rng.choice(WORDS)}-{i}')
+            for owner in owners for i in range(tags)
+        ], batch_size=batch_size)
+
+        pool = []
+        for i in range(BLOB_POOL_SIZE):
+            sha256 = hashlib.sha256(f'{prefix}-{seed}-{i}'.encode()).hexdigest()
+            extension, file_type = FILE_TYPES[i % len(FILE_TYPES)]
+            pool.append((Blob(
+                sha256=sha256, file=blob_name(sha256, f'x.{extension}'), size=rng.randint(1_000, 5_000_000),
+            ), extension, file_type))
+        Blob.objects.bulk_create([blob for blob, _, _ in pool], ignore_conflicts=True)
+
+        categories_by_user, tags_by_user = {}, {}
+        for category in category_rows:
+            categories_by_user.setdefault(category.user_id, []).append(category.pk)
+        for tag in tag_rows:
+            tags_by_user.setdefault(tag.user_id, []).append(tag.pk)
+
+        note_count = link_count = attachment_count = 0
+        for owner in owners:
+            for offset in range(0, notes, batch_size):
+                batch = []
+                for _ in range(offset, min(offset + batch_size, notes)):
+                    created = now - timedelta(seconds=rng.randint(0, 365 * 86400))
+                    reviewed = created + (now - created) * rng.random() if rng.random() < 0.5 else None
+                    batch.append(Note(
+                        user=owner,
+                        category_id=rng.choice(categories_by_user[owner.pk]),
+                        title=_sentence(rng, 3, 8)[:200],
+                        content=_content(rng, content_size),
+                        summary=_sentence(rng),
+                        difficulty=rng.choice(DIFFICULTIES),
+                        is_favorite=rng.random() < 0.1,
+                        is_archived=rng.random() < 0.05,
+                        created_at=created,
+                        last_reviewed=reviewed,
+                        due_at=(reviewed or created) + timedelta(days=rng.randint(0, 30)),
+                    ))
+                Note.objects.bulk_create(batch)
+                note_count += len(batch)
+
+                user_tags = tags_by_user.get(owner.pk, [])
+                links = [
+                    NoteTag(note_id=note.pk, tag_id=tag_id)
+                    for note in batch
+                    for tag_id in rng.sample(user_tags, min(tag_fanout, len(user_tags)))
+                ]
+                NoteTag.objects.bulk_create(links, batch_size=batch_size)
+                link_count += len(links)
+
+                files = []
+                for note in batch:
+                    if rng.random() < attachments:
+                        blob, extension, file_type = rng.choice(pool)
+                        files.append(Attachment(
+                            note=note, blob=blob, file=blob.file.name,
+                            original_name=f'{rng.choice(WORDS)}.{extension}', file_type=file_type,
+                            file_size=blob.size, uploaded_at=note.created_at,
+                        ))
+                Attachment.objects.bulk_create(files, batch_size=batch_size)
+                attachment_count += len(files)
+
+        owned = {'user__in': owners}
+        counters.recount_categories(Category.objects.filter(**owned))
+        counters.recount_tags(Tag.objects.filter(**owned))
+        counters.recount_progress(LearningProgress.objects.filter(**owned))
+        counters.recount_blobs(Blob.objects.filter(pk__in=[blob.pk for blob, _, _ in pool]))
+        search.rebuild_index()
+
+    return {
+        'users': len(owners),
+        'categories': len(category_rows),
+        'tags': len(tag_rows),
+        'notes': note_count,
+        'note_tags': link_count,
+        'attachments': attachment_count,
+        'seconds': round(time.monotonic() - started, 2),
+    }
+
+
+def delete_dataset(prefix='bench'):
+    """Remove the users (and everything they own) created with prefix"""
+    deleted, _ = User.objects.filter(username__startswith=f'{prefix}-').delete()
+    return deleted
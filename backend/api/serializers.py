@@ -1,7 +1,16 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
-from .models import Category, Tag, Note, Attachment, LearningProgress
+from django.db import transaction
+from django.db.models import QuerySet
+from .models import Category, Tag, Note, Attachment, LearningProgress, UploadSession
+from .blobs import store_blob
+from .fieldsets import SparseFieldsetSerializerMixin
+from .passwords import hash_password
+from .rendering import attach_renderings
+from .search import mark_matches
+from .scheduling import GRADE_CHOICES
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -26,58 +35,93 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         validated_data.pop('password_confirm')
-        user = User.objects.create_user(**validated_data)
+        password = validated_data.pop('password')
+        # create_user() without hashing on the request thread
+        user = User(**validated_data)
+        user.username = User.normalize_username(user.username)
+        user.email = User.objects.normalize_email(user.email)
+        user.password = hash_password(password)
+        user.save()
         # Create learning progress for new user
         LearningProgress.objects.create(user=user)
         return user
 
 
-class CategorySerializer(serializers.ModelSerializer):
-    notes_count = serializers.SerializerMethodField()
-
+class CategorySerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'description', 'color', 'notes_count', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'created_at', 'updated_at']
-
-    def get_notes_count(self, obj):
-        return obj.notes.filter(is_archived=False).count()
+        read_only_fields = ['id', 'notes_count', 'created_at', 'updated_at']
 
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
 
-class TagSerializer(serializers.ModelSerializer):
-    notes_count = serializers.SerializerMethodField()
-
+class TagSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
-        fields = ['id', 'name', 'notes_count', 'created_at']
-        read_only_fields = ['id', 'created_at']
-
-    def get_notes_count(self, obj):
-        return obj.notes.filter(is_archived=False).count()
+        fields = ['id', 'name', 'notes_count', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'notes_count', 'created_at', 'updated_at']
 
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
 
-class AttachmentSerializer(serializers.ModelSerializer):
+class AttachmentSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     file_size_display = serializers.SerializerMethodField()
+    sha256 = serializers.CharField(source='blob_id', read_only=True)
 
     class Meta:
         model = Attachment
         fields = ['id', 'file', 'original_name', 'file_type', 'file_size', 
-                 'file_size_display', 'description', 'uploaded_at']
+                 'file_size_display', 'sha256', 'description', 'uploaded_at']
         read_only_fields = ['id', 'file_size', 'uploaded_at']
+        field_requirements = {'file_size_display': ['file_size']}
 
     def get_file_size_display(self, obj):
         return obj.get_file_size_display()
 
+    def update(self, instance, validated_data):
+        file = validated_data.pop('file', None)
+        if file is not None:
+            # New content goes through the blob store like an upload
+            blob = store_blob(file)
+            validated_data.update(blob=blob, file=blob.file.name, file_size=blob.size)
+        return super().update(instance, validated_data)
+
+
+class RenderedContentField(serializers.Field):
+    """
+    A note's content as sanitized HTML (part='html') or a plain-text excerpt.
+
+    Inside a list, the first note rendered fetches the whole page from the
+    cache, so a page costs one cache read however many notes it has.
+    """
+
+    def __init__(self, part, **kwargs):
+        self.part = part
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, note):
+        if not hasattr(note, 'rendering'):
+            page = getattr(self.parent.parent, 'instance', None)
+            page = list(page) if isinstance(page, (list, QuerySet)) else []
+            attach_renderings(page if note in page else [note])
+        return note.rendering[self.part]
+
 
-class NoteSerializer(serializers.ModelSerializer):
+RENDERED_FIELDS = {
+    'content_html': (RenderedContentField, {'part': 'html'}),
+    'excerpt': (RenderedContentField, {'part': 'excerpt'}),
+}
+# Renderings are looked up by hash; content is only read on a cache miss
+RENDERED_FIELD_REQUIREMENTS = {'content_html': ['content_hash'], 'excerpt': ['content_hash']}
+
+
+class NoteSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     tags = TagSerializer(many=True, read_only=True)
     tag_ids = serializers.ListField(
         child=serializers.IntegerField(), write_only=True, required=False
@@ -89,9 +133,14 @@ class NoteSerializer(serializers.ModelSerializer):
         model = Note
         fields = ['id', 'title', 'content', 'summary', 'category', 'category_name', 
                  'tags', 'tag_ids', 'difficulty', 'is_favorite', 'is_archived', 
-                 'source_url', 'attachments', 'created_at', 'updated_at', 'last_reviewed']
-        read_only_fields = ['id', 'created_at', 'updated_at']
-
+                 'source_url', 'attachments', 'created_at', 'updated_at', 'last_reviewed',
+                 'due_at', 'interval_days', 'ease', 'repetitions']
+        read_only_fields = ['id', 'created_at', 'updated_at',
+                            'due_at', 'interval_days', 'ease', 'repetitions']
+        expandable_fields = RENDERED_FIELDS
+        field_requirements = RENDERED_FIELD_REQUIREMENTS
+
+    @transaction.atomic
     def create(self, validated_data):
         tag_ids = validated_data.pop('tag_ids', [])
         validated_data['user'] = self.context['request'].user
@@ -104,6 +153,7 @@ class NoteSerializer(serializers.ModelSerializer):
         
         return note
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tag_ids = validated_data.pop('tag_ids', None)
         note = super().update(instance, validated_data)
@@ -122,8 +172,70 @@ class NoteSerializer(serializers.ModelSerializer):
         return value
 
 
-class NoteListSerializer(serializers.ModelSerializer):
-    """Lightweight serializer for note lists"""
+class NoteBulkDataSerializer(serializers.ModelSerializer):
+    """
+    Field validation for bulk create/update items.
+
+    Category and tag ownership is checked by api.bulk against maps loaded
+    once per request, so `category` is a plain id here rather than a related
+    field that would query per item.
+    """
+    category = serializers.IntegerField()
+    tag_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    class Meta:
+        model = Note
+        fields = ['title', 'content', 'summary', 'category', 'tag_ids', 'difficulty',
+                  'is_favorite', 'is_archived', 'source_url']
+
+
+class NoteBulkOperationSerializer(serializers.Serializer):
+    OPERATIONS = ['create', 'update', 'archive', 'favorite', 'delete', 'tags']
+    TAG_MODES = ['add', 'remove', 'set']
+
+    op = serializers.ChoiceField(choices=OPERATIONS)
+    id = serializers.IntegerField(required=False)
+    data = serializers.DictField(required=False)
+    value = serializers.BooleanField(required=False, default=True)
+    tag_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    mode = serializers.ChoiceField(choices=TAG_MODES, required=False, default='add')
+
+    def validate(self, attrs):
+        if attrs['op'] != 'create' and attrs.get('id') is None:
+            raise serializers.ValidationError({'id': 'This field is required.'})
+        if attrs['op'] in ('create', 'update') and 'data' not in attrs:
+            raise serializers.ValidationError({'data': 'This field is required.'})
+        if attrs['op'] == 'tags' and 'tag_ids' not in attrs:
+            raise serializers.ValidationError({'tag_ids': 'This field is required.'})
+        return attrs
+
+
+class NoteReviewSerializer(serializers.Serializer):
+    """Grade for mark_reviewed: 0-5 or again/hard/good/easy (default good)"""
+    grade = serializers.ChoiceField(choices=GRADE_CHOICES, required=False)
+
+
+class NoteSearchSerializer(NoteSerializer):
+    """Note serializer with relevance and optional highlight fields"""
+    search_rank = serializers.SerializerMethodField()
+    title_highlight = serializers.SerializerMethodField()
+    snippet = serializers.SerializerMethodField()
+
+    class Meta(NoteSerializer.Meta):
+        fields = NoteSerializer.Meta.fields + ['search_rank', 'title_highlight', 'snippet']
+
+    def get_search_rank(self, obj):
+        return getattr(obj, 'search_rank', None)
+
+    def get_title_highlight(self, obj):
+        return mark_matches(getattr(obj, 'title_highlight', None))
+
+    def get_snippet(self, obj):
+        return mark_matches(getattr(obj, 'snippet', None))
+
+
+class NoteListSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    """Lightweight serializer for note lists (?expand= adds the heavy fields)"""
     category_name = serializers.CharField(source='category.name', read_only=True)
     tags_count = serializers.SerializerMethodField()
 
@@ -131,6 +243,17 @@ class NoteListSerializer(serializers.ModelSerializer):
         model = Note
         fields = ['id', 'title', 'summary', 'category_name', 'difficulty', 
                  'is_favorite', 'is_archived', 'tags_count', 'created_at', 'updated_at']
+        expandable_fields = {
+            'content': (serializers.CharField, {'read_only': True}),
+            'category': (CategorySerializer, {'read_only': True}),
+            'tags': (TagSerializer, {'many': True, 'read_only': True}),
+            'attachments': (AttachmentSerializer, {'many': True, 'read_only': True}),
+            'source_url': (serializers.URLField, {'read_only': True}),
+            'last_reviewed': (serializers.DateTimeField, {'read_only': True}),
+            'due_at': (serializers.DateTimeField, {'read_only': True}),
+            **RENDERED_FIELDS,
+        }
+        field_requirements = {'tags_count': ['tags'], **RENDERED_FIELD_REQUIREMENTS}
 
     def get_tags_count(self, obj):
         return obj.tags.count()
@@ -154,16 +277,26 @@ class AttachmentUploadSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         file = validated_data['file']
         validated_data['original_name'] = file.name
-        validated_data['file_size'] = file.size
-        
-        # Determine file type based on extension
-        file_extension = file.name.split('.')[-1].lower()
-        file_type_mapping = {
-            'jpg': 'image', 'jpeg': 'image', 'png': 'image', 'gif': 'image', 'svg': 'image',
-            'pdf': 'document', 'doc': 'document', 'docx': 'document', 'txt': 'document',
-            'mp4': 'video', 'avi': 'video', 'mov': 'video', 'wmv': 'video',
-            'mp3': 'audio', 'wav': 'audio', 'flac': 'audio'
-        }
-        validated_data['file_type'] = file_type_mapping.get(file_extension, 'other')
+        validated_data['file_type'] = Attachment.file_type_for(file.name)
         
+        # Identical content is stored once; a duplicate only adds this row
+        blob = store_blob(file)
+        validated_data.update(blob=blob, file=blob.file.name, file_size=blob.size)
         return super().create(validated_data)
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    chunk_size = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'note', 'original_name', 'description', 'total_size', 'received',
+                 'chunk_size', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'note', 'received', 'created_at', 'updated_at']
+
+    def get_chunk_size(self, obj):
+        return settings.UPLOAD_CHUNK_SIZE
+
+
+class UploadFinalizeSerializer(serializers.Serializer):
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False)
@@ -0,0 +1,342 @@
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, QuerySet
+from django.db.models.base import DEFERRED
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Category, Tag, Note, Attachment, Blob, LearningProgress, Tombstone
+from . import authentication, counters, rendering, search, stats
+
+
+def _origin_model(origin):
+    """The model whose delete() started a deletion; origin is an instance or a queryset"""
+    return origin.model if isinstance(origin, QuerySet) else type(origin)
+
+
+def _deleted_with_category(origin):
+    """
+    Whether a note (or its attachment) goes as part of deleting its category.
+    The category's own receivers then handle all its notes in bulk.
+    """
+    return _origin_model(origin) is Category
+
+
+# ---------------------------------------------------------------------------
+# Category / Tag notes_count, LearningProgress.total_notes and Blob.refcount maintenance
+# ---------------------------------------------------------------------------
+
+@receiver(pre_save, sender=Note)
+def remember_note_state(sender, instance, raw=False, **kwargs):
+    """Capture the stored category/archive state before an update"""
+    if raw or instance._state.adding or instance.pk is None:
+        instance._previous_state = None
+        return
+
+    loaded = getattr(instance, '_loaded_values', {})
+    category_id = loaded.get('category_id', DEFERRED)
+    is_archived = loaded.get('is_archived', DEFERRED)
+    if category_id is DEFERRED or is_archived is DEFERRED:
+        row = Note.objects.filter(pk=instance.pk).values('category_id', 'is_archived').first()
+        if row is None:
+            instance._previous_state = None
+            return
+        category_id, is_archived = row['category_id'], row['is_archived']
+    instance._previous_state = (category_id, is_archived)
+
+
+@receiver(post_save, sender=Note)
+def update_counts_on_note_save(sender, instance, created, raw=False, **kwargs):
+    """Move the note's contribution between category/tag counters"""
+    if raw:
+        return
+
+    previous = getattr(instance, '_previous_state', None)
+
+    if created:
+        counters.adjust_total_notes(instance.user_id, 1)
+
+    if created or previous is None:
+        # Tags are attached afterwards and counted by the m2m handler
+        if not instance.is_archived:
+            counters.adjust_category(instance.category_id, 1)
+        return
+
+    old_category_id, was_archived = previous
+    if old_category_id != instance.category_id or was_archived != instance.is_archived:
+        if not was_archived:
+            counters.adjust_category(old_category_id, -1)
+        if not instance.is_archived:
+            counters.adjust_category(instance.category_id, 1)
+
+    if was_archived != instance.is_archived:
+        counters.adjust_tags(counters.note_tag_ids(instance.pk), -1 if instance.is_archived else 1)
+
+
+@receiver(pre_delete, sender=Note)
+def remember_note_tags(sender, instance, origin=None, **kwargs):
+    """Tag links are removed before post_delete fires, so record them now"""
+    if _deleted_with_category(origin):
+        return
+    instance._tag_ids_at_delete = [] if instance.is_archived else counters.note_tag_ids(instance.pk)
+
+
+@receiver(post_delete, sender=Note)
+def update_counts_on_note_delete(sender, instance, origin=None, **kwargs):
+    if _deleted_with_category(origin):
+        return
+    counters.adjust_total_notes(instance.user_id, -1)
+    if instance.is_archived:
+        return
+    counters.adjust_category(instance.category_id, -1)
+    counters.adjust_tags(getattr(instance, '_tag_ids_at_delete', []), -1)
+
+
+@receiver(m2m_changed, sender=Note.tags.through)
+def update_counts_on_tags_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep Tag.notes_count in step with note.tags / tag.notes changes"""
+    through = counters.NoteTag
+
+    if not reverse:
+        # instance is a Note, pk_set holds tag ids
+        if instance.is_archived:
+            return
+        if action == 'post_add':
+            counters.adjust_tags(pk_set, 1)
+        elif action == 'pre_remove':
+            linked = through.objects.filter(note_id=instance.pk, tag_id__in=pk_set)
+            counters.adjust_tags(linked.values_list('tag_id', flat=True), -1)
+        elif action == 'pre_clear':
+            counters.adjust_tags(counters.note_tag_ids(instance.pk), -1)
+        return
+
+    # instance is a Tag, pk_set holds note ids
+    if action == 'post_add':
+        delta = Note.objects.filter(pk__in=pk_set, is_archived=False).count()
+    elif action == 'pre_remove':
+        delta = -through.objects.filter(
+            tag_id=instance.pk, note_id__in=pk_set, note__is_archived=False
+        ).count()
+    elif action == 'pre_clear':
+        delta = -through.objects.filter(tag_id=instance.pk, note__is_archived=False).count()
+    else:
+        return
+    counters.adjust_tags([instance.pk], delta)
+
+
+@receiver(m2m_changed, sender=Note.tags.through)
+def remember_cleared_notes(sender, instance, action, reverse, **kwargs):
+    """
+    tag.notes.clear() sends no pk_set, so record the linked notes for the
+    post_clear handlers below while the links still exist
+    """
+    if reverse and action == 'pre_clear':
+        instance._cleared_note_ids = list(
+            counters.NoteTag.objects.filter(tag_id=instance.pk).values_list('note_id', flat=True)
+        )
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_notes(sender, instance, origin=None, **kwargs):
+    """
+    Record what the category's notes contribute while they still exist: one
+    query each for the notes, their active tag links and their blobs, however
+    many notes the category has.
+    """
+    if _origin_model(origin) is User:
+        # The account's counters, index rows and tombstones all go with it
+        return
+    instance._deleted_note_ids = list(Note.objects.filter(category=instance).values_list('pk', flat=True))
+    instance._deleted_tag_counts = dict(
+        counters.NoteTag.objects.filter(note__category=instance, note__is_archived=False)
+        .values('tag_id').annotate(n=Count('*')).values_list('tag_id', 'n')
+    )
+    instance._deleted_blob_ids = list(
+        Attachment.objects.filter(note__category=instance, blob__isnull=False)
+        .values_list('blob_id', flat=True).distinct()
+    )
+
+
+@receiver(post_delete, sender=Category)
+def update_counts_on_category_delete(sender, instance, **kwargs):
+    note_ids = getattr(instance, '_deleted_note_ids', None)
+    if not note_ids:
+        return
+    counters.adjust_total_notes(instance.user_id, -len(note_ids))
+    counters.apply_notes_count_deltas(Tag, {tag_id: -n for tag_id, n in instance._deleted_tag_counts.items()})
+    if instance._deleted_blob_ids:
+        counters.recount_blobs(Blob.objects.filter(pk__in=instance._deleted_blob_ids))
+
+
+@receiver(pre_save, sender=Attachment)
+def remember_attachment_blob(sender, instance, raw=False, **kwargs):
+    """Capture the stored blob before an update that may replace the content"""
+    if raw or instance._state.adding or instance.pk is None:
+        instance._previous_blob_id = None
+        return
+    instance._previous_blob_id = (
+        Attachment.objects.filter(pk=instance.pk).values_list('blob_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Attachment)
+def update_blob_refcount_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_previous_blob_id', None)
+    if previous != instance.blob_id:
+        counters.adjust_blob(previous, -1)
+        counters.adjust_blob(instance.blob_id, 1)
+
+
+@receiver(post_delete, sender=Attachment)
+def update_blob_refcount_on_delete(sender, instance, origin=None, **kwargs):
+    if _deleted_with_category(origin):
+        return
+    counters.adjust_blob(instance.blob_id, -1)
+
+
+# ---------------------------------------------------------------------------
+# Full-text search index maintenance
+# ---------------------------------------------------------------------------
+
+@receiver(post_save, sender=Note)
+def index_note_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created or instance.has_changed('title', 'content', 'summary', 'category_id'):
+        search.index_notes([instance.pk])
+
+
+@receiver(post_delete, sender=Note)
+def unindex_note_on_delete(sender, instance, origin=None, **kwargs):
+    if not _deleted_with_category(origin):
+        search.unindex_notes([instance.pk])
+
+
+@receiver(post_delete, sender=Category)
+def unindex_notes_on_category_delete(sender, instance, **kwargs):
+    search.unindex_notes(getattr(instance, '_deleted_note_ids', []))
+
+
+@receiver(m2m_changed, sender=Note.tags.through)
+def index_note_on_tags_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            search.index_notes([instance.pk])
+        return
+
+    if action in ('post_add', 'post_remove'):
+        search.index_notes(pk_set)
+    elif action == 'post_clear':
+        search.index_notes(getattr(instance, '_cleared_note_ids', []))
+
+
+@receiver(post_save, sender=Category)
+def index_notes_on_category_save(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        search.index_category_notes(instance.pk)
+
+
+@receiver(post_save, sender=Tag)
+def index_notes_on_tag_save(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        search.index_tag_notes(instance.pk)
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_tag_notes(sender, instance, **kwargs):
+    instance._note_ids_at_delete = list(instance.notes.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def index_notes_on_tag_delete(sender, instance, **kwargs):
+    search.index_notes(getattr(instance, '_note_ids_at_delete', []))
+
+
+# ---------------------------------------------------------------------------
+# Dashboard cache invalidation
+# ---------------------------------------------------------------------------
+
+@receiver([post_save, post_delete], sender=Note)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=LearningProgress)
+def invalidate_dashboard_cache(sender, instance, raw=False, **kwargs):
+    if not raw:
+        stats.invalidate_dashboard(instance.user_id)
+
+
+# ---------------------------------------------------------------------------
+# Delta sync: tombstones and note timestamps
+# ---------------------------------------------------------------------------
+
+@receiver(post_delete, sender=Note)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Tag)
+def record_tombstone(sender, instance, origin=None, **kwargs):
+    origin_model = _origin_model(origin)
+    if origin_model is User:
+        # The whole account is going away, tombstones included
+        return
+    if sender is Note and origin_model is Category:
+        # Recorded in one INSERT with the category's own
+        return
+    tombstones = [Tombstone(user_id=instance.user_id, model=sender._meta.model_name, object_id=instance.pk)]
+    tombstones += [
+        Tombstone(user_id=instance.user_id, model='note', object_id=note_id)
+        for note_id in getattr(instance, '_deleted_note_ids', [])
+    ]
+    Tombstone.objects.bulk_create(tombstones)
+
+
+@receiver(m2m_changed, sender=Note.tags.through)
+def touch_notes_on_tags_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """A note's tag list is part of its payload, so tag changes bump updated_at"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        note_ids = [instance.pk]
+    elif action == 'post_clear':
+        note_ids = getattr(instance, '_cleared_note_ids', [])
+    else:
+        note_ids = pk_set
+    if note_ids:
+        Note.objects.filter(pk__in=note_ids).update(updated_at=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=Attachment)
+def touch_note_on_attachment_change(sender, instance, raw=False, origin=None, **kwargs):
+    """Attachments are nested in the note payload too (and in its ETag)"""
+    if raw or _origin_model(origin) in (Note, Category):
+        # Nothing to touch: the note is being deleted as well
+        return
+    Note.objects.filter(pk=instance.note_id).update(updated_at=timezone.now())
+
+
+# ---------------------------------------------------------------------------
+# Cached authentication
+# ---------------------------------------------------------------------------
+
+@receiver([post_save, post_delete], sender=User)
+def forget_cached_user(sender, instance, raw=False, **kwargs):
+    """Password changes and deactivation must reach the next authenticated request"""
+    if raw:
+        return
+    authentication.forget_user(instance.pk)
+
+
+# ---------------------------------------------------------------------------
+# Rendered content
+# ---------------------------------------------------------------------------
+
+@receiver(post_save, sender=Note)
+def render_note_on_save(sender, instance, created, raw=False, **kwargs):
+    """Render new content once it is committed, so the next read finds it cached"""
+    if raw or 'content' in instance.get_deferred_fields():
+        return
+    if created or instance.has_changed('content'):
+        transaction.on_commit(partial(rendering.warm, instance.content))
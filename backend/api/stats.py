@@ -0,0 +1,122 @@
+"""
+Dashboard statistics.
+
+The payload is computed with a handful of aggregate queries and cached per
+user together with its ETag. Signal handlers in ``api.signals`` drop the
+cached copy whenever one of the user's notes, categories, tags or progress
+rows changes, so repeated dashboard loads, 304s included, are a single cache
+read. Async views use aget_dashboard_stats(), which runs the queries
+concurrently on a miss.
+"""
+import json
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .asyncdb import concurrently
+from .conditional import make_etag
+from .models import Category, Tag, Note, LearningProgress
+from .serializers import LearningProgressSerializer
+
+
+def dashboard_cache_key(user_id):
+    return f'dashboard:{user_id}'
+
+
+def invalidate_dashboard(user_id):
+    """Drop a user's cached dashboard once the current transaction commits"""
+    if user_id is None:
+        return
+    transaction.on_commit(lambda: cache.delete(dashboard_cache_key(user_id)))
+
+
+def dashboard_entry(user_id, stats):
+    """What is cached for a user: {'stats': ..., 'etag': ...}"""
+    etag = make_etag('dashboard', user_id, json.dumps(stats, sort_keys=True, cls=DjangoJSONEncoder))
+    return {'stats': stats, 'etag': etag}
+
+
+def get_dashboard_stats(user):
+    """The user's {'stats': ..., 'etag': ...}, from the cache when possible"""
+    key = dashboard_cache_key(user.pk)
+    entry = cache.get(key)
+    if entry is None:
+        entry = dashboard_entry(user.pk, compute_dashboard_stats(user))
+        cache.set(key, entry, settings.DASHBOARD_CACHE_TIMEOUT)
+    return entry
+
+
+async def aget_dashboard_stats(user):
+    """get_dashboard_stats() for async views, with the queries run concurrently"""
+    key = dashboard_cache_key(user.pk)
+    entry = await cache.aget(key)
+    if entry is None:
+        parts = await concurrently(
+            partial(count_notes, user),
+            partial(count_notes_by_category, user),
+            partial(LearningProgress.for_user, user),
+            Tag.objects.filter(user=user).count,
+        )
+        entry = dashboard_entry(user.pk, build_dashboard_stats(*parts))
+        await cache.aset(key, entry, settings.DASHBOARD_CACHE_TIMEOUT)
+    return entry
+
+
+def count_notes(user):
+    """Scalar note counts and the difficulty distribution in one pass"""
+    week_ago = timezone.now() - timedelta(days=7)
+    return Note.objects.filter(user=user).aggregate(
+        total_notes=Count('id'),
+        favorite_notes=Count('id', filter=Q(is_favorite=True)),
+        recent_notes=Count('id', filter=Q(created_at__gte=week_ago)),
+        **{
+            f'difficulty_{key}': Count('id', filter=Q(difficulty=key))
+            for key, _ in Note.DIFFICULTY_CHOICES
+        }
+    )
+
+
+def count_notes_by_category(user):
+    """Every category with its note count; also gives the category total"""
+    return list(
+        Category.objects.filter(user=user)
+        .annotate(count=Count('notes'))
+        .values('name', 'color', 'count')
+    )
+
+
+def compute_dashboard_stats(user):
+    return build_dashboard_stats(
+        count_notes(user),
+        count_notes_by_category(user),
+        LearningProgress.for_user(user),
+        Tag.objects.filter(user=user).count(),
+    )
+
+
+def build_dashboard_stats(note_counts, categories, progress, total_tags):
+    difficulties = [key for key, _ in Note.DIFFICULTY_CHOICES]
+    return {
+        'total_notes': note_counts['total_notes'],
+        'total_categories': len(categories),
+        'total_tags': total_tags,
+        'favorite_notes': note_counts['favorite_notes'],
+        'recent_notes': note_counts['recent_notes'],
+        'difficulty_distribution': [
+            {'difficulty': key, 'count': note_counts[f'difficulty_{key}']}
+            for key in difficulties
+            if note_counts[f'difficulty_{key}']
+        ],
+        'category_distribution': [
+            {'category__name': row['name'], 'category__color': row['color'], 'count': row['count']}
+            for row in categories
+            if row['count']
+        ],
+        'learning_progress': dict(LearningProgressSerializer(progress).data),
+    }
@@ -0,0 +1,123 @@
+"""
+Delta sync for clients that keep a local replica.
+
+``GET /api/sync/`` without a token returns a full snapshot; every response
+carries a ``next`` token to send back as ``?since=`` on the following call,
+which then returns only notes, categories and tags whose ``updated_at`` moved
+plus tombstones for rows deleted in the meantime. Notes are paged by
+``(updated_at, id)``; while ``has_more`` is true the client keeps following
+``next`` within the same cycle.
+
+Tokens are opaque base64 JSON::
+
+    {"since": <iso or null>, "cycle": <iso>, "after": [<iso>, <id>] or null}
+
+``since`` is the start of the previous cycle minus ``OVERLAP`` so that rows
+committed by transactions in flight at that moment are not missed; clients
+may therefore see a row twice and must upsert.
+"""
+import base64
+import binascii
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Category, Tag, Note, Tombstone
+from .serializers import CategorySerializer, TagSerializer, NoteSerializer
+
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 1000
+OVERLAP = timedelta(seconds=5)
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class ResyncRequired(Exception):
+    """The token predates the tombstone retention window"""
+
+
+def encode_token(since, cycle, after=None):
+    payload = {
+        'since': since.isoformat() if since else None,
+        'cycle': cycle.isoformat(),
+        'after': [after[0].isoformat(), after[1]] if after else None,
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_token(token):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+        since = parse_datetime(payload['since']) if payload['since'] else None
+        cycle = parse_datetime(payload['cycle'])
+        after = payload['after']
+        if after is not None:
+            after = (parse_datetime(after[0]), int(after[1]))
+    except (binascii.Error, ValueError, TypeError, KeyError, IndexError):
+        raise InvalidToken('Invalid sync token.')
+    if cycle is None or (payload['since'] and since is None) or (after and after[0] is None):
+        raise InvalidToken('Invalid sync token.')
+    return since, cycle, after
+
+
+def build_sync_response(user, token=None, limit=DEFAULT_LIMIT, context=None):
+    now = timezone.now()
+    since, cycle, after = decode_token(token) if token else (None, now, None)
+    if after is None:
+        # A new cycle: everything changed from here on is picked up next time
+        cycle = now
+
+    retention = timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+    if since is not None and since < now - retention:
+        raise ResyncRequired('Sync token is too old; start a full sync without a token.')
+
+    window_start = since - OVERLAP if since else None
+    first_page = after is None
+    payload = {}
+
+    if first_page:
+        categories = Category.objects.filter(user=user)
+        tags = Tag.objects.filter(user=user)
+        if window_start:
+            categories = categories.filter(updated_at__gte=window_start)
+            tags = tags.filter(updated_at__gte=window_start)
+        payload['categories'] = CategorySerializer(categories, many=True, context=context).data
+        payload['tags'] = TagSerializer(tags, many=True, context=context).data
+
+        deleted = {'notes': [], 'categories': [], 'tags': []}
+        if window_start:
+            tombstones = Tombstone.objects.filter(user=user, deleted_at__gte=window_start)
+            plural = {'note': 'notes', 'category': 'categories', 'tag': 'tags'}
+            for model, object_id in tombstones.values_list('model', 'object_id'):
+                deleted[plural[model]].append(object_id)
+        payload['deleted'] = deleted
+
+    notes = (
+        Note.objects.filter(user=user)
+        .select_related('category')
+        .prefetch_related('tags', 'attachments')
+        .order_by('updated_at', 'id')
+    )
+    if window_start:
+        notes = notes.filter(updated_at__gte=window_start)
+    if after:
+        notes = notes.filter(Q(updated_at__gt=after[0]) | Q(updated_at=after[0], id__gt=after[1]))
+    page = list(notes[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+    payload['notes'] = NoteSerializer(page, many=True, context=context).data
+
+    if has_more:
+        last = page[-1]
+        payload['next'] = encode_token(since, cycle, (last.updated_at, last.pk))
+    else:
+        payload['next'] = encode_token(cycle, cycle)
+    payload['has_more'] = has_more
+    return payload
@@ -1,3 +1,1560 @@
-from django.test import TestCase
+import base64
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from importlib.util import find_spec
+from io import BytesIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher, check_password, get_hasher, identify_hasher, make_password,
+)
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, connections
+from django.db.models import Count
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .activity import activity_summary, rebuild_rollups, record_review, week_start
+from .asyncdb import concurrently
+from .models import Category, Tag, Note, Attachment, Blob, LearningProgress, ReviewRollup, Tombstone, UploadSession
+from .renderers import FastJSONParser, FastJSONRenderer
+from .seeding import generate_dataset
+from .serializers import LearningProgressSerializer, UserSerializer
+from .transfer import NDJSONImporter, export_lines
+from . import (
+    async_views, blobs, bulk, counters, passwords, profiling, rendering, scheduling, search, stats, sync, throttling,
+    uploads,
+)
+
+
+class MediaRootMixin:
+    """Point MEDIA_ROOT at a scratch directory for the test"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class CounterTests(TestCase):
+    """notes_count and total_notes follow every kind of note and tag change"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='counter', password='x' * 12)
+        self.progress = LearningProgress.for_user(self.user)
+        self.python = Category.objects.create(name='Python', user=self.user)
+        self.rust = Category.objects.create(name='Rust', user=self.user)
+        self.orm, self.sql = (Tag.objects.create(name=name, user=self.user) for name in ('orm', 'sql'))
+        self.note = Note.objects.create(title='Counted', content='x', category=self.python, user=self.user)
+        self.note.tags.set([self.orm, self.sql])
+
+    def assertCounts(self, python, rust, orm, sql, total):
+        counts = (
+            Category.objects.get(pk=self.python.pk).notes_count,
+            Category.objects.get(pk=self.rust.pk).notes_count,
+            Tag.objects.get(pk=self.orm.pk).notes_count,
+            Tag.objects.get(pk=self.sql.pk).notes_count,
+            LearningProgress.objects.get(pk=self.progress.pk).total_notes,
+        )
+        self.assertEqual(counts, (python, rust, orm, sql, total))
+
+    def test_create_move_archive_and_delete(self):
+        self.assertCounts(1, 0, 1, 1, 1)
+        self.note.category = self.rust
+        self.note.save()
+        self.assertCounts(0, 1, 1, 1, 1)
+        self.note.is_archived = True
+        self.note.save()
+        self.assertCounts(0, 0, 0, 0, 1)
+        self.note.is_archived = False
+        self.note.save()
+        self.assertCounts(0, 1, 1, 1, 1)
+        self.note.delete()
+        self.assertCounts(0, 0, 0, 0, 0)
+
+    def test_tag_changes_from_either_side(self):
+        self.note.tags.remove(self.orm)
+        self.assertCounts(1, 0, 0, 1, 1)
+        self.orm.notes.add(self.note)
+        self.assertCounts(1, 0, 1, 1, 1)
+        self.sql.notes.clear()
+        self.assertCounts(1, 0, 1, 0, 1)
+        self.note.tags.clear()
+        self.assertCounts(1, 0, 0, 0, 1)
+
+    def test_reverse_clear_touches_the_notes_it_unlinked(self):
+        Note.objects.filter(pk=self.note.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        self.orm.notes.clear()
+        self.assertGreater(Note.objects.get(pk=self.note.pk).updated_at, timezone.now() - timedelta(minutes=1))
+
+    def test_stale_instances_do_not_clobber_counters(self):
+        stale = Category.objects.get(pk=self.rust.pk)
+        Note.objects.create(title='Second', content='x', category=self.rust, user=self.user)
+        stale.name = 'Rust (renamed)'
+        stale.save()
+        self.assertCounts(1, 1, 1, 1, 2)
+
+    def test_drifted_counters_do_not_fail_writes(self):
+        Category.objects.filter(pk=self.python.pk).update(notes_count=0)
+        Tag.objects.filter(pk=self.orm.pk).update(notes_count=0)
+        self.note.delete()
+        self.assertCounts(0, 0, 0, 0, 0)
+
+    def test_for_user_counts_notes_only_when_creating_the_row(self):
+        with self.assertNumQueries(1):
+            LearningProgress.for_user(self.user)
+        LearningProgress.objects.filter(pk=self.progress.pk).delete()
+        self.assertEqual(LearningProgress.for_user(self.user).total_notes, 1)
+
+    def test_category_delete_handles_its_notes_in_bulk(self):
+        blob = Blob.objects.create(sha256='0' * 64, file='blobs/00/00/shared', size=1)
+
+        def delete_category_with(count):
+            category = Category.objects.create(name=f'Bulk {count}', user=self.user)
+            for i in range(count):
+                note = Note.objects.create(
+                    title=f'Bulk {i}', content='x', category=category, user=self.user, is_archived=i % 5 == 0
+                )
+                note.tags.set([self.orm])
+                Attachment.objects.create(note=note, file=blob.file, blob=blob, original_name='a', file_size=1)
+            with CaptureQueriesContext(connection) as queries:
+                category.delete()
+            return len(queries)
+
+        self.assertEqual(delete_category_with(5), delete_category_with(50))
+        self.assertCounts(1, 0, 1, 1, 1)
+        self.assertEqual(Blob.objects.get(pk=blob.pk).refcount, 0)
+        self.assertEqual(Tombstone.objects.filter(user=self.user, model='note').count(), 55)
+        self.assertEqual(Tombstone.objects.filter(user=self.user, model='category').count(), 2)
+        if search.fts_enabled():
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT rowid FROM {search.FTS_TABLE}')
+                self.assertEqual([row[0] for row in cursor.fetchall()], [self.note.pk])
+
+
+class SearchTests(TestCase):
+    """Ranked FTS5 search, escaped highlights and the icontains fallback"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='searcher', password='x' * 12)
+        category = Category.objects.create(name='Python', user=self.user)
+        self.in_content = Note.objects.create(
+            title='Generators', content='Decorators wrap functions.', category=category, user=self.user,
+        )
+        self.in_title = Note.objects.create(
+            title='<b>Decorators</b> explained', content='How to write them.', category=category, user=self.user,
+        )
+        Note.objects.create(title='Unrelated', content='Nothing here.', category=category, user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, **params):
+        response = self.client.get('/api/notes/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_title_matches_rank_first_and_words_match_as_prefixes(self):
+        self.assertTrue(search.fts_enabled())
+        results = self.search(q='decor')
+        self.assertEqual([note['id'] for note in results], [self.in_title.pk, self.in_content.pk])
+        self.assertLess(results[0]['search_rank'], results[1]['search_rank'])
+        self.assertEqual(self.search(q='decorators nothing'), [])
+
+    def test_highlights_escape_note_content(self):
+        result = self.search(q='decorators', highlight='1')[0]
+        self.assertEqual(result['title_highlight'], '&lt;b&gt;<mark>Decorators</mark>&lt;/b&gt; explained')
+        self.assertIn('<mark>Decorators</mark>', result['snippet'])
+        self.assertNotIn('<b>', result['snippet'])
+
+    def test_falls_back_to_icontains_without_fts5(self):
+        with mock.patch.object(search, 'fts_enabled', return_value=False):
+            results = self.search(q='wrap functions')
+        self.assertEqual([note['id'] for note in results], [self.in_content.pk])
+
+
+class PaginationTests(TestCase):
+    """Cursor and page-number pages visit every note exactly once, ties included"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='pager', password='x' * 12)
+        category = Category.objects.create(name='Paging', user=self.user)
+        Note.objects.bulk_create([
+            Note(title=f'Note {i}', content='x', category=category, user=self.user) for i in range(45)
+        ])
+        # One timestamp for all, as after a bulk operation; a few never reviewed
+        notes = Note.objects.filter(user=self.user)
+        notes.update(updated_at=timezone.now(), last_reviewed=timezone.now())
+        notes.filter(pk__in=list(notes.values_list('pk', flat=True)[:10])).update(last_reviewed=None)
+        self.ids = set(notes.values_list('pk', flat=True))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url, params):
+        seen = []
+        while url:
+            body = self.client.get(url, params).json()
+            seen.extend(note['id'] for note in body['results'])
+            url, params = body['next'], None
+        return seen
+
+    def test_cursor_pages_with_tied_values(self):
+        for ordering in ('-updated_at', 'updated_at', 'last_reviewed', '-last_reviewed'):
+            with self.subTest(ordering=ordering):
+                seen = self.walk('/api/notes/', {'cursor': '', 'ordering': ordering})
+                self.assertEqual(len(seen), len(self.ids))
+                self.assertEqual(set(seen), self.ids)
+
+    def test_page_numbers_with_tied_values(self):
+        seen = self.walk('/api/notes/', {})
+        self.assertEqual(len(seen), len(self.ids))
+        self.assertEqual(set(seen), self.ids)
+
+    def test_multi_column_orderings_keep_offset_paging(self):
+        response = self.client.get('/api/notes/', {'cursor': '', 'ordering': '-updated_at,title'})
+        self.assertEqual(response.json()['count'], len(self.ids))
+        self.assertIn('page=2', response.json()['next'])
+
+
+class BulkOperationTests(TestCase):
+    """/api/notes/bulk/: all-or-nothing per-item results, counters by delta, O(1) queries"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='bulker', password='x' * 12)
+        self.python = Category.objects.create(name='Python', user=self.user)
+        self.rust = Category.objects.create(name='Rust', user=self.user)
+        self.tags = [Tag.objects.create(name=f'tag{i}', user=self.user) for i in range(3)]
+        self.notes = []
+        for i in range(12):
+            note = Note.objects.create(title=f'Note {i}', content='x', category=self.python, user=self.user)
+            note.tags.set(self.tags[:2])
+            self.notes.append(note)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def bulk(self, operations):
+        return self.client.post('/api/notes/bulk/', {'operations': operations}, format='json')
+
+    def mixed_operations(self, notes):
+        """One of each operation per group of six notes"""
+        operations = []
+        for a, b, c, d, e, f in zip(*[iter(notes)] * 6):
+            operations += [
+                {'op': 'create', 'data': {'title': 'New', 'content': 'x', 'category': self.rust.pk,
+                                          'tag_ids': [self.tags[2].pk]}},
+                {'op': 'update', 'id': a.pk, 'data': {'category': self.rust.pk, 'title': 'Moved'}},
+                {'op': 'archive', 'id': b.pk, 'value': True},
+                {'op': 'favorite', 'id': c.pk, 'value': True},
+                {'op': 'tags', 'id': d.pk, 'tag_ids': [self.tags[2].pk], 'mode': 'set'},
+                {'op': 'delete', 'id': e.pk},
+                {'op': 'tags', 'id': f.pk, 'tag_ids': [self.tags[0].pk], 'mode': 'remove'},
+            ]
+        return operations
+
+    def test_invalid_items_are_reported_and_nothing_is_applied(self):
+        other = User.objects.create_user(username='someone', password='x' * 12)
+        foreign = Category.objects.create(name='Theirs', user=other)
+        response = self.bulk([
+            {'op': 'favorite', 'id': self.notes[0].pk},
+            {'op': 'update', 'id': 999999, 'data': {'title': 'x'}},
+            {'op': 'create', 'data': {'title': 'x', 'content': 'x', 'category': foreign.pk}},
+            {'op': 'tags', 'id': self.notes[1].pk},
+        ])
+        self.assertEqual(response.status_code, 400)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['ok', 'error', 'error', 'error'])
+        self.assertIn('id', results[1]['errors'])
+        self.assertIn('category', results[2]['errors'])
+        self.assertIn('tag_ids', results[3]['errors'])
+        self.assertFalse(Note.objects.filter(is_favorite=True).exists())
+
+    def test_mixed_batch_keeps_counters_exact(self):
+        response = self.bulk(self.mixed_operations(self.notes))
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertTrue(all(result['status'] == 'ok' for result in results))
+        self.assertTrue(Note.objects.filter(pk=results[0]['id'], title='New').exists())
+        self.assertEqual(Note.objects.filter(user=self.user).count(), 12)
+
+        # Nothing for a full recount to repair
+        self.assertEqual(counters.recount_categories(), 0)
+        self.assertEqual(counters.recount_tags(), 0)
+        self.assertEqual(counters.recount_progress(), 0)
+        self.assertEqual(Category.objects.get(pk=self.rust.pk).notes_count, 4)
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        counts = []
+        for notes in (self.notes[:6], self.notes[6:]):
+            more = [] if not counts else self.mixed_operations(
+                [Note.objects.create(title='Extra', content='x', category=self.python, user=self.user)
+                 for _ in range(6)]
+            )
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.bulk(self.mixed_operations(notes) + more).status_code, 200)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_every_note_relation_is_handled_by_delete(self):
+        relations = {rel.name for rel in Note._meta.related_objects}
+        relations |= {field.name for field in Note._meta.many_to_many}
+        self.assertEqual(relations, bulk.NOTE_DEPENDENTS)
+
+
+class DashboardStatsTests(TestCase):
+    """The aggregated dashboard matches the old per-query counts and is never served stale"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='stats', password='x' * 12)
+        python = Category.objects.create(name='Python', color='#3776ab', user=self.user)
+        rust = Category.objects.create(name='Rust', color='#dea584', user=self.user)
+        Category.objects.create(name='Empty', user=self.user)
+        Tag.objects.create(name='orm', user=self.user)
+        self.notes = [
+            Note.objects.create(
+                title=f'Note {i}', content='x', user=self.user, category=python if i % 3 else rust,
+                difficulty=['beginner', 'intermediate', 'advanced'][i % 3], is_favorite=i % 4 == 0,
+            )
+            for i in range(8)
+        ]
+        old = timezone.now() - timedelta(days=10)
+        Note.objects.filter(pk__in=[n.pk for n in self.notes[:3]]).update(created_at=old)
+        other = User.objects.create_user(username='other', password='x' * 12)
+        Note.objects.create(
+            title='Not mine', content='x', user=other, category=Category.objects.create(name='Other', user=other)
+        )
+
+    def per_query_stats(self):
+        """The payload as dashboard_stats computed it with one query per figure"""
+        notes = Note.objects.filter(user=self.user)
+        return {
+            'total_notes': notes.count(),
+            'total_categories': Category.objects.filter(user=self.user).count(),
+            'total_tags': Tag.objects.filter(user=self.user).count(),
+            'favorite_notes': notes.filter(is_favorite=True).count(),
+            'recent_notes': notes.filter(created_at__gte=timezone.now() - timedelta(days=7)).count(),
+            'difficulty_distribution': list(notes.values('difficulty').annotate(count=Count('id'))),
+            'category_distribution': list(
+                notes.values('category__name', 'category__color').annotate(count=Count('id'))
+            ),
+            'learning_progress': dict(
+                LearningProgressSerializer(LearningProgress.objects.get_or_create(user=self.user)[0]).data
+            ),
+        }
+
+    def assertMatchesPerQueryStats(self, payload):
+        expected = self.per_query_stats()
+        for key in ('difficulty_distribution', 'category_distribution'):
+            self.assertCountEqual(payload.pop(key), expected.pop(key), key)
+        self.assertEqual(payload, expected)
+
+    def cached(self):
+        return cache.get(stats.dashboard_cache_key(self.user.pk))
+
+    def test_payload_matches_per_query_counts(self):
+        record_review(self.notes[0], 4)
+        self.assertMatchesPerQueryStats(stats.get_dashboard_stats(self.user)['stats'])
+        cache.clear()
+        self.assertMatchesPerQueryStats(async_to_sync(stats.aget_dashboard_stats)(self.user)['stats'])
+
+    def test_writes_invalidate_the_cached_dashboard_on_commit(self):
+        note = self.notes[1]
+
+        def update():
+            note.is_favorite = not note.is_favorite
+            note.save()
+
+        writes = {
+            'create': lambda: Note.objects.create(
+                title='New', content='x', user=self.user, category=note.category, difficulty='advanced'
+            ),
+            'update': update,
+            'review': lambda: record_review(note, 4),
+            'delete': note.delete,
+        }
+        for name, write in writes.items():
+            with self.subTest(write=name):
+                stats.get_dashboard_stats(self.user)
+                with self.captureOnCommitCallbacks(execute=True):
+                    write()
+                    # Readers outside the transaction keep the committed copy until then
+                    self.assertIsNotNone(self.cached())
+                self.assertIsNone(self.cached())
+                self.assertMatchesPerQueryStats(stats.get_dashboard_stats(self.user)['stats'])
+
+
+class TransferTests(MediaRootMixin, TestCase):
+    """NDJSON import: per-line validation and errors, blob linking limited to content the user has"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='importer', password='x' * 12)
+
+    def stream(self, *records):
+        return [json.dumps(record).encode() + b'\n' for record in records]
+
+    def note(self, id, **fields):
+        return {'type': 'note', 'id': id, 'category': 1, 'title': f'Note {id}', 'content': 'x', **fields}
+
+    def attachment(self, id, note, **fields):
+        return {'type': 'attachment', 'id': id, 'note': note, 'original_name': 'a.txt', 'file_size': 5, **fields}
+
+    def stored_attachment(self, user, data):
+        category = Category.objects.create(name='Files', user=user)
+        note = Note.objects.create(title='Files', content='x', category=category, user=user)
+        blob = blobs.store_blob(ContentFile(data, name='a.txt'))
+        return Attachment.objects.create(
+            note=note, blob=blob, file=blob.file.name, original_name='a.txt', file_size=len(data),
+        )
+
+    def test_invalid_notes_are_reported_on_their_line(self):
+        report = NDJSONImporter(self.user).feed(self.stream(
+            {'type': 'meta', 'version': 1},
+            {'type': 'category', 'id': 1, 'name': 'Python'},
+            self.note(1),
+            self.note(2, ease='x'),
+            self.note(3, interval_days=-1),
+            self.note(4, category=99),
+            self.note(5, difficulty='expert'),
+            self.note(6),
+        ))
+        self.assertEqual(report['imported']['note'], 2)
+        self.assertEqual([error['line'] for error in report['errors']], [4, 5, 6, 7])
+        self.assertEqual(
+            sorted(Note.objects.filter(user=self.user).values_list('title', flat=True)), ['Note 1', 'Note 6']
+        )
+        self.assertEqual(Category.objects.get(user=self.user).notes_count, 2)
+
+    def test_database_errors_fail_only_their_row(self):
+        # Rows that get past validation but are refused by the database
+        with mock.patch.object(Note, 'clean_fields'):
+            report = NDJSONImporter(self.user, batch_size=2).feed(self.stream(
+                {'type': 'category', 'id': 1, 'name': 'Python'},
+                self.note(1),
+                self.note(2, interval_days=-1),
+                self.note(3),
+                self.note(4, repetitions=-1),
+                self.note(5),
+            ))
+        self.assertEqual(report['imported']['note'], 3)
+        self.assertEqual([error['line'] for error in report['errors']], [3, 5])
+        self.assertEqual(Note.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(search.search_notes(Note.objects.filter(user=self.user), 'Note').count(), 3)
+
+    def test_invalid_ids_and_names_are_line_errors(self):
+        def lines():
+            yield from self.stream(
+                {'type': 'category', 'id': 1, 'name': 'Python'},
+                {'type': 'category', 'id': 2, 'name': None},
+                {'type': 'tag', 'id': 1, 'name': ['x']},
+                {'type': 'tag', 'id': [1], 'name': 'orm'},
+                self.note([1]),
+                self.note(2),
+            )
+            # Created concurrently, after the importer read the existing names
+            Category.objects.create(name='Rust', user=self.user)
+            yield from self.stream({'type': 'category', 'id': 3, 'name': 'Rust'})
+
+        report = NDJSONImporter(self.user).feed(lines())
+        self.assertEqual([error['line'] for error in report['errors']], [2, 3, 4, 5, 7])
+        self.assertEqual(report['imported'], {'category': 1, 'tag': 0, 'note': 1, 'attachment': 0})
+        self.assertEqual(Note.objects.get(user=self.user).title, 'Note 2')
+
+    def test_attachments_link_only_content_the_user_has(self):
+        own = self.stored_attachment(self.user, b'mine!')
+        foreign = self.stored_attachment(User.objects.create_user(username='other', password='x' * 12), b'yours')
+        report = NDJSONImporter(self.user).feed(self.stream(
+            {'type': 'category', 'id': 1, 'name': 'Python'},
+            self.note(1),
+            self.attachment(1, 1, sha256=own.blob_id, file='../../etc/passwd'),
+            self.attachment(2, 1, sha256=foreign.blob_id, file=foreign.file.name),
+            self.attachment(3, 1, file='blobs/anything'),
+            self.attachment(4, 1, sha256=foreign.blob_id, content=base64.b64encode(b'other').decode()),
+        ))
+        self.assertEqual(report['imported']['attachment'], 1)
+        self.assertEqual(sorted(error['line'] for error in report['errors']), [4, 5, 6])
+
+        imported = Attachment.objects.get(note__user=self.user, note__title='Note 1')
+        self.assertEqual((imported.blob_id, imported.file.name), (own.blob_id, own.blob.file.name))
+        self.assertEqual(Blob.objects.get(pk=own.blob_id).refcount, 2)
+        self.assertEqual(Blob.objects.get(pk=foreign.blob_id).refcount, 1)
+
+    def test_round_trip_with_files(self):
+        source = self.stored_attachment(User.objects.create_user(username='source', password='x' * 12), b'hello')
+        lines = list(export_lines(source.note.user, include_files=True))
+        self.stored_attachment(User.objects.create_user(username='bystander', password='x' * 12), b'other')
+
+        report = NDJSONImporter(self.user).feed(lines)
+        self.assertEqual(report['errors'], [])
+        imported = Attachment.objects.get(note__user=self.user)
+        self.assertEqual(imported.blob_id, source.blob_id)
+        self.assertEqual(imported.file.read(), b'hello')
+        self.assertEqual(Blob.objects.get(pk=source.blob_id).refcount, 2)
+
+
+class ConditionalRequestTests(TestCase):
+    """Dashboard and progress validators: cheap 304s that still change with the data"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='conditional', password='x' * 12)
+        self.category = Category.objects.create(name='Python', user=self.user)
+        Note.objects.create(title='First', content='x', category=self.category, user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_warm_dashboard_needs_no_queries(self):
+        etag = self.client.get('/api/dashboard/')['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/dashboard/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            response = self.client.get('/api/dashboard/')
+        self.assertEqual((response.status_code, response['ETag']), (200, etag))
+
+    def test_dashboard_etag_follows_notes_and_progress(self):
+        etags = [self.client.get('/api/dashboard/')['ETag']]
+        with self.captureOnCommitCallbacks(execute=True):
+            note = Note.objects.create(title='Second', content='x', category=self.category, user=self.user)
+        etags.append(self.client.get('/api/dashboard/')['ETag'])
+        with self.captureOnCommitCallbacks(execute=True):
+            record_review(note, 4)
+        etags.append(self.client.get('/api/dashboard/')['ETag'])
+        self.assertEqual(len(set(etags)), 3)
+        self.assertEqual(self.client.get('/api/dashboard/', HTTP_IF_NONE_MATCH=etags[-1]).status_code, 304)
+
+    def test_progress_last_modified_moves_with_total_notes(self):
+        progress = LearningProgress.for_user(self.user)
+        LearningProgress.objects.filter(pk=progress.pk).update(updated_at=timezone.now() - timedelta(days=1))
+        last_modified = self.client.get('/api/progress/')['Last-Modified']
+        Note.objects.create(title='Second', content='x', category=self.category, user=self.user)
+        response = self.client.get('/api/progress/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_notes'], 2)
+
+
+class SyncTests(TestCase):
+    """/api/sync/: deltas since a token, the overlap window, tombstones and paging"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='syncer', password='x' * 12)
+        self.category = Category.objects.create(name='Python', user=self.user)
+        self.notes = [
+            Note.objects.create(title=f'Note {i}', content='x', category=self.category, user=self.user)
+            for i in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sync(self, token=None, **params):
+        if token:
+            params['since'] = token
+        response = self.client.get('/api/sync/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def age(self, queryset, seconds):
+        queryset.update(updated_at=timezone.now() - timedelta(seconds=seconds))
+
+    def test_changes_since_token(self):
+        first = self.sync()
+        self.assertEqual(len(first['notes']), 3)
+        self.assertEqual(len(first['categories']), 1)
+        # Everything from the snapshot is well outside the overlap window
+        self.age(Note.objects.all(), 60)
+        self.age(Category.objects.all(), 60)
+
+        created = Note.objects.create(title='New', content='x', category=self.category, user=self.user)
+        self.notes[0].title = 'Edited'
+        self.notes[0].save()
+        deleted_id = self.notes[1].pk
+        self.notes[1].delete()
+
+        delta = self.sync(first['next'])
+        self.assertEqual({note['id'] for note in delta['notes']}, {created.pk, self.notes[0].pk})
+        self.assertEqual(delta['deleted']['notes'], [deleted_id])
+        # The category's notes_count changed with the create and delete
+        self.assertEqual([category['id'] for category in delta['categories']], [self.category.pk])
+        self.assertEqual(delta['tags'], [])
+
+    def test_overlap_window_rereads_rows_committed_around_the_cycle_start(self):
+        first = self.sync()
+        since, _, _ = sync.decode_token(first['next'])
+        Note.objects.filter(pk=self.notes[0].pk).update(updated_at=since - sync.OVERLAP + timedelta(seconds=1))
+        Note.objects.filter(pk=self.notes[1].pk).update(updated_at=since - sync.OVERLAP - timedelta(seconds=1))
+        self.age(Note.objects.filter(pk=self.notes[2].pk), 60)
+        self.age(Category.objects.all(), 60)
+
+        delta = self.sync(first['next'])
+        self.assertEqual([note['id'] for note in delta['notes']], [self.notes[0].pk])
+
+    def test_pages_through_equal_timestamps(self):
+        Note.objects.update(updated_at=timezone.now())
+        seen, token = [], None
+        while True:
+            page = self.sync(token, limit=2)
+            seen += [note['id'] for note in page['notes']]
+            token = page['next']
+            if not page['has_more']:
+                break
+        self.assertEqual(sorted(seen), sorted(note.pk for note in self.notes))
+
+    def test_deleting_user_records_no_tombstones(self):
+        self.notes[0].delete()
+        self.assertEqual(Tombstone.objects.filter(user=self.user).count(), 1)
+        other = User.objects.create_user(username='leaving', password='x' * 12)
+        category = Category.objects.create(name='Rust', user=other)
+        Note.objects.create(title='Theirs', content='x', category=category, user=other)
+
+        other.delete()
+        self.user.delete()
+        self.assertFalse(Tombstone.objects.exists())
+
+    def test_deleting_users_in_bulk_records_no_tombstones(self):
+        User.objects.filter(pk=self.user.pk).delete()
+        self.assertFalse(Tombstone.objects.exists())
+
+
+class SchedulingTests(TestCase):
+    """SM-2 transitions for every grade, clamped ease and due dates"""
+
+    # (repetitions, interval_days, ease, grade) -> (repetitions, interval_days, ease)
+    TRANSITIONS = [
+        ((0, 0, 2.5, 4), (1, 1, 2.5)),
+        ((1, 1, 2.5, 4), (2, 6, 2.5)),
+        ((2, 6, 2.5, 4), (3, 15, 2.5)),
+        ((3, 15, 2.5, 5), (4, 39, 2.6)),
+        ((2, 6, 2.5, 3), (3, 14, 2.36)),
+        ((5, 30, 2.5, 2), (0, 1, 2.18)),
+        ((5, 30, 2.5, 1), (0, 1, 1.96)),
+        ((5, 30, 2.5, 0), (0, 1, 1.7)),
+        ((3, 10, 1.3, 1), (0, 1, 1.3)),
+        ((0, 0, 1.4, 3), (1, 1, 1.3)),
+        ((2, 1, 1.3, 3), (3, 1, 1.3)),
+    ]
+
+    def test_next_review(self):
+        for state, expected in self.TRANSITIONS:
+            with self.subTest(state=state):
+                self.assertEqual(scheduling.next_review(*state), expected)
+
+    def test_grade_names(self):
+        for value, grade in [('again', 1), ('hard', 3), ('good', 4), ('easy', 5), ('2', 2), (0, 0)]:
+            with self.subTest(value=value):
+                self.assertEqual(scheduling.parse_grade(value), grade)
+        with self.assertRaises(ValueError):
+            scheduling.parse_grade('sometimes')
+
+    def test_schedule_sets_due_date(self):
+        now = timezone.now()
+        note = Note(repetitions=1, interval_days=1, ease=2.5)
+        scheduling.schedule(note, scheduling.GRADE_NAMES['good'], now=now)
+        self.assertEqual((note.repetitions, note.interval_days), (2, 6))
+        self.assertEqual(note.last_reviewed, now)
+        self.assertEqual(note.due_at, now + timedelta(days=6))
+
+
+class ActivityTests(TestCase):
+    """Review rollups and the streaks and heatmap read from them"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='reviewer', password='x' * 12)
+        category = Category.objects.create(name='Python', user=self.user)
+        self.note = Note.objects.create(title='Note', content='x', category=category, user=self.user)
+        self.today = timezone.localdate()
+
+    def review(self, days_ago, grade=4):
+        day = self.today - timedelta(days=days_ago)
+        reviewed_at = timezone.make_aware(datetime.combine(day, datetime.min.time()) + timedelta(hours=12))
+        record_review(self.note, grade, reviewed_at=reviewed_at)
+
+    def rollups(self):
+        rows = ReviewRollup.objects.filter(user=self.user).values_list('period', 'start', 'reviews', 'grade_total')
+        return sorted(rows)
+
+    def test_rollups_and_streaks(self):
+        # (days ago, grade): a four-day run ending 5 days ago, then three days up to today
+        reviews = [(8, 4), (7, 4), (6, 4), (5, 4), (2, 4), (2, 2), (1, 4), (0, 5)]
+        for days_ago, grade in reviews:
+            self.review(days_ago, grade)
+
+        summary = activity_summary(self.user, days=30)
+        self.assertEqual(summary['total_reviews'], 8)
+        self.assertEqual(summary['active_days'], 7)
+        self.assertEqual(summary['longest_streak'], 4)
+        self.assertEqual(summary['current_streak'], 3)
+        by_day = {row['date']: row['reviews'] for row in summary['days']}
+        self.assertEqual(by_day[self.today - timedelta(days=2)], 2)
+
+        for week in summary['weeks']:
+            grades = [
+                grade for days_ago, grade in reviews
+                if week_start(self.today - timedelta(days=days_ago)) == week['start']
+            ]
+            self.assertEqual(week['reviews'], len(grades))
+            self.assertEqual(week['average_grade'], round(sum(grades) / len(grades), 2))
+        self.assertEqual(sum(week['reviews'] for week in summary['weeks']), 8)
+
+    def test_streak_ends_after_a_day_without_reviews(self):
+        self.review(1)
+        self.assertEqual(activity_summary(self.user)['current_streak'], 1)
+        ReviewRollup.objects.all().delete()
+        for days_ago in (3, 2):
+            self.review(days_ago)
+        summary = activity_summary(self.user)
+        self.assertEqual((summary['current_streak'], summary['longest_streak']), (0, 2))
+
+    def test_days_outside_the_window_are_left_out(self):
+        self.review(0)
+        self.review(10)
+        summary = activity_summary(self.user, days=7)
+        self.assertEqual([row['date'] for row in summary['days']], [self.today])
+        self.assertEqual(summary['total_reviews'], 1)
+
+    def test_rebuild_matches_incremental_rollups(self):
+        for days_ago, grade in [(0, 5), (0, 3), (1, 4), (9, 1), (40, 4)]:
+            self.review(days_ago, grade)
+        incremental = self.rollups()
+        self.assertEqual(rebuild_rollups(), len(incremental))
+        self.assertEqual(self.rollups(), incremental)
+
+
+class BlobTests(MediaRootMixin, TestCase):
+    """Content-addressed attachments: dedup, refcounts and garbage collection"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='uploader', password='x' * 12)
+        category = Category.objects.create(name='Files', user=self.user)
+        self.note = Note.objects.create(title='Files', content='x', category=category, user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, data, name='notes.txt'):
+        response = self.client.post('/api/attachments/', {
+            'note_id': self.note.pk, 'file': SimpleUploadedFile(name, data),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return Attachment.objects.get(pk=response.json()['id'])
+
+    def refcount(self, blob_id):
+        return Blob.objects.get(pk=blob_id).refcount
+
+    def test_identical_content_is_stored_once(self):
+        first = self.upload(b'same bytes', 'a.txt')
+        second = self.upload(b'same bytes', 'b.pdf')
+        other = self.upload(b'other bytes')
+
+        self.assertEqual(first.blob_id, hashlib.sha256(b'same bytes').hexdigest())
+        self.assertEqual(second.blob_id, first.blob_id)
+        self.assertEqual((second.file.name, second.original_name), (first.file.name, 'b.pdf'))
+        self.assertNotEqual(other.blob_id, first.blob_id)
+        self.assertEqual(Blob.objects.count(), 2)
+        self.assertEqual(self.refcount(first.blob_id), 2)
+        _, files = default_storage.listdir(os.path.dirname(first.file.name))
+        self.assertEqual(files, [os.path.basename(first.file.name)])
+
+    def test_refcount_follows_deletes_and_replaced_content(self):
+        first = self.upload(b'shared')
+        second = self.upload(b'shared')
+        self.assertEqual(self.client.delete(f'/api/attachments/{first.pk}/').status_code, 204)
+        self.assertEqual(self.refcount(second.blob_id), 1)
+
+        response = self.client.patch(
+            f'/api/attachments/{second.pk}/', {'file': SimpleUploadedFile('new.txt', b'replaced')}, format='multipart'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.refcount(second.blob_id), 0)
+        replaced = Attachment.objects.get(pk=second.pk)
+        self.assertEqual(self.refcount(replaced.blob_id), 1)
+
+        self.note.delete()
+        self.assertEqual(self.refcount(replaced.blob_id), 0)
+
+    def test_import_counts_references(self):
+        attachment = self.upload(b'exported')
+        lines = list(export_lines(self.user, include_files=True))
+        NDJSONImporter(self.user).feed(lines)
+        self.assertEqual(self.refcount(attachment.blob_id), 2)
+
+        Note.objects.filter(user=self.user).exclude(pk=self.note.pk).delete()
+        self.assertEqual(self.refcount(attachment.blob_id), 1)
+        self.assertEqual(counters.recount_blobs(), 0)
+
+    def test_garbage_collection_removes_only_unreferenced_blobs(self):
+        kept = self.upload(b'in use')
+        orphan = self.upload(b'orphan')
+        recent = self.upload(b'recent')
+        drifted = self.upload(b'drifted')
+        Attachment.objects.filter(pk__in=[orphan.pk, recent.pk]).delete()
+        old = timezone.now() - blobs.GC_GRACE_PERIOD - timedelta(minutes=1)
+        Blob.objects.exclude(pk=recent.blob_id).update(last_used_at=old)
+        # A counter that drifted to zero must not get content in use deleted
+        Blob.objects.filter(pk=drifted.blob_id).update(refcount=0)
+        stray = default_storage.save(f'{blobs.BLOB_DIR}/00/00/stray', ContentFile(b'stray'))
+        os.utime(default_storage.path(stray), (old.timestamp(), old.timestamp()))
+
+        dry_run = blobs.collect_garbage(dry_run=True)
+        self.assertEqual((dry_run['blobs'], dry_run['files']), (1, 1))
+        self.assertTrue(default_storage.exists(orphan.file.name))
+
+        report = blobs.collect_garbage()
+        self.assertEqual(report, {'repaired': 1, 'blobs': 1, 'files': 1, 'bytes': len(b'orphan') + len(b'stray')})
+        self.assertEqual(
+            set(Blob.objects.values_list('pk', flat=True)), {kept.blob_id, recent.blob_id, drifted.blob_id}
+        )
+        self.assertFalse(default_storage.exists(orphan.file.name))
+        self.assertFalse(default_storage.exists(stray))
+        for attachment in (kept, recent, drifted):
+            self.assertTrue(default_storage.exists(attachment.file.name))
+
+
+class QueryPlanTests(TestCase):
+    """Every read endpoint must reach user rows through an index, never a full scan"""
+
+    # "SCAN api_note" is a full table scan; "SCAN api_note USING INDEX ..." is not
+    FULL_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='planner', password='x' * 12)
+        other = User.objects.create_user(username='other', password='x' * 12)
+        for owner in (cls.user, other):
+            category = Category.objects.create(name='Python', user=owner)
+            tag = Tag.objects.create(name='orm', user=owner)
+            for i in range(5):
+                note = Note.objects.create(
+                    title=f'Note {i}', content='query planning', category=category,
+                    user=owner, is_favorite=bool(i % 2),
+                )
+                note.tags.add(tag)
+                Attachment.objects.create(
+                    note=note, file='attachments/x.txt', original_name='x.txt', file_size=1,
+                )
+        cls.note = Note.objects.filter(user=cls.user).first()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertNoFullScans(self, url, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200, url)
+
+        selects = [q['sql'] for q in ctx.captured_queries if q['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertTrue(selects, url)
+        with connection.cursor() as cursor:
+            for sql in selects:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    self.assertIsNone(
+                        self.FULL_SCAN.match(detail),
+                        f'{url}: full scan ({detail}) in\n{sql}',
+                    )
+
+    def test_note_list(self):
+        self.assertNoFullScans('/api/notes/')
+        self.assertNoFullScans('/api/notes/', {'is_archived': 'false'})
+        self.assertNoFullScans('/api/notes/', {'cursor': ''})
+
+    def test_note_detail(self):
+        self.assertNoFullScans(f'/api/notes/{self.note.pk}/')
+
+    def test_favorites(self):
+        self.assertNoFullScans('/api/notes/favorites/')
+
+    def test_recent(self):
+        self.assertNoFullScans('/api/notes/recent/')
+
+    def test_due_queue(self):
+        self.assertNoFullScans('/api/notes/due/')
+
+    def test_search(self):
+        self.assertNoFullScans('/api/notes/search/', {'q': 'query'})
+
+    def test_categories_and_tags(self):
+        self.assertNoFullScans('/api/categories/')
+        self.assertNoFullScans('/api/tags/')
+
+    def test_attachments(self):
+        self.assertNoFullScans('/api/attachments/')
+
+    def test_dashboard(self):
+        self.assertNoFullScans('/api/dashboard/')
+
+    def test_activity(self):
+        self.assertNoFullScans('/api/activity/')
+
+    def test_progress(self):
+        self.assertNoFullScans('/api/progress/')
+
+
+class QueryCountTests(TestCase):
+    """
+    Every endpoint runs the same number of queries for 5 rows as for 50,
+    i.e. O(1) in result size, and no more than its entry in query_budgets.json.
+    """
+
+    SIZES = (5, 50)
+    BUDGETS = json.loads((Path(__file__).parent / 'query_budgets.json').read_text())
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.datasets = {}
+        now = timezone.now()
+        for size in cls.SIZES:
+            prefix = f'queries{size}'
+            # size categories, tags and notes; every note has every tag and an attachment
+            generate_dataset(
+                users=1, categories=size, tags=size, notes=size, content_size=200,
+                tag_fanout=size, attachments=1.0, prefix=prefix,
+            )
+            user = User.objects.get(username=f'{prefix}-0')
+            notes = Note.objects.filter(user=user)
+            # Make sure every list endpoint returns rows (empty pages skip prefetches)
+            notes.update(is_favorite=True, is_archived=False, due_at=now - timedelta(days=1), summary='query counting')
+            search.index_notes(list(notes.values_list('pk', flat=True)))
+            for days, note in enumerate(notes.order_by('pk')):
+                record_review(note, 4, now - timedelta(days=days))
+            cls.datasets[size] = {
+                'user': user,
+                'note': notes.order_by('pk').first().pk,
+                'category': Category.objects.filter(user=user).first().pk,
+                'tag': Tag.objects.filter(user=user).first().pk,
+                'attachment': Attachment.objects.filter(note__user=user).first().pk,
+                'tag_ids': list(Tag.objects.filter(user=user).values_list('pk', flat=True)),
+            }
+
+    def endpoints(self, d):
+        """name: (method, url, data) for dataset d"""
+        note = f"/api/notes/{d['note']}/"
+        return {
+            'notes-list': ('get', '/api/notes/', None),
+            'notes-list-keyset': ('get', '/api/notes/', {'cursor': ''}),
+            'notes-list-excerpts': ('get', '/api/notes/', {'expand': 'excerpt'}),
+            'notes-detail': ('get', note, None),
+            'notes-favorites': ('get', '/api/notes/favorites/', None),
+            'notes-recent': ('get', '/api/notes/recent/', None),
+            'notes-due': ('get', '/api/notes/due/', None),
+            'notes-search': ('get', '/api/notes/search/', {'q': 'query'}),
+            'notes-create': ('post', '/api/notes/', {
+                'title': 'New', 'content': 'x', 'category': d['category'], 'tag_ids': d['tag_ids'],
+            }),
+            'notes-update': ('patch', note, {'title': 'Renamed', 'tag_ids': d['tag_ids']}),
+            'notes-mark-reviewed': ('post', f'{note}mark_reviewed/', {'grade': 'good'}),
+            'categories-list': ('get', '/api/categories/', None),
+            'categories-detail': ('get', f"/api/categories/{d['category']}/", None),
+            'tags-list': ('get', '/api/tags/', None),
+            'tags-detail': ('get', f"/api/tags/{d['tag']}/", None),
+            'attachments-list': ('get', '/api/attachments/', None),
+            'attachments-detail': ('get', f"/api/attachments/{d['attachment']}/", None),
+            'dashboard': ('get', '/api/dashboard/', None),
+            'progress': ('get', '/api/progress/', None),
+            'activity': ('get', '/api/activity/', None),
+            'sync': ('get', '/api/sync/', None),
+            'batch-dashboard-page': ('post', '/api/batch/', {'snapshot': True, 'requests': [
+                {'path': path} for path in
+                ['/api/dashboard/', '/api/progress/', '/api/notes/recent/', '/api/categories/', '/api/tags/']
+            ]}),
+        }
+
+    def count_queries(self, size, name):
+        d = self.datasets[size]
+        method, url, data = self.endpoints(d)[name]
+        client = APIClient()
+        client.force_authenticate(d['user'])
+        cache.clear()
+        caches['renderings'].clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(client, method)(url, data, format='json' if method != 'get' else None)
+        self.assertLess(response.status_code, 300, f'{name}: {response.status_code} {response.content[:200]!r}')
+        return len(ctx.captured_queries)
+
+    def test_budget_file_covers_every_endpoint(self):
+        self.assertEqual(set(self.BUDGETS), set(self.endpoints(self.datasets[self.SIZES[0]])))
+
+    def test_query_counts_do_not_grow_with_rows(self):
+        for name, budget in self.BUDGETS.items():
+            with self.subTest(endpoint=name):
+                counts = [self.count_queries(size, name) for size in self.SIZES]
+                self.assertEqual(len(set(counts)), 1, f'{name}: {counts} queries for {self.SIZES} rows')
+                self.assertLessEqual(counts[0], budget, f'{name}: {counts[0]} queries, budget {budget}')
+
+
+class SparseFieldsetTests(TestCase):
+    """?fields= and ?expand= decide which columns and relations are loaded"""
+
+    NOTE_TABLE = Note._meta.db_table
+    TAG_TABLE = Tag._meta.db_table
+    ATTACHMENT_TABLE = Attachment._meta.db_table
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='sparse', password='x' * 12)
+        category = Category.objects.create(name='Python', user=cls.user)
+        tag = Tag.objects.create(name='orm', user=cls.user)
+        for i in range(3):
+            note = Note.objects.create(title=f'Sparse {i}', content='body', category=category, user=cls.user)
+            note.tags.set([tag])
+            Attachment.objects.create(note=note, file='notes.txt', original_name='notes.txt', file_size=1)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        return response, [query['sql'] for query in ctx.captured_queries]
+
+    def reading(self, table, queries):
+        """Queries selecting from table itself (the ETag fingerprint only aggregates it in subqueries)"""
+        return [sql for sql in queries if re.search(rf'FROM "{table}"(?! U\d)', sql)]
+
+    def test_fields_prune_columns_and_prefetches(self):
+        response, queries = self.get('/api/notes/', {'fields': 'id,title'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({tuple(note) for note in response.json()['results']}, {('id', 'title')})
+        self.assertEqual(self.reading(self.TAG_TABLE, queries), [])
+        self.assertEqual(self.reading(self.ATTACHMENT_TABLE, queries), [])
+        self.assertFalse([sql for sql in queries if f'"{self.NOTE_TABLE}"."content"' in sql])
+
+        _, default = self.get('/api/notes/')
+        self.assertEqual(len(self.reading(self.TAG_TABLE, default)), 1)
+        self.assertEqual(len(default), len(queries) + 1)
+
+        response, queries = self.get(f'/api/notes/{Note.objects.first().pk}/', {'fields': 'id,title'})
+        self.assertEqual(response.json(), {'id': Note.objects.first().pk, 'title': Note.objects.first().title})
+        self.assertEqual(self.reading(self.TAG_TABLE, queries), [])
+        self.assertEqual(self.reading(self.ATTACHMENT_TABLE, queries), [])
+
+    def test_expand_adds_one_prefetch(self):
+        _, pruned = self.get('/api/notes/', {'fields': 'id,title'})
+        response, queries = self.get('/api/notes/', {'fields': 'id,title', 'expand': 'tags'})
+        self.assertEqual(len(queries), len(pruned))
+
+        response, queries = self.get('/api/notes/', {'fields': 'id,title,tags'})
+        self.assertEqual(len(queries), len(pruned) + 1)
+        self.assertEqual(len(self.reading(self.TAG_TABLE, queries)), 1)
+        self.assertEqual([tag['name'] for tag in response.json()['results'][0]['tags']], ['orm'])
+
+        # On the full list the tags prefetch replaces the one tags_count needs
+        _, default = self.get('/api/notes/')
+        response, queries = self.get('/api/notes/', {'expand': 'tags'})
+        self.assertEqual(len(queries), len(default))
+        self.assertEqual(len(self.reading(self.TAG_TABLE, queries)), 1)
+        self.assertIn('tags', response.json()['results'][0])
+
+    def test_unknown_field_is_rejected(self):
+        for params in ({'fields': 'id,titel'}, {'expand': 'secrets'}):
+            with self.subTest(params=params):
+                response, _ = self.get('/api/notes/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('fields', response.json())
+
+
+class CachedAuthenticationTests(TestCase):
+    """JWT requests reuse the cached user; password changes and deactivation still apply"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='cached', password='old-password-1')
+        response = APIClient().post(
+            '/api/auth/login/', {'username': 'cached', 'password': 'old-password-1'}, format='json'
+        )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+
+    def test_user_query_is_cached(self):
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/auth/profile/').status_code, 200)
+
+    def test_password_change_revokes_tokens(self):
+        self.client.get('/api/auth/profile/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('new-password-2')
+            self.user.save()
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 401)
+
+    def test_deactivation_revokes_tokens(self):
+        self.client.get('/api/auth/profile/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 401)
+
+
+@override_settings(AUTH_THROTTLE_BURST=3, AUTH_THROTTLE_PER_MINUTE=1)
+class AuthBurstTests(TestCase):
+    """Credential endpoints are rate limited, and logins upgrade old password hashes"""
+
+    def setUp(self):
+        throttling.buckets.reset()
+        self.addCleanup(throttling.buckets.reset)
+        self.user = User.objects.create_user(username='burst', password='right-password-1')
+
+    def login(self, password='right-password-1', **extra):
+        return APIClient().post('/api/auth/login/', {'username': 'burst', 'password': password}, format='json', **extra)
+
+    def test_bucket_refuses_with_retry_after(self):
+        for _ in range(3):
+            self.assertEqual(self.login('wrong').status_code, 401)
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_full_hashing_pool_refuses(self):
+        with mock.patch.object(passwords.HashingPool, 'run', side_effect=passwords.PasswordWorkBusy('busy')):
+            self.assertEqual(self.login().status_code, 429)
+
+    def test_login_rehashes_to_preferred_hasher(self):
+        self.user.password = make_password('right-password-1', hasher='pbkdf2_sha1')
+        self.user.save()
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(identify_hasher(self.user.password).algorithm, get_hasher('default').algorithm)
+
+
+@skipUnless(find_spec('argon2'), 'argon2-cffi is not installed')
+@override_settings(PASSWORD_HASHERS=[
+    'api.passwords.TunedArgon2PasswordHasher', 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+])
+class Argon2HasherTests(TestCase):
+    """The argon2 path: configured cost parameters and upgrades to them on login"""
+
+    def test_hashes_use_configured_costs(self):
+        encoded = make_password('right-password-1')
+        self.assertTrue(encoded.startswith('argon2$argon2id$'))
+        self.assertIn(
+            f'm={settings.ARGON2_MEMORY_COST},t={settings.ARGON2_TIME_COST},p={settings.ARGON2_PARALLELISM}',
+            encoded,
+        )
+        self.assertTrue(check_password('right-password-1', encoded))
+        self.assertFalse(passwords.needs_rehash(encoded))
+
+    def test_other_hashers_and_outdated_parameters_are_upgraded(self):
+        outdated = Argon2PasswordHasher()
+        outdated.time_cost = settings.ARGON2_TIME_COST + 1
+        for encoded in [
+            make_password('right-password-1', hasher='pbkdf2_sha256'),
+            outdated.encode('right-password-1', outdated.salt()),
+        ]:
+            with self.subTest(encoded=encoded.split('$')[0]):
+                self.assertTrue(passwords.needs_rehash(encoded))
+                user = User.objects.create_user(username='upgrade', password='x')
+                User.objects.filter(pk=user.pk).update(password=encoded)
+                self.assertEqual(passwords.authenticate_user('upgrade', 'right-password-1'), user)
+                user.refresh_from_db()
+                self.assertFalse(passwords.needs_rehash(user.password))
+                user.delete()
+
+
+class FastJSONTests(TestCase):
+    """orjson-backed renderer and parser produce what DRF's own would"""
+
+    DATA = {
+        'when': timezone.now(), 'day': timezone.localdate(), 'price': Decimal('1.10'), 'lazy': gettext_lazy('Name'),
+        'text': 'caf\u00e9 \u2028 \u2029 <script>', 'nested': [{1: None, 'ok': True}], 'big': 2 ** 70,
+    }
+
+    def test_renderer_matches_drf(self):
+        self.assertEqual(FastJSONRenderer().render(self.DATA), JSONRenderer().render(self.DATA))
+        self.assertEqual(FastJSONRenderer().render({'big': 2 ** 70}), JSONRenderer().render({'big': 2 ** 70}))
+
+    def test_parser_round_trip(self):
+        body = FastJSONRenderer().render(self.DATA)
+        self.assertEqual(FastJSONParser().parse(BytesIO(body)), JSONParser().parse(BytesIO(body)))
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(BytesIO(b'{"unterminated": '))
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_QUERY_BUDGET=1000, PROFILING_METRICS_IPS=['127.0.0.1'])
+class ProfilingTests(TestCase):
+    """Per-route histograms from the profiling middleware and the metrics endpoint"""
+
+    def setUp(self):
+        profiling.registry.reset()
+        self.addCleanup(profiling.registry.reset)
+        self.user = User.objects.create_user(username='profiled', password='x' * 12)
+        for name in ('orm', 'sql', 'cache'):
+            Tag.objects.create(name=name, user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def histogram(self, metric, view='tag-list', method='GET'):
+        return profiling.registry.histograms[(metric, view, method)]
+
+    def test_request_is_recorded_under_its_route(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/api/tags/').status_code, 200)
+        self.assertEqual(self.histogram('api_request_queries').sum, len(queries))
+        for metric in profiling.METRICS:
+            self.assertEqual(self.histogram(metric).count, 1)
+        self.assertGreater(self.histogram('api_request_duration_seconds').sum, 0)
+        self.assertGreater(self.histogram('api_request_serialization_duration_seconds').sum, 0)
+        self.assertGreater(self.histogram('api_request_render_duration_seconds').sum, 0)
+
+        self.client.get('/api/tags/')
+        self.assertEqual(self.histogram('api_request_queries').count, 2)
+
+    def test_serialization_time_covers_serializer_data(self):
+        profiling.instrument_serializers()
+        spent = [0.0]
+        token = profiling._serialization.set(spent)
+        self.addCleanup(profiling._serialization.reset, token)
+        with mock.patch.object(profiling.time, 'perf_counter', side_effect=[1.0, 3.5]):
+            UserSerializer([self.user], many=True).data
+        self.assertEqual(spent, [2.5])
+
+    def test_metrics_endpoint_exports_prometheus_text(self):
+        self.client.get('/api/tags/')
+        response = self.client.get('/api/_metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('# TYPE api_request_queries histogram', text)
+        self.assertIn('api_request_queries_count{view="tag-list",method="GET"} 1', text)
+        self.assertIn('api_request_serialization_duration_seconds_count{view="tag-list",method="GET"} 1', text)
+        self.assertIn('api_request_queries_bucket{view="tag-list",method="GET",le="+Inf"} 1', text)
+        # Scrapes are not recorded themselves
+        self.assertNotIn('view="metrics"', text)
+
+    def test_metrics_endpoint_is_restricted(self):
+        self.assertEqual(self.client.get('/api/_metrics', REMOTE_ADDR='10.0.0.1').status_code, 404)
+        with override_settings(PROFILING_ENABLED=False):
+            self.assertEqual(APIClient().get('/api/_metrics').status_code, 404)
+
+
+class AsyncReadViewTests(TestCase):
+    """The ASGI read path answers exactly as the DRF views do"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='async', password='x' * 12)
+        cls.category = Category.objects.create(name='Async', user=cls.user)
+        tag = Tag.objects.create(name='asgi', user=cls.user)
+        for i in range(25):
+            note = Note.objects.create(
+                title=f'Note {i}', content='event loops', user=cls.user,
+                category=cls.category, is_favorite=bool(i % 3),
+            )
+            note.tags.add(tag)
+        cls.note = note
+
+    def setUp(self):
+        cache.clear()
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        self.client = APIClient(headers=self.headers)
+
+    def call_async(self, method, view, path, headers=None, data=None, **kwargs):
+        request = getattr(AsyncRequestFactory(), method)(
+            path, data, content_type='application/json', headers={**self.headers, **(headers or {})}
+        ) if data is not None else getattr(AsyncRequestFactory(), method)(
+            path, headers={**self.headers, **(headers or {})}
+        )
+        response = async_to_sync(view)(request, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def test_responses_match_drf_views(self):
+        pk = self.note.pk
+        cases = [
+            ('/api/dashboard/', async_views.dashboard_stats, {}),
+            ('/api/progress/', async_views.learning_progress, {}),
+            ('/api/notes/', async_views.note_list, {}),
+            ('/api/notes/?page=2&ordering=title', async_views.note_list, {}),
+            (f'/api/notes/?category={self.category.pk}&fields=id,title', async_views.note_list, {}),
+            ('/api/notes/?is_favorite=true&page=last', async_views.note_list, {}),
+            ('/api/notes/?cursor=&count=false', async_views.note_list, {}),
+            ('/api/notes/?page=9', async_views.note_list, {}),
+            ('/api/notes/?fields=nope', async_views.note_list, {}),
+            (f'/api/notes/{pk}/', async_views.note_detail, {'pk': pk}),
+            (f'/api/notes/{pk}/?expand=attachments', async_views.note_detail, {'pk': pk}),
+            ('/api/notes/999999/', async_views.note_detail, {'pk': 999999}),
+        ]
+        for path, view, kwargs in cases:
+            with self.subTest(path=path):
+                expected = self.client.get(path)
+                actual = self.call_async('get', view, path, **kwargs)
+                self.assertEqual(actual.status_code, expected.status_code)
+                self.assertEqual(json.loads(actual.content), expected.json())
+                self.assertEqual(actual.get('ETag'), expected.get('ETag'))
+
+    def test_precondition_is_checked_before_the_page_is_read(self):
+        etag = self.client.get('/api/notes/')['ETag']
+        self.client.get('/api/auth/profile/')
+        with self.assertNumQueries(1):
+            response = self.call_async('get', async_views.note_list, '/api/notes/', {'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_refusals_and_writes_reach_drf_views(self):
+        self.headers = {}
+        self.assertEqual(self.call_async('get', async_views.note_list, '/api/notes/').status_code, 401)
+
+        self.headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+        response = self.call_async(
+            'post', async_views.note_list, '/api/notes/',
+            data={'title': 'Posted', 'content': 'through the fallback', 'category': self.category.pk},
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertTrue(Note.objects.filter(user=self.user, title='Posted').exists())
+
+
+class ConcurrentQueryTests(TransactionTestCase):
+    """Outside a transaction, concurrently() runs each function on its own pooled connection"""
+
+    def test_functions_run_on_separate_connections(self):
+        user = User.objects.create_user(username='pooled', password='x' * 12)
+
+        def probe():
+            return threading.current_thread().name, User.objects.filter(pk=user.pk).count(), id(connections['default'])
+
+        results = async_to_sync(concurrently)(probe, probe, probe)
+        self.assertEqual([count for _, count, _ in results], [1, 1, 1])
+        self.assertTrue(all(name.startswith('async-queries') for name, _, _ in results))
+        self.assertNotIn(id(connections['default']), {wrapper for _, _, wrapper in results})
+
+
+class BatchRequestTests(TestCase):
+    """/api/batch/ answers each sub-request as the route itself would, authenticating once"""
+
+    PAGE = ['/api/dashboard/', '/api/progress/', '/api/notes/recent/', '/api/categories/', '/api/tags/']
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='batcher', password='x' * 12)
+        self.category = Category.objects.create(name='Batch', user=self.user)
+        for i in range(3):
+            Note.objects.create(title=f'Note {i}', content='multiplexed', user=self.user, category=self.category)
+        self.client = APIClient(headers={'Authorization': f'Bearer {AccessToken.for_user(self.user)}'})
+
+    def batch(self, requests, **options):
+        return self.client.post('/api/batch/', {'requests': requests, **options}, format='json')
+
+    def test_dashboard_page_in_one_request(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.batch([{'path': path} for path in self.PAGE], snapshot=True)
+        self.assertEqual(response.status_code, 200)
+        user_lookups = [q for q in ctx.captured_queries if q['sql'].startswith('SELECT "auth_user"."id"')]
+        self.assertEqual(len(user_lookups), 1)
+
+        for path, result in zip(self.PAGE, response.json()['responses']):
+            with self.subTest(path=path):
+                expected = self.client.get(path)
+                self.assertEqual(result['status'], expected.status_code)
+                self.assertEqual(result['body'], expected.json())
+                self.assertEqual(result['headers'].get('ETag'), expected.get('ETag'))
+
+    def test_sub_requests_run_in_order_with_their_own_outcomes(self):
+        etag = self.client.get('/api/progress/')['ETag']
+        response = self.batch([
+            {'method': 'POST', 'path': '/api/notes/', 'body': {'title': 'Batched', 'content': 'x', 'category': self.category.pk}},
+            {'path': '/api/notes/?search=Batched'},
+            {'path': '/api/progress/', 'headers': {'If-None-Match': etag}},
+            {'path': '/api/export/'},
+            {'path': '/api/nowhere/'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        created, listed, progress, export, missing = response.json()['responses']
+        self.assertEqual(created['status'], 201)
+        self.assertEqual([note['id'] for note in listed['body']['results']], [created['body']['id']])
+        # The created note changed total_notes, so the old validator no longer matches
+        self.assertEqual(progress['status'], 200)
+        self.assertEqual(export['status'], 400)
+        self.assertEqual(missing['status'], 404)
+
+    def test_only_api_routes_are_dispatched(self):
+        response = self.batch([
+            {'path': '/admin/'}, {'path': '/api/../admin/'}, {'path': '/api/export/'}, {'path': '/api/tags/'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        statuses = [result['status'] for result in response.json()['responses']]
+        self.assertEqual(statuses, [400, 404, 400, 200])
+
+    def test_snapshot_is_read_only_and_batches_are_bounded(self):
+        self.assertEqual(self.batch([{'method': 'DELETE', 'path': '/api/notes/1/'}], snapshot=True).status_code, 400)
+        self.assertEqual(self.batch([{'path': '/api/tags/'}] * 21).status_code, 400)
+        self.assertEqual(self.batch([]).status_code, 400)
+        self.assertEqual(APIClient().post('/api/batch/', {'requests': [{'path': '/api/tags/'}]}, format='json').status_code, 401)
+
+
+class RenderingTests(TestCase):
+    """Note Markdown renders to safe HTML and excerpts, read from the cache by content hash"""
+
+    CONTENT = '# Heading\n\nSome **bold** text and [a link](https://example.com/?a=1&b=2).'
+
+    def setUp(self):
+        cache.clear()
+        caches['renderings'].clear()
+        self.user = User.objects.create_user(username='renderer', password='x' * 12)
+        self.category = Category.objects.create(name='Rendering', user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_markdown_is_rendered_without_unsafe_markup(self):
+        result = rendering.render(
+            self.CONTENT + '\n\n<script>alert(1)</script> [x](javascript:alert(1)) '
+            '![img](x" onerror="alert(1))\n\n```js"><b>\nif (a < b) {}\n```'
+        )
+        self.assertIn('<h1>Heading</h1>', result['html'])
+        self.assertIn('<a href="https://example.com/?a=1&amp;b=2" rel="nofollow noopener">a link</a>', result['html'])
+        self.assertIn('<pre><code class="language-js">if (a &lt; b) {}</code></pre>', result['html'])
+        self.assertNotIn('<script', result['html'])
+        self.assertNotIn('href="javascript', result['html'])
+        self.assertNotIn('onerror="', result['html'])
+        self.assertTrue(result['excerpt'].startswith('Heading Some bold text and a link.'))
+        self.assertLessEqual(len(rendering.render('word ' * 500)['excerpt']), rendering.EXCERPT_LENGTH + 1)
+
+    def test_content_hash_follows_every_write_path(self):
+        note = Note.objects.create(title='Hashed', content='one', user=self.user, category=self.category)
+        self.assertEqual(note.content_hash, rendering.content_hash('one'))
+        note.content = 'two'
+        note.save(update_fields=['content'])
+        self.client.post('/api/notes/bulk/', {'operations': [
+            {'op': 'update', 'id': note.pk, 'data': {'content': 'three'}},
+        ]}, format='json')
+        note.refresh_from_db()
+        self.assertEqual((note.content, note.content_hash), ('three', rendering.content_hash('three')))
+
+    def test_list_excerpts_come_from_the_cache_without_loading_content(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                Note.objects.create(title=f'Note {i}', content=self.CONTENT, user=self.user, category=self.category)
+
+        with mock.patch.object(rendering, 'render', wraps=rendering.render) as render, \
+                CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/notes/', {'expand': 'excerpt,content_html'})
+        self.assertEqual(response.status_code, 200)
+        render.assert_not_called()
+        self.assertFalse([q for q in ctx.captured_queries if re.search(r'"api_note"\."content"(?!_)', q['sql'])])
+        expected = rendering.render(self.CONTENT)
+        for note in response.json()['results']:
+            self.assertEqual((note['content_html'], note['excerpt']), (expected['html'], expected['excerpt']))
+
+    def test_bulk_written_notes_render_once_on_first_read(self):
+        Note.objects.bulk_create([
+            Note(title=f'Bulk {i}', content=f'Note *{i}*', user=self.user, category=self.category)
+            for i in range(3)
+        ])
+        with mock.patch.object(rendering, 'render', wraps=rendering.render) as render:
+            first = self.client.get('/api/notes/', {'fields': 'id,excerpt'})
+            self.assertEqual(render.call_count, 3)
+            second = self.client.get('/api/notes/', {'fields': 'id,excerpt'})
+            self.assertEqual(render.call_count, 3)
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(
+            sorted(note['excerpt'] for note in first.json()['results']), ['Note 0', 'Note 1', 'Note 2'],
+        )
+
+
+class ChunkedUploadTests(MediaRootMixin, TestCase):
+    """Resumable uploads: ordered chunks, verified finalize, cleanup with the note"""
+
+    DATA = bytes(range(256)) * 40
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='uploader', password='x' * 12)
+        category = Category.objects.create(name='Uploads', user=self.user)
+        self.note = Note.objects.create(title='With file', content='x', category=category, user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def start(self, size=None):
+        response = self.client.post('/api/uploads/', {
+            'note_id': self.note.pk, 'original_name': 'data.bin', 'total_size': size or len(self.DATA),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def put(self, session_id, offset, chunk):
+        return self.client.put(
+            f'/api/uploads/{session_id}/', chunk,
+            content_type='application/octet-stream', headers={'Upload-Offset': str(offset)},
+        )
+
+    def finalize(self, session_id, sha256=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                f'/api/uploads/{session_id}/finalize/', {'sha256': sha256} if sha256 else {}, format='json',
+            )
+
+    def test_chunks_must_arrive_in_order_and_resume_from_received(self):
+        session_id = self.start()
+        self.assertEqual(self.put(session_id, 0, self.DATA[:4000]).status_code, 200)
+        out_of_order = self.put(session_id, 8000, self.DATA[8000:])
+        self.assertEqual((out_of_order.status_code, out_of_order.json()['received']), (409, 4000))
+
+        # Resume on a worker that never saw the first chunk
+        uploads._hashers.clear()
+        self.assertEqual(self.client.get(f'/api/uploads/{session_id}/').json()['received'], 4000)
+        response = self.put(session_id, 4000, self.DATA[4000:])
+        self.assertEqual(response['Upload-Offset'], str(len(self.DATA)))
+
+        response = self.finalize(session_id, hashlib.sha256(self.DATA).hexdigest())
+        self.assertEqual(response.status_code, 201)
+        attachment = Attachment.objects.get(pk=response.json()['id'])
+        with attachment.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.DATA)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.listdir(os.path.join(settings.MEDIA_ROOT, uploads.STAGING_DIR)))
+
+    def test_incomplete_and_mismatched_uploads_are_refused(self):
+        session_id = self.start()
+        self.put(session_id, 0, self.DATA[:100])
+        self.assertEqual(self.finalize(session_id).status_code, 409)
+        self.put(session_id, 100, self.DATA[100:])
+        response = self.finalize(session_id, '0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(hashlib.sha256(self.DATA).hexdigest(), response.json()['error'])
+        self.assertEqual(self.finalize(session_id).status_code, 201)
+
+    def test_failed_finalize_can_be_retried(self):
+        session_id = self.start()
+        self.put(session_id, 0, self.DATA)
+        with mock.patch.object(Attachment.objects, 'create', side_effect=IntegrityError('boom')):
+            with self.assertRaises(IntegrityError):
+                self.finalize(session_id)
+        self.assertTrue(os.path.exists(uploads._staging_path(session_id)))
+        self.assertFalse(Blob.objects.exists())
+        self.assertEqual(self.finalize(session_id).status_code, 201)
+
+    def test_bulk_deleting_the_note_discards_its_uploads(self):
+        session_id = self.start()
+        self.put(session_id, 0, self.DATA[:100])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/notes/bulk/', {
+                'operations': [{'op': 'delete', 'id': self.note.pk}],
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(uploads._staging_path(session_id)))
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA foreign_key_check')
+            self.assertEqual(cursor.fetchall(), [])
@@ -0,0 +1,85 @@
+"""
+In-memory token buckets for the login and register endpoints.
+
+Each client IP and each username gets a bucket of AUTH_THROTTLE_BURST
+tokens, refilled at AUTH_THROTTLE_PER_MINUTE. A request spends one token
+from each of its buckets and is refused with 429 (and Retry-After) when
+either is empty. Buckets live in the worker process, so the limits apply
+per worker. Idle buckets are dropped once there are more than MAX_BUCKETS.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+
+MAX_BUCKETS = 10_000
+
+
+class TokenBucket:
+    def __init__(self, capacity, per_second, now):
+        self.capacity = capacity
+        self.per_second = per_second
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.per_second)
+        self.updated = now
+
+    def wait(self):
+        """Seconds until a token is available"""
+        return max(0.0, (1 - self.tokens) / self.per_second)
+
+
+class BucketRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+
+    def consume(self, keys, capacity, per_second):
+        """Take a token from every bucket in keys, or from none; returns the wait when refused"""
+        now = time.monotonic()
+        with self.lock:
+            buckets = []
+            for key in keys:
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    bucket = self.buckets[key] = TokenBucket(capacity, per_second, now)
+                self.buckets.move_to_end(key)
+                bucket.refill(now)
+                buckets.append(bucket)
+            while len(self.buckets) > MAX_BUCKETS:
+                self.buckets.popitem(last=False)
+
+            wait = max(bucket.wait() for bucket in buckets)
+            if wait == 0:
+                for bucket in buckets:
+                    bucket.tokens -= 1
+            return wait
+
+    def reset(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+buckets = BucketRegistry()
+
+
+class AuthBurstThrottle(BaseThrottle):
+    """Per-IP and per-username token buckets for credential endpoints"""
+
+    def allow_request(self, request, view):
+        keys = [f'ip:{self.get_ident(request)}']
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        if isinstance(username, str) and username:
+            keys.append(f'user:{username.lower()}')
+        self.delay = buckets.consume(
+            keys, settings.AUTH_THROTTLE_BURST, settings.AUTH_THROTTLE_PER_MINUTE / 60
+        )
+        return self.delay == 0
+
+    def wait(self):
+        return self.delay
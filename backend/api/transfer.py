@@ -0,0 +1,339 @@
+"""
+NDJSON export and import of a user's knowledge base.
+
+An export is one JSON object per line, in dependency order::
+
+    {"type": "meta", "version": 1, "exported_at": "...", "username": "..."}
+    {"type": "category", "id": 3, "name": "...", ...}
+    {"type": "tag", "id": 7, "name": "..."}
+    {"type": "note", "id": 12, "category": 3, "tag_ids": [7], ...}
+    {"type": "attachment", "id": 4, "note": 12, "sha256": "...", "content": "<base64>", ...}
+
+Rows are read with ``.iterator(chunk_size=...)`` and written as they are
+produced, so memory stays flat however many notes the account has. Import
+reads the same stream line by line, validates each record on its own line
+and inserts them in batched bulk_create transactions, remapping the exported
+ids to the newly created rows. A batch that fails to insert is retried row
+by row, so errors are reported against the line that caused them.
+
+Attachment content is only in the stream when it is exported with
+include_files. On import an attachment is linked to the blob with its sha256
+if the importing user already has an attachment using that blob, or if the
+record carries the content itself; storage paths are never read from the
+stream. Attachments whose content is neither are reported and skipped.
+"""
+import base64
+import hashlib
+import json
+import time
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import Category, Tag, Note, Attachment, Blob, LearningProgress
+from . import blobs, counters, search, stats
+
+
+FORMAT_VERSION = 1
+CHUNK_SIZE = 500
+
+NoteTag = Note.tags.through
+
+# A validated note or attachment waiting for its batch insert; extra is the
+# note's tag ids or the attachment's content
+Pending = namedtuple('Pending', 'line exported_id instance extra')
+
+CATEGORY_FIELDS = ['name', 'description', 'color', 'created_at']
+TAG_FIELDS = ['name', 'created_at']
+NOTE_FIELDS = ['title', 'content', 'summary', 'difficulty', 'is_favorite', 'is_archived',
+               'source_url', 'created_at', 'last_reviewed', 'due_at', 'interval_days', 'ease', 'repetitions']
+ATTACHMENT_FIELDS = ['original_name', 'file_type', 'file_size', 'description', 'uploaded_at']
+
+
+def _line(record):
+    return json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False).encode() + b'\n'
+
+
+def _file_content(name):
+    with default_storage.open(name, 'rb') as file:
+        return base64.b64encode(file.read()).decode()
+
+
+def export_lines(user, chunk_size=CHUNK_SIZE, include_files=False):
+    """Yield the user's knowledge base as NDJSON lines (bytes), with attachment content if include_files"""
+    yield _line({
+        'type': 'meta',
+        'version': FORMAT_VERSION,
+        'exported_at': timezone.now(),
+        'username': user.username,
+    })
+
+    for row in Category.objects.filter(user=user).order_by('id').values('id', *CATEGORY_FIELDS).iterator(chunk_size):
+        yield _line({'type': 'category', **row})
+
+    for row in Tag.objects.filter(user=user).order_by('id').values('id', *TAG_FIELDS).iterator(chunk_size):
+        yield _line({'type': 'tag', **row})
+
+    notes = (
+        Note.objects.filter(user=user)
+        .order_by('id')
+        .only('id', 'category_id', *NOTE_FIELDS)
+        .prefetch_related(Prefetch('tags', queryset=Tag.objects.only('id')))
+    )
+    for note in notes.iterator(chunk_size):
+        record = {'type': 'note', 'id': note.pk, 'category': note.category_id}
+        record.update({field: getattr(note, field) for field in NOTE_FIELDS})
+        record['tag_ids'] = [tag.pk for tag in note.tags.all()]
+        yield _line(record)
+
+    attachments = Attachment.objects.filter(note__user=user).order_by('id').values(
+        'id', 'note_id', 'blob_id', 'file', *ATTACHMENT_FIELDS
+    )
+    for row in attachments.iterator(chunk_size):
+        row['note'] = row.pop('note_id')
+        row['sha256'] = row.pop('blob_id')
+        name = row.pop('file')
+        if include_files and name:
+            row['content'] = _file_content(name)
+        yield _line({'type': 'attachment', **row})
+
+
+class TransferError(Exception):
+    pass
+
+
+def _exported_id(record):
+    """record['id'], which must be usable as a key of the id maps"""
+    value = record['id']
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise TransferError("id must be an integer or a string")
+    return value
+
+
+class NDJSONImporter:
+    """
+    Import an export stream for user.
+
+    Categories and tags are matched by name to the user's existing rows;
+    notes and attachments are always created. feed() accepts any iterable
+    of lines (a file, a request body) and keeps at most batch_size pending
+    rows in memory. Every error is reported with the line it came from.
+    """
+
+    def __init__(self, user, batch_size=CHUNK_SIZE):
+        self.user = user
+        self.batch_size = batch_size
+        self.category_map = {}
+        self.tag_map = {}
+        self.note_map = {}
+        self.pending_notes = []
+        self.pending_attachments = []
+        self.counts = {'category': 0, 'tag': 0, 'note': 0, 'attachment': 0}
+        self.errors = []
+        self.started = None
+
+    def feed(self, lines):
+        self.started = time.monotonic()
+        self.existing_categories = dict(Category.objects.filter(user=self.user).values_list('name', 'id'))
+        self.existing_tags = dict(Tag.objects.filter(user=self.user).values_list('name', 'id'))
+
+        for number, raw in enumerate(lines, start=1):
+            raw = raw.strip()
+            if not raw:
+                continue
+            try:
+                record = json.loads(raw)
+                self.handle(record, number)
+            except (ValueError, KeyError, TypeError, ValidationError, IntegrityError, TransferError) as exc:
+                self.error(number, exc)
+
+        self.flush_notes()
+        self.flush_attachments()
+        self.finish()
+        return self.report()
+
+    def error(self, line, exc):
+        message = '; '.join(exc.messages) if isinstance(exc, ValidationError) else str(exc)
+        self.errors.append({'line': line, 'error': message})
+
+    def handle(self, record, line):
+        if not isinstance(record, dict):
+            raise TransferError("Record must be a JSON object")
+        kind = record.get('type')
+        if kind == 'meta':
+            if record.get('version') != FORMAT_VERSION:
+                raise TransferError(f"Unsupported export version {record.get('version')!r}")
+        elif kind == 'category':
+            self.import_category(record)
+        elif kind == 'tag':
+            self.import_tag(record)
+        elif kind == 'note':
+            self.pending_notes.append(self.read_note(record, line))
+            if len(self.pending_notes) >= self.batch_size:
+                self.flush_notes()
+        elif kind == 'attachment':
+            self.pending_attachments.append(self.read_attachment(record, line))
+            if len(self.pending_attachments) >= self.batch_size:
+                self.flush_notes()
+                self.flush_attachments()
+        else:
+            raise TransferError(f"Unknown record type {kind!r}")
+
+    def import_named(self, model, fields, existing, record):
+        """
+        The id of the user's category or tag named like record, created if
+        needed. Everything is checked before the INSERT, which runs in its
+        own savepoint so a failure only loses this line.
+        """
+        exported_id, name = _exported_id(record), record['name']
+        if not isinstance(name, str) or not name.strip():
+            raise TransferError("name must be a non-empty string")
+        if name not in existing:
+            obj = model(user=self.user, **{f: record[f] for f in fields if f in record})
+            obj.clean_fields(exclude=['user'])
+            with transaction.atomic():
+                obj.save()
+            existing[name] = obj.pk
+            self.counts[model._meta.model_name] += 1
+        return exported_id, existing[name]
+
+    def import_category(self, record):
+        exported_id, pk = self.import_named(Category, CATEGORY_FIELDS, self.existing_categories, record)
+        self.category_map[exported_id] = pk
+
+    def import_tag(self, record):
+        exported_id, pk = self.import_named(Tag, TAG_FIELDS, self.existing_tags, record)
+        self.tag_map[exported_id] = pk
+
+    def read_note(self, record, line):
+        category_id = self.category_map.get(record.get('category'))
+        if category_id is None:
+            raise TransferError("Unknown category")
+        note = Note(user=self.user, category_id=category_id, **{f: record[f] for f in NOTE_FIELDS if f in record})
+        note.clean_fields(exclude=['user', 'category', 'content_hash'])
+        tag_ids = record.get('tag_ids', [])
+        if not isinstance(tag_ids, list):
+            raise TransferError("tag_ids must be a list")
+        return Pending(line, _exported_id(record), note, [self.tag_map[t] for t in tag_ids if t in self.tag_map])
+
+    def read_attachment(self, record, line):
+        attachment = Attachment(**{f: record[f] for f in ATTACHMENT_FIELDS if f in record})
+        attachment.clean_fields(exclude=['note', 'file', 'blob'])
+        sha256, content = record.get('sha256'), None
+        if sha256 is not None and not isinstance(sha256, str):
+            raise TransferError("sha256 must be a string")
+        if record.get('content') is not None:
+            data = base64.b64decode(record['content'], validate=True)
+            digest = hashlib.sha256(data).hexdigest()
+            if sha256 is not None and sha256 != digest:
+                raise TransferError("Attachment content does not match its sha256")
+            content, sha256 = ContentFile(data, name=attachment.original_name), digest
+        attachment.blob_id = sha256
+        # exported_id is the exported id of the attachment's note
+        return Pending(line, record.get('note'), attachment, content)
+
+    def insert(self, rows, insert_rows):
+        """
+        Insert rows with insert_rows in one transaction, or, when that fails,
+        one savepoint per row so only the offending rows are reported.
+        Returns the rows inserted.
+        """
+        try:
+            with transaction.atomic():
+                insert_rows(rows)
+            return rows
+        except IntegrityError:
+            pass
+        inserted = []
+        for row in rows:
+            row.instance.pk = None
+            row.instance._state.adding = True
+            try:
+                with transaction.atomic():
+                    insert_rows([row])
+                inserted.append(row)
+            except IntegrityError as exc:
+                self.error(row.line, exc)
+        return inserted
+
+    def flush_notes(self):
+        if not self.pending_notes:
+            return
+        rows, self.pending_notes = self.pending_notes, []
+
+        def insert_rows(rows):
+            notes = [row.instance for row in rows]
+            Note.objects.bulk_create(notes, batch_size=self.batch_size)
+            NoteTag.objects.bulk_create(
+                [NoteTag(note_id=row.instance.pk, tag_id=tag_id) for row in rows for tag_id in row.extra],
+                batch_size=self.batch_size, ignore_conflicts=True,
+            )
+            search.index_notes(note.pk for note in notes)
+
+        inserted = self.insert(rows, insert_rows)
+        # Mapped only once committed, so no attachment is pointed at a rolled back note
+        for row in inserted:
+            self.note_map[row.exported_id] = row.instance.pk
+        self.counts['note'] += len(inserted)
+
+    def flush_attachments(self):
+        if not self.pending_attachments:
+            return
+        pending, self.pending_attachments = self.pending_attachments, []
+
+        # Blobs the user can already read through their own attachments
+        owned = {
+            blob.pk: blob for blob in Blob.objects.filter(
+                pk__in={row.instance.blob_id for row in pending} - {None},
+                attachments__note__user=self.user,
+            ).distinct()
+        }
+        rows = []
+        for row in pending:
+            attachment = row.instance
+            attachment.note_id = self.note_map.get(row.exported_id)
+            if attachment.note_id is None:
+                self.errors.append({'line': row.line, 'error': 'Unknown note'})
+                continue
+            if row.extra is not None:
+                blob = blobs.store_blob(row.extra, attachment.blob_id)
+            elif attachment.blob_id in owned:
+                blob = owned[attachment.blob_id]
+            else:
+                self.errors.append({'line': row.line, 'error': 'Attachment content is not in the import'})
+                continue
+            attachment.blob, attachment.file = blob, blob.file.name
+            rows.append(row)
+
+        def insert_rows(rows):
+            Attachment.objects.bulk_create([row.instance for row in rows], batch_size=self.batch_size)
+            # bulk_create skips the refcount signals
+            counters.recount_blobs(Blob.objects.filter(pk__in={row.instance.blob_id for row in rows}))
+
+        self.counts['attachment'] += len(self.insert(rows, insert_rows))
+
+    def finish(self):
+        """Bring counters and the dashboard cache up to date after the bulk inserts"""
+        with transaction.atomic():
+            counters.recount_categories(Category.objects.filter(user=self.user))
+            counters.recount_tags(Tag.objects.filter(user=self.user))
+            LearningProgress.for_user(self.user)
+            counters.recount_progress(LearningProgress.objects.filter(user=self.user))
+        stats.invalidate_dashboard(self.user.pk)
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        rows = sum(self.counts.values())
+        return {
+            'imported': self.counts,
+            'errors': self.errors[:100],
+            'error_count': len(self.errors),
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(rows / elapsed) if elapsed else rows,
+        }
@@ -0,0 +1,270 @@
+"""
+Chunked, resumable attachment uploads.
+
+A client opens an UploadSession with the file name and size, then PUTs the
+bytes in order, each request naming its starting offset in the
+``Upload-Offset`` header. Chunks are streamed to
+``<MEDIA_ROOT>/uploads/<session id>.part`` in BLOCK_SIZE pieces, so memory
+use does not depend on chunk or file size, and fed to a SHA-256 as they
+arrive. A dropped connection keeps whatever reached the disk: the session's
+``received`` is the offset to resume from. finish_upload() records the Blob
+(``api.blobs``) and the Attachment and deletes the session in one
+transaction; only once that commits is the staged file moved into blob
+storage (a rename, not a copy) or, if the content is already stored,
+deleted. A failed finalize therefore leaves the upload as it was.
+
+The running hash is kept by the worker that took the previous chunk. When a
+chunk lands on another worker, or after a restart, the staged bytes are
+rehashed from disk once.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.files import File, locks
+from django.db import transaction
+from django.utils import timezone
+
+from .blobs import place_blob_file, reserve_blob
+from .models import Attachment, UploadSession
+
+
+STAGING_DIR = 'uploads'
+BLOCK_SIZE = 64 * 1024
+HASHER_CACHE_SIZE = 256
+
+
+class UploadError(Exception):
+    status = 400
+
+
+class OffsetMismatch(UploadError):
+    status = 409
+
+
+class UploadBusy(UploadError):
+    status = 409
+
+
+class UploadIncomplete(UploadError):
+    status = 409
+
+
+class ChunkTooLarge(UploadError):
+    status = 413
+
+
+class StagingLost(UploadError):
+    status = 410
+
+
+# session id -> (offset, sha256 of the bytes before offset)
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+
+
+def _remember(session_id, offset, hasher):
+    with _hashers_lock:
+        _hashers[session_id] = (offset, hasher)
+        _hashers.move_to_end(session_id)
+        while len(_hashers) > HASHER_CACHE_SIZE:
+            _hashers.popitem(last=False)
+
+
+def _forget(session_id):
+    with _hashers_lock:
+        _hashers.pop(session_id, None)
+
+
+def _hasher_at(session, staged):
+    """SHA-256 of the first session.received staged bytes"""
+    with _hashers_lock:
+        entry = _hashers.pop(session.pk, None)
+    if entry is not None and entry[0] == session.received:
+        return entry[1]
+
+    hasher = hashlib.sha256()
+    staged.seek(0)
+    remaining = session.received
+    while remaining:
+        block = staged.read(min(BLOCK_SIZE, remaining))
+        if not block:
+            raise StagingLost('Staged data is missing; start a new upload')
+        hasher.update(block)
+        remaining -= len(block)
+    return hasher
+
+
+def staging_path(session):
+    return _staging_path(session.pk)
+
+
+def _staging_path(session_id):
+    return os.path.join(settings.MEDIA_ROOT, STAGING_DIR, f'{session_id}.part')
+
+
+def _remove_staged(session_ids):
+    for session_id in session_ids:
+        _forget(session_id)
+        try:
+            os.remove(_staging_path(session_id))
+        except FileNotFoundError:
+            pass
+
+
+def start_upload(user, note, original_name, total_size, description=''):
+    if total_size > settings.UPLOAD_MAX_SIZE:
+        raise ChunkTooLarge(f'Files may be at most {settings.UPLOAD_MAX_SIZE} bytes')
+    session = UploadSession.objects.create(
+        user=user, note=note, original_name=original_name,
+        total_size=total_size, description=description,
+    )
+    path = staging_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    return session
+
+
+def write_chunk(session, offset, stream, length):
+    """
+    Append length bytes read from stream at offset.
+
+    Whatever arrives before the stream ends or fails is kept and counted, so
+    the client resumes from session.received rather than from the chunk start.
+    """
+    if length > settings.UPLOAD_CHUNK_SIZE:
+        raise ChunkTooLarge(f'Chunks may be at most {settings.UPLOAD_CHUNK_SIZE} bytes')
+    if offset + length > session.total_size:
+        raise UploadError('Chunk runs past the declared file size')
+
+    try:
+        staged = open(staging_path(session), 'r+b')
+    except FileNotFoundError:
+        raise StagingLost('Staged data is missing; start a new upload')
+    with staged:
+        # One writer per session; LOCK_EX is 0 where file locking is unsupported
+        if not locks.lock(staged, locks.LOCK_EX | locks.LOCK_NB) and locks.LOCK_EX:
+            raise UploadBusy('Another chunk of this upload is being written')
+        session.refresh_from_db(fields=['received'])
+        if offset != session.received:
+            raise OffsetMismatch(f'Expected offset {session.received}')
+
+        hasher = _hasher_at(session, staged)
+        # Drop bytes past the last recorded offset (a write that was never counted)
+        staged.seek(offset)
+        staged.truncate()
+        written = 0
+        try:
+            while written < length:
+                block = stream.read(min(BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                staged.write(block)
+                hasher.update(block)
+                written += len(block)
+        finally:
+            staged.flush()
+            session.received = offset + written
+            session.updated_at = timezone.now()
+            UploadSession.objects.filter(pk=session.pk).update(
+                received=session.received, updated_at=session.updated_at
+            )
+            _remember(session.pk, session.received, hasher)
+
+    if written < length:
+        raise UploadError(f'Received {written} of {length} bytes')
+    return session
+
+
+class StagedFile(File):
+    """A staged upload FileSystemStorage can move into place instead of copying"""
+
+    def __init__(self, file, path, name):
+        super().__init__(file, name)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def finish_upload(session, sha256=None):
+    """Create the Attachment from a complete upload; returns (attachment, sha256)"""
+    if session.received != session.total_size:
+        raise UploadIncomplete(f'Received {session.received} of {session.total_size} bytes')
+
+    path = staging_path(session)
+    try:
+        staged = open(path, 'rb')
+    except FileNotFoundError:
+        raise StagingLost('Staged data is missing; start a new upload')
+    with staged:
+        hasher = _hasher_at(session, staged)
+    # Kept for a retry should the checksum or the transaction below fail
+    _remember(session.pk, session.received, hasher)
+    digest = hasher.hexdigest()
+    if sha256 and sha256.lower() != digest:
+        raise UploadError(f'Checksum mismatch: received data hashes to {digest}')
+
+    with transaction.atomic():
+        blob = reserve_blob(digest, session.original_name, session.total_size)
+        attachment = Attachment.objects.create(
+            note=session.note,
+            blob=blob,
+            file=blob.file.name,
+            original_name=session.original_name,
+            file_type=Attachment.file_type_for(session.original_name),
+            file_size=blob.size,
+            description=session.description,
+        )
+        session_id = session.pk
+        session.delete()
+        transaction.on_commit(partial(_store_staged, session_id, path, blob))
+    return attachment, digest
+
+
+def _store_staged(session_id, path, blob):
+    """Move a finalized upload into blob storage (or drop it if already stored)"""
+    try:
+        with open(path, 'rb') as staged:
+            place_blob_file(blob, StagedFile(staged, path, blob.file.name))
+    finally:
+        _remove_staged([session_id])
+
+
+def discard_upload(session):
+    """Delete the session; its staged bytes go once the deletion commits"""
+    session_id = session.pk
+    session.delete()
+    transaction.on_commit(partial(_remove_staged, [session_id]))
+
+
+def discard_note_uploads(note_ids):
+    """Discard the upload sessions of notes that are being deleted"""
+    sessions = UploadSession.objects.filter(note_id__in=note_ids)
+    session_ids = list(sessions.values_list('pk', flat=True))
+    if session_ids:
+        sessions.delete()
+        transaction.on_commit(partial(_remove_staged, session_ids))
+
+
+def prune_uploads(now=None):
+    """Discard sessions idle for UPLOAD_SESSION_TTL_HOURS and orphaned staged files"""
+    cutoff = (now or timezone.now()) - timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+    pruned = 0
+    for session in UploadSession.objects.filter(updated_at__lt=cutoff):
+        discard_upload(session)
+        pruned += 1
+
+    # Files left behind by sessions deleted with their note or user
+    directory = os.path.join(settings.MEDIA_ROOT, STAGING_DIR)
+    if os.path.isdir(directory):
+        live = {f'{pk}.part' for pk in UploadSession.objects.values_list('pk', flat=True)}
+        for entry in os.scandir(directory):
+            if entry.name.endswith('.part') and entry.name not in live and entry.stat().st_mtime < cutoff.timestamp():
+                os.remove(entry.path)
+                pruned += 1
+    return pruned
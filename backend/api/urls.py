@@ -1,8 +1,9 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
 
-from . import views
+from . import async_views, views
 
 # Create router for viewsets
 router = DefaultRouter()
@@ -10,6 +11,7 @@ router.register(r'categories', views.CategoryViewSet, basename='category')
 router.register(r'tags', views.TagViewSet, basename='tag')
 router.register(r'notes', views.NoteViewSet, basename='note')
 router.register(r'attachments', views.AttachmentViewSet, basename='attachment')
+router.register(r'uploads', views.UploadSessionViewSet, basename='upload')
 
 urlpatterns = [
     # Authentication endpoints
@@ -21,7 +23,25 @@ urlpatterns = [
     # Learning progress and stats
     path('progress/', views.learning_progress, name='learning_progress'),
     path('dashboard/', views.dashboard_stats, name='dashboard_stats'),
+    path('activity/', views.activity, name='activity'),
+    
+    # Export / import
+    path('export/', views.export_data, name='export_data'),
+    path('import/', views.import_data, name='import_data'),
+    
+    # Delta sync
+    path('sync/', views.sync, name='sync'),
+    
+    # Several requests in one round trip
+    path('batch/', views.batch, name='batch'),
+    
+    # Profiling metrics (PROFILING_ENABLED only)
+    path('_metrics', views.metrics, name='metrics'),
     
     # Include router URLs
     path('', include(router.urls)),
 ]
+
+if settings.ASYNC_VIEWS:
+    # Async GETs for the hottest reads; other methods still reach the views above
+    urlpatterns = async_views.urlpatterns + urlpatterns
@@ -1,28 +1,58 @@
-from rest_framework import viewsets, status, permissions, filters
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework import viewsets, mixins, status, permissions, filters
+from rest_framework.decorators import action, api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
-from django.db.models import Q, Count
+from django.db.models import Max
+from django.conf import settings
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 
-from .models import Category, Tag, Note, Attachment, LearningProgress
+from .models import Category, Tag, Note, Attachment, LearningProgress, UploadSession
 from .serializers import (
     UserSerializer, UserRegistrationSerializer, CategorySerializer, 
     TagSerializer, NoteSerializer, NoteListSerializer, AttachmentSerializer,
-    LearningProgressSerializer, AttachmentUploadSerializer
+    LearningProgressSerializer, AttachmentUploadSerializer, NoteSearchSerializer,
+    NoteReviewSerializer, UploadSessionSerializer, UploadFinalizeSerializer
 )
+from .activity import HEATMAP_DAYS, MAX_HEATMAP_DAYS, activity_summary, record_review
+from .batch import BatchError, run_batch
+from .bulk import MAX_OPERATIONS, apply_bulk_operations
+from .conditional import ConditionalViewSetMixin, conditional_response, make_etag, set_validators
+from .fieldsets import SparseFieldsetViewSetMixin
+from .pagination import NotePagination
+from .passwords import PasswordWorkBusy, authenticate_user
+from .profiling import registry as profiling_registry
+from .scheduling import DEFAULT_GRADE, DUE_BATCH_SIZE, MAX_DUE_BATCH_SIZE, parse_grade
+from .search import search_notes
+from .stats import get_dashboard_stats
+from .sync import DEFAULT_LIMIT, MAX_LIMIT, InvalidToken, ResyncRequired, build_sync_response
+from .throttling import AuthBurstThrottle
+from .transfer import NDJSONImporter, export_lines
+from .uploads import UploadError, discard_upload, finish_upload, start_upload, write_chunk
+
+
+def password_work_busy(exc):
+    return Response(
+        {'error': str(exc)},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={'Retry-After': '1'}
+    )
 
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([AuthBurstThrottle])
 def register(request):
     """User registration endpoint"""
     serializer = UserRegistrationSerializer(data=request.data)
     if serializer.is_valid():
-        user = serializer.save()
+        try:
+            user = serializer.save()
+        except PasswordWorkBusy as exc:
+            return password_work_busy(exc)
         refresh = RefreshToken.for_user(user)
         return Response({
             'user': UserSerializer(user).data,
@@ -34,13 +64,17 @@ def register(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([AuthBurstThrottle])
 def login(request):
     """User login endpoint"""
     username = request.data.get('username')
     password = request.data.get('password')
     
     if username and password:
-        user = authenticate(username=username, password=password)
+        try:
+            user = authenticate_user(username, password)
+        except PasswordWorkBusy as exc:
+            return password_work_busy(exc)
         if user:
             refresh = RefreshToken.for_user(user)
             return Response({
@@ -64,7 +98,7 @@ def profile(request):
     return Response(UserSerializer(request.user).data)
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ConditionalViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
@@ -73,10 +107,10 @@ class CategoryViewSet(viewsets.ModelViewSet):
     ordering = ['name']
 
     def get_queryset(self):
-        return Category.objects.filter(user=self.request.user)
+        return self.optimize_queryset(Category.objects.filter(user=self.request.user))
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(ConditionalViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     serializer_class = TagSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
@@ -85,43 +119,96 @@ class TagViewSet(viewsets.ModelViewSet):
     ordering = ['name']
 
     def get_queryset(self):
-        return Tag.objects.filter(user=self.request.user)
+        return self.optimize_queryset(Tag.objects.filter(user=self.request.user))
 
 
-class NoteViewSet(viewsets.ModelViewSet):
+class NoteViewSet(ConditionalViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = NotePagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['title', 'content', 'summary']
     filterset_fields = ['category', 'difficulty', 'is_favorite', 'is_archived']
     ordering_fields = ['created_at', 'updated_at', 'title', 'last_reviewed']
     ordering = ['-updated_at']
+    # Keyset cursors are built from the ordering column of the last row
+    optimize_extra_fields = ordering_fields
 
     def get_queryset(self):
-        return Note.objects.filter(user=self.request.user).select_related('category').prefetch_related('tags', 'attachments')
+        queryset = Note.objects.filter(user=self.request.user)
+        if self.request.method in permissions.SAFE_METHODS:
+            # Load only what the (possibly sparse) serializer reads
+            return self.optimize_queryset(queryset)
+        return queryset.select_related('category').prefetch_related('tags', 'attachments')
 
     def get_serializer_class(self):
         if self.action == 'list':
             return NoteListSerializer
+        if self.action == 'search':
+            return NoteSearchSerializer
         return NoteSerializer
 
+    def get_object_validator_parts(self, pk):
+        # The detail payload nests the category and tags
+        row = (
+            Note.objects.filter(user=self.request.user, pk=pk)
+            .values('updated_at', 'category__updated_at')
+            .annotate(tags_updated_at=Max('tags__updated_at'))
+            .order_by('pk')
+            .first()
+        )
+        if row is None:
+            return None
+        parts = [row['updated_at'], row['category__updated_at'], row['tags_updated_at']]
+        return parts, max(value for value in parts if value is not None)
+
     @action(detail=True, methods=['post'])
     def mark_reviewed(self, request, pk=None):
-        """Mark note as reviewed"""
+        """Grade a review (grade 0-5 or again/hard/good/easy) and schedule the next one"""
+        serializer = NoteReviewSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        grade = parse_grade(serializer.validated_data.get('grade', DEFAULT_GRADE))
         note = self.get_object()
-        note.mark_as_reviewed()
+        note.mark_as_reviewed(grade)
+        
+        # Log the review and update learning progress
+        record_review(note, grade)
         
-        # Update learning progress
-        progress, created = LearningProgress.objects.get_or_create(user=request.user)
-        progress.update_daily_progress()
+        return Response({
+            'status': 'marked as reviewed',
+            'last_reviewed': note.last_reviewed,
+            'due_at': note.due_at,
+            'interval_days': note.interval_days,
+            'ease': note.ease,
+            'repetitions': note.repetitions,
+        })
+
+    @action(detail=False, methods=['get'])
+    def due(self, request):
+        """Active notes due for review, soonest first (?limit=, default 20)"""
+        try:
+            limit = min(int(request.query_params.get('limit', DUE_BATCH_SIZE)), MAX_DUE_BATCH_SIZE)
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({'error': 'limit must be positive'}, status=status.HTTP_400_BAD_REQUEST)
         
-        return Response({'status': 'marked as reviewed'})
+        # A range read of note_user_due_idx: cost depends on limit, not on collection size
+        due_notes = list(
+            self.get_queryset()
+            .filter(is_archived=False, due_at__lte=timezone.now())
+            .order_by('due_at', 'id')[:limit + 1]
+        )
+        serializer = self.get_serializer(due_notes[:limit], many=True)
+        return Response({'results': serializer.data, 'has_more': len(due_notes) > limit})
 
     @action(detail=True, methods=['post'])
     def toggle_favorite(self, request, pk=None):
         """Toggle favorite status of note"""
         note = self.get_object()
         note.is_favorite = not note.is_favorite
-        note.save()
+        note.save(update_fields=['is_favorite', 'updated_at'])
         return Response({'is_favorite': note.is_favorite})
 
     @action(detail=True, methods=['post'])
@@ -129,9 +216,30 @@ class NoteViewSet(viewsets.ModelViewSet):
         """Toggle archive status of note"""
         note = self.get_object()
         note.is_archived = not note.is_archived
-        note.save()
+        note.save(update_fields=['is_archived', 'updated_at'])
         return Response({'is_archived': note.is_archived})
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Apply create/update/archive/favorite/delete/tags operations in one transaction"""
+        operations = request.data.get('operations')
+        if not isinstance(operations, list) or not operations:
+            return Response(
+                {'error': 'operations must be a non-empty list'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(operations) > MAX_OPERATIONS:
+            return Response(
+                {'error': f'At most {MAX_OPERATIONS} operations per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        results, applied = apply_bulk_operations(request.user, operations)
+        return Response(
+            {'applied': applied, 'results': results},
+            status=status.HTTP_200_OK if applied else status.HTTP_400_BAD_REQUEST
+        )
+
     @action(detail=False, methods=['get'])
     def favorites(self, request):
         """Get all favorite notes"""
@@ -153,18 +261,13 @@ class NoteViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def search(self, request):
-        """Advanced search with filters"""
+        """Ranked full-text search with filters (?highlight=1 adds snippets)"""
         queryset = self.get_queryset()
         query = request.query_params.get('q', '')
+        highlight = request.query_params.get('highlight') in ('1', 'true')
         
         if query:
-            queryset = queryset.filter(
-                Q(title__icontains=query) |
-                Q(content__icontains=query) |
-                Q(summary__icontains=query) |
-                Q(tags__name__icontains=query) |
-                Q(category__name__icontains=query)
-            ).distinct()
+            queryset = search_notes(queryset, query, highlight=highlight)
         
         # Apply additional filters
         category = request.query_params.get('category')
@@ -188,12 +291,12 @@ class NoteViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class AttachmentViewSet(viewsets.ModelViewSet):
+class AttachmentViewSet(SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     serializer_class = AttachmentSerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Attachment.objects.filter(note__user=self.request.user)
+        return self.optimize_queryset(Attachment.objects.filter(note__user=self.request.user))
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -226,52 +329,202 @@ class AttachmentViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class UploadSessionViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    Chunked, resumable attachment uploads.
+
+    POST opens a session, PUT with an Upload-Offset header appends raw bytes,
+    GET reports how much arrived (the offset to resume from), POST finalize/
+    creates the attachment and DELETE abandons the upload.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user).select_related('note')
+
+    def error_response(self, exc, session=None):
+        data = {'error': str(exc)}
+        if session is not None:
+            data['received'] = session.received
+        return Response(data, status=exc.status)
+
+    def create(self, request, *args, **kwargs):
+        note_id = request.data.get('note_id')
+        if not note_id:
+            return Response(
+                {'error': 'note_id is required'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            note = Note.objects.get(id=note_id, user=request.user)
+        except Note.DoesNotExist:
+            return Response(
+                {'error': 'Note not found'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            session = start_upload(request.user, note, **serializer.validated_data)
+        except UploadError as exc:
+            return self.error_response(exc)
+        return Response(self.get_serializer(session).data, status=status.HTTP_201_CREATED)
+
+    def update(self, request, *args, **kwargs):
+        """Append the request body at Upload-Offset"""
+        session = self.get_object()
+        try:
+            offset = int(request.META['HTTP_UPLOAD_OFFSET'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'Upload-Offset and Content-Length headers are required', 'received': session.received},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if length <= 0 or request.stream is None:
+            return Response(
+                {'error': 'Chunk is empty', 'received': session.received},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            write_chunk(session, offset, request.stream, length)
+        except UploadError as exc:
+            return self.error_response(exc, session)
+        response = Response(self.get_serializer(session).data)
+        response['Upload-Offset'] = str(session.received)
+        return response
+
+    def destroy(self, request, *args, **kwargs):
+        discard_upload(self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        """Create the attachment once every byte has arrived (optional sha256 to verify)"""
+        serializer = UploadFinalizeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        session = self.get_object()
+        try:
+            attachment, digest = finish_upload(session, serializer.validated_data.get('sha256'))
+        except UploadError as exc:
+            return self.error_response(exc, session)
+        return Response(
+            {**AttachmentSerializer(attachment, context=self.get_serializer_context()).data, 'sha256': digest},
+            status=status.HTTP_201_CREATED
+        )
+
+
 @api_view(['GET'])
 def learning_progress(request):
-    """Get user's learning progress"""
-    progress, created = LearningProgress.objects.get_or_create(user=request.user)
-    
-    # Update total notes count
-    progress.total_notes = Note.objects.filter(user=request.user).count()
-    progress.save()
-    
-    return Response(LearningProgressSerializer(progress).data)
+    """Get user's learning progress (read-only; total_notes is kept current by note signals)"""
+    progress = LearningProgress.objects.filter(user=request.user).first()
+    if progress is None:
+        # Accounts created before progress tracking: report without writing
+        progress = LearningProgress(total_notes=Note.objects.filter(user=request.user).count())
+    # The serializer reads user.username; this is the request's user
+    progress.user = request.user
+    return progress_response(request, progress)
+
+
+def progress_response(request, progress):
+    etag = make_etag('progress', request.user.pk, progress.updated_at, progress.total_notes)
+    not_modified = conditional_response(request, etag, progress.updated_at)
+    if not_modified is not None:
+        return set_validators(not_modified, etag, progress.updated_at)
+    return set_validators(Response(LearningProgressSerializer(progress).data), etag, progress.updated_at)
 
 
 @api_view(['GET'])
 def dashboard_stats(request):
-    """Get dashboard statistics"""
-    user = request.user
-    
-    # Basic counts
-    total_notes = Note.objects.filter(user=user).count()
-    total_categories = Category.objects.filter(user=user).count()
-    total_tags = Tag.objects.filter(user=user).count()
-    favorite_notes = Note.objects.filter(user=user, is_favorite=True).count()
-    
-    # Notes by difficulty
-    difficulty_stats = Note.objects.filter(user=user).values('difficulty').annotate(count=Count('id'))
-    
-    # Notes by category
-    category_stats = Note.objects.filter(user=user).values('category__name', 'category__color').annotate(count=Count('id'))
-    
-    # Recent activity (last 7 days)
-    from django.utils import timezone
-    from datetime import timedelta
+    """Get dashboard statistics (cached per user, invalidated on writes)"""
+    return dashboard_response(request, get_dashboard_stats(request.user))
+
+
+def dashboard_response(request, entry):
+    """Response for a cached dashboard entry; its ETag was computed with the stats"""
+    etag = entry['etag']
+    not_modified = conditional_response(request, etag)
+    if not_modified is not None:
+        return set_validators(not_modified, etag)
+    return set_validators(Response(entry['stats']), etag)
+
+
+@api_view(['GET'])
+def activity(request):
+    """Daily review heatmap, weekly totals and streaks (?days=, default 365)"""
+    try:
+        days = min(int(request.query_params.get('days', HEATMAP_DAYS)), MAX_HEATMAP_DAYS)
+    except ValueError:
+        return Response({'error': 'days must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    if days < 1:
+        return Response({'error': 'days must be positive'}, status=status.HTTP_400_BAD_REQUEST)
     
-    week_ago = timezone.now() - timedelta(days=7)
-    recent_notes = Note.objects.filter(user=user, created_at__gte=week_ago).count()
+    return Response(activity_summary(request.user, days))
+
+
+@api_view(['GET'])
+def export_data(request):
+    """Stream the user's categories, tags, notes and attachments as NDJSON (?files=true embeds attachment content)"""
+    include_files = request.query_params.get('files') in ('1', 'true')
+    response = StreamingHttpResponse(
+        export_lines(request.user, include_files=include_files), content_type='application/x-ndjson'
+    )
+    filename = f"learning-export-{request.user.username}.ndjson"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@api_view(['POST'])
+def import_data(request):
+    """Import an NDJSON export (request body) into the user's account"""
+    stream = request.stream
+    if stream is None:
+        return Response(
+            {'error': 'Request body must be an NDJSON export'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
-    # Learning progress
-    progress, created = LearningProgress.objects.get_or_create(user=user)
+    report = NDJSONImporter(request.user).feed(stream)
+    return Response(report, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+def sync(request):
+    """Notes, categories and tags changed since ?since=<token>, plus deletions"""
+    try:
+        limit = min(int(request.query_params.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    if limit < 1:
+        return Response({'error': 'limit must be positive'}, status=status.HTTP_400_BAD_REQUEST)
     
-    return Response({
-        'total_notes': total_notes,
-        'total_categories': total_categories,
-        'total_tags': total_tags,
-        'favorite_notes': favorite_notes,
-        'recent_notes': recent_notes,
-        'difficulty_distribution': list(difficulty_stats),
-        'category_distribution': list(category_stats),
-        'learning_progress': LearningProgressSerializer(progress).data
-    })
+    try:
+        payload = build_sync_response(
+            request.user, request.query_params.get('since'), limit, context={'request': request}
+        )
+    except InvalidToken as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    except ResyncRequired as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_410_GONE)
+    return Response(payload)
+
+
+@api_view(['POST'])
+def batch(request):
+    """Run several API requests in one round trip (optionally against one snapshot)"""
+    try:
+        responses = run_batch(request, request.data)
+    except BatchError as exc:
+        return Response({'error': str(exc)}, status=exc.status)
+    return Response({'responses': responses})
+
+
+def metrics(request):
+    """Profiling histograms in Prometheus text format (local scrapers only)"""
+    if not settings.PROFILING_ENABLED or request.META.get('REMOTE_ADDR') not in settings.PROFILING_METRICS_IPS:
+        raise Http404
+    return HttpResponse(profiling_registry.export(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,191 @@
+"""
+API benchmark: drives the real URL routes in-process with the Django test client.
+
+Creates a scratch SQLite database (unless --database is given), migrates it,
+seeds it with `manage.py seed_data`, logs in through /api/auth/login/ and runs
+each scenario --requests times, reporting p50/p95/p99 latency, queries per
+request and throughput. --save writes the results as a JSON baseline;
+--compare reads one and exits non-zero if a scenario's p95 grew by more than
+--tolerance or it now runs more queries.
+
+    python benchmarks/api_benchmark.py --notes 2000 --save benchmarks/baseline.json
+    python benchmarks/api_benchmark.py --notes 2000 --compare benchmarks/baseline.json
+"""
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'learning_backend.settings')
+
+
+SCENARIOS = ['notes_list', 'notes_list_keyset', 'search', 'dashboard', 'mark_reviewed', 'attachment_upload']
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Runner:
+    def __init__(self, client, note_ids, rng):
+        self.client = client
+        self.note_ids = note_ids
+        self.rng = rng
+
+    def notes_list(self):
+        return self.client.get('/api/notes/')
+
+    def notes_list_keyset(self):
+        return self.client.get('/api/notes/', {'cursor': '', 'count': 'false'})
+
+    def search(self):
+        from api.seeding import WORDS
+        return self.client.get('/api/notes/search/', {'q': self.rng.choice(WORDS)})
+
+    def dashboard(self):
+        return self.client.get('/api/dashboard/')
+
+    def mark_reviewed(self):
+        note_id = self.rng.choice(self.note_ids)
+        return self.client.post(f'/api/notes/{note_id}/mark_reviewed/', {'grade': 'good'}, content_type='application/json')
+
+    def attachment_upload(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        upload = SimpleUploadedFile('bench.txt', b'x' * 16 * 1024, content_type='text/plain')
+        return self.client.post('/api/attachments/', {'note_id': self.rng.choice(self.note_ids), 'file': upload})
+
+
+def measure(runner, scenario, requests, warmup):
+    from django.db import connections
+    from api.profiling import QueryRecorder
+
+    call = getattr(runner, scenario)
+    for _ in range(warmup):
+        call()
+
+    latencies, queries = [], []
+    started = time.perf_counter()
+    for _ in range(requests):
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            request_start = time.perf_counter()
+            response = call()
+            latencies.append(time.perf_counter() - request_start)
+        if response.status_code >= 400:
+            raise SystemExit(f"{scenario}: HTTP {response.status_code} {response.content[:200]!r}")
+        queries.append(recorder.count)
+    elapsed = time.perf_counter() - started
+
+    return {
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'queries': round(statistics.mean(queries), 2),
+        'max_queries': max(queries),
+        'requests_per_sec': round(requests / elapsed, 1),
+    }
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for scenario, result in results.items():
+        before = baseline.get('scenarios', {}).get(scenario)
+        if before is None:
+            continue
+        if result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{scenario}: p95 {before['p95_ms']} -> {result['p95_ms']} ms")
+        if result['max_queries'] > before['max_queries']:
+            regressions.append(f"{scenario}: queries {before['max_queries']} -> {result['max_queries']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database', help="Existing SQLite file to use instead of a scratch one (not seeded)")
+    parser.add_argument('--notes', type=int, default=1000, help="Notes in the benchmark user's dataset")
+    parser.add_argument('--content-size', type=int, default=2000)
+    parser.add_argument('--tag-fanout', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=200, help="Measured requests per scenario")
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help="Run only these scenarios")
+    parser.add_argument('--username', default='bench-0')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help="Write results as a JSON baseline")
+    parser.add_argument('--compare', help="Fail if results regress against this baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed relative p95 growth")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        os.environ['DATABASE_PATH'] = args.database or os.path.join(scratch, 'bench.sqlite3')
+
+        import django
+        django.setup()
+
+        from django.core.management import call_command
+        from django.test import Client, override_settings
+        from django.test.utils import setup_test_environment
+        from api.models import Note
+        from api.seeding import DEFAULT_PASSWORD
+
+        setup_test_environment(debug=False)
+        if not args.database:
+            call_command('migrate', verbosity=0)
+            call_command(
+                'seed_data', users=1, notes=args.notes, content_size=args.content_size,
+                tag_fanout=args.tag_fanout, seed=args.seed, stdout=io.StringIO(),
+            )
+
+        client = Client()
+        login = client.post(
+            '/api/auth/login/', {'username': args.username, 'password': DEFAULT_PASSWORD},
+            content_type='application/json',
+        )
+        if login.status_code != 200:
+            raise SystemExit(f"Login as {args.username} failed: {login.content[:200]!r}")
+        client = Client(HTTP_AUTHORIZATION=f"Bearer {login.json()['access']}")
+        note_ids = list(Note.objects.filter(user__username=args.username).values_list('pk', flat=True))
+        runner = Runner(client, note_ids, random.Random(args.seed))
+
+        results = {}
+        print(f"{'scenario':<20}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>10}{'req/s':>10}")
+        with override_settings(MEDIA_ROOT=os.path.join(scratch, 'media')):
+            for scenario in args.scenario or SCENARIOS:
+                result = results[scenario] = measure(runner, scenario, args.requests, args.warmup)
+                print(
+                    f"{scenario:<20}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+                    f"{result['queries']:>10g}{result['requests_per_sec']:>10.1f}"
+                )
+
+    report = {
+        'notes': args.notes,
+        'content_size': args.content_size,
+        'requests': args.requests,
+        'python': sys.version.split()[0],
+        'scenarios': results,
+    }
+    if args.save:
+        Path(args.save).write_text(json.dumps(report, indent=2) + '\n')
+        print(f"\nSaved baseline to {args.save}")
+    if args.compare:
+        regressions = compare(results, json.loads(Path(args.compare).read_text()), args.tolerance)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            raise SystemExit(1)
+        print(f"\nNo regressions against {args.compare}")
+
+
+if __name__ == '__main__':
+    main()
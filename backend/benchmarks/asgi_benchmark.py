@@ -0,0 +1,218 @@
+"""
+ASGI vs WSGI benchmark: read throughput while many slow clients are connected.
+
+Seeds a scratch SQLite database (production profile), then starts each server
+in turn and points two groups of clients at it for --seconds:
+
+* --slow-clients connections that trickle their request headers out over
+  --trickle seconds and read the response through a small receive buffer,
+  like clients on a poor mobile link;
+* --fast-clients that send complete requests back to back. Their throughput
+  and latency are what is reported.
+
+Every request is a GET of the dashboard, progress, a note list page or a note,
+in rotation. The servers run with the same worker count: gunicorn's threaded
+workers for WSGI, uvicorn for ASGI (which enables the async read views, see
+api/async_views.py). Override either command with --wsgi-command /
+--asgi-command; ``{port}`` and ``{workers}`` are filled in.
+
+    python benchmarks/asgi_benchmark.py --slow-clients 200 --fast-clients 20 --seconds 20
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'learning_backend.settings')
+
+SERVERS = {
+    'wsgi': 'gunicorn learning_backend.wsgi:application --workers {workers} --threads 4 '
+            '--worker-class gthread --bind 127.0.0.1:{port} --log-level warning',
+    'asgi': 'uvicorn learning_backend.asgi:application --workers {workers} '
+            '--host 127.0.0.1 --port {port} --log-level warning',
+}
+SLOW_RECEIVE_BUFFER = 4096
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def seed(database, notes):
+    """Create and seed the scratch database; returns (access token, note ids)"""
+    os.environ['DATABASE_PATH'] = database
+    os.environ['DB_PROFILE'] = 'production'
+
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    from rest_framework_simplejwt.tokens import AccessToken
+    from api.models import Note
+
+    call_command('migrate', verbosity=0)
+    call_command('seed_data', users=1, notes=notes, stdout=io.StringIO())
+    note = Note.objects.select_related('user').order_by('pk').first()
+    note_ids = list(Note.objects.filter(user=note.user).values_list('pk', flat=True))
+    return str(AccessToken.for_user(note.user)), note_ids
+
+
+def request_bytes(path, token):
+    return (
+        f'GET {path} HTTP/1.1\r\nHost: localhost\r\nAuthorization: Bearer {token}\r\n'
+        f'Accept: application/json\r\nConnection: close\r\n\r\n'
+    ).encode()
+
+
+async def connect(port, receive_buffer=None):
+    sock = socket.socket()
+    if receive_buffer:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, ('127.0.0.1', port))
+    return await asyncio.open_connection(sock=sock)
+
+
+async def fetch(port, payload, trickle=0.0, read_delay=0.0):
+    """Send payload (spread over trickle seconds) and read the response; returns the status"""
+    receive_buffer = SLOW_RECEIVE_BUFFER if read_delay else None
+    reader, writer = await connect(port, receive_buffer)
+    try:
+        if trickle:
+            pieces = 10
+            step = -(-len(payload) // pieces)
+            for start in range(0, len(payload), step):
+                writer.write(payload[start:start + step])
+                await writer.drain()
+                await asyncio.sleep(trickle / pieces)
+        else:
+            writer.write(payload)
+            await writer.drain()
+
+        status_line = await reader.readline()
+        while True:
+            chunk = await reader.read(SLOW_RECEIVE_BUFFER)
+            if not chunk:
+                break
+            if read_delay:
+                await asyncio.sleep(read_delay)
+        return int(status_line.split()[1]) if status_line else 0
+    finally:
+        writer.close()
+
+
+async def run_load(port, paths, args):
+    deadline = time.perf_counter() + args.seconds
+    latencies, errors, slow_done = [], [0], [0]
+    rng = random.Random(args.seed)
+
+    async def slow_client():
+        while time.perf_counter() < deadline:
+            try:
+                await fetch(port, rng.choice(paths), args.trickle, args.read_delay)
+                slow_done[0] += 1
+            except OSError:
+                errors[0] += 1
+
+    async def fast_client():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status = await fetch(port, rng.choice(paths))
+            except OSError:
+                status = 0
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors[0] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(slow_client() for _ in range(args.slow_clients)),
+        *(fast_client() for _ in range(args.fast_clients)),
+    )
+    elapsed = time.perf_counter() - started
+    return {
+        'requests_per_sec': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+        'slow_completed': slow_done[0],
+        'errors': errors[0],
+    }
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Server exited with status {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit(f"Server did not start listening on {port}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--notes', type=int, default=1000, help="Notes in the benchmark user's dataset")
+    parser.add_argument('--workers', type=int, default=2, help="Server worker processes")
+    parser.add_argument('--slow-clients', type=int, default=200)
+    parser.add_argument('--fast-clients', type=int, default=20)
+    parser.add_argument('--trickle', type=float, default=2.0, help="Seconds a slow client takes to send its request")
+    parser.add_argument('--read-delay', type=float, default=0.05, help="Slow clients' pause between reads")
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--server', action='append', choices=SERVERS, help="Run only these servers")
+    parser.add_argument('--wsgi-command', default=SERVERS['wsgi'])
+    parser.add_argument('--asgi-command', default=SERVERS['asgi'])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        database = os.path.join(scratch, 'bench.sqlite3')
+        token, note_ids = seed(database, args.notes)
+        paths = [
+            request_bytes(path, token)
+            for path in ['/api/dashboard/', '/api/progress/', '/api/notes/', '/api/notes/?page=2']
+            + [f'/api/notes/{pk}/' for pk in note_ids[:20]]
+        ]
+
+        env = {**os.environ, 'DATABASE_PATH': database, 'DB_PROFILE': 'production', 'DEBUG': 'False'}
+        print(f"{'server':<8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'slow done':>12}{'errors':>8}")
+        for server in args.server or SERVERS:
+            port = free_port()
+            command = getattr(args, f'{server}_command').format(port=port, workers=args.workers)
+            process = subprocess.Popen(shlex.split(command), cwd=BASE_DIR, env=env)
+            try:
+                wait_for_port(port, process)
+                result = asyncio.run(run_load(port, paths, args))
+            finally:
+                process.terminate()
+                process.wait()
+            print(
+                f"{server:<8}{result['requests_per_sec']:>10.1f}{result['p50_ms'] or 0:>10.1f}"
+                f"{result['p95_ms'] or 0:>10.1f}{result['slow_completed']:>12}{result['errors']:>8}"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+JSON rendering benchmark: DRF's JSONRenderer vs api.renderers.FastJSONRenderer.
+
+Renders paginated note-list payloads shaped like NoteSerializer output
+(content, nested tags and attachments) of 20, 100 and 1000 notes and
+reports the median time per render, plus parse time for the same bodies.
+
+    python benchmarks/json_rendering.py --repeat 50
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'learning_backend.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from rest_framework.parsers import JSONParser  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from api import renderers  # noqa: E402
+
+SIZES = (20, 100, 1000)
+PARAGRAPH = (
+    "Spaced repetition works because recall is **effortful**: each retrieval strengthens "
+    "the memory trace more than re-reading does. Notes mix `code`, prose and lists — "
+    "including non-ASCII text like café, naïve, 学习.\n\n"
+)
+
+
+def note_payload(i):
+    stamp = '2026-01-01T12:00:00.123456Z'
+    return {
+        'id': i,
+        'title': f'Note {i}: query planning in SQLite',
+        'content': PARAGRAPH * 20,
+        'summary': PARAGRAPH,
+        'category': i % 10,
+        'category_name': 'Databases',
+        'tags': [
+            {'id': t, 'name': f'tag-{t}', 'notes_count': 42, 'created_at': stamp, 'updated_at': stamp}
+            for t in range(3)
+        ],
+        'difficulty': 'intermediate',
+        'is_favorite': bool(i % 2),
+        'is_archived': False,
+        'source_url': 'https://example.com/article',
+        'attachments': [{
+            'id': i, 'file': f'/media/attachments/{i}.pdf', 'original_name': f'{i}.pdf',
+            'file_type': 'document', 'file_size': 123456, 'file_size_display': '120.6 KB',
+            'description': '', 'uploaded_at': stamp,
+        }],
+        'created_at': stamp,
+        'updated_at': stamp,
+        'last_reviewed': None,
+        'due_at': stamp,
+        'interval_days': 6,
+        'ease': 2.5,
+        'repetitions': 2,
+    }
+
+
+def list_payload(size):
+    return {'count': size, 'next': None, 'previous': None, 'results': [note_payload(i) for i in range(size)]}
+
+
+def median_ms(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args()
+
+    if renderers.orjson is None:
+        print("orjson is not installed: FastJSONRenderer falls back to the stdlib encoder\n")
+
+    candidates = [
+        ('drf', JSONRenderer(), JSONParser()),
+        ('fast', renderers.FastJSONRenderer(), renderers.FastJSONParser()),
+    ]
+    print(f"{'notes':>6}{'size':>10}  {'renderer':<8}{'render ms':>12}{'parse ms':>12}{'speedup':>10}")
+    for size in SIZES:
+        data = list_payload(size)
+        body = candidates[0][1].render(data)
+        baseline = None
+        for name, renderer, json_parser in candidates:
+            render_ms = median_ms(lambda: renderer.render(data), args.repeat)
+            parse_ms = median_ms(lambda: json_parser.parse(io.BytesIO(body)), args.repeat)
+            baseline = baseline or render_ms
+            print(
+                f"{size:>6}{len(body) // 1024:>8}KB  {name:<8}{render_ms:>12.2f}"
+                f"{parse_ms:>12.2f}{baseline / render_ms:>9.1f}x"
+            )
+
+
+if __name__ == '__main__':
+    main()
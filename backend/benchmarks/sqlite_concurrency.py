@@ -0,0 +1,158 @@
+"""
+SQLite concurrency benchmark: default settings vs the production profile.
+
+Seeds a scratch database with `manage.py seed_data`, then for each DB_PROFILE
+spawns reader and writer processes that run through Django's own connection
+handling with the settings that profile configures (WAL pragmas via
+init_command, BEGIN IMMEDIATE, busy timeout, CONN_MAX_AGE). Every operation
+is wrapped like a request: close_old_connections() before and after, so
+connections are reused or reopened exactly as they would be in a worker.
+
+Readers fetch a page of a user's notes; writers do the read-then-write
+transaction that get_object() + save() performs, signals included. Reported
+per profile: read/write throughput, "database is locked" errors and how many
+connections were opened.
+
+    python benchmarks/sqlite_concurrency.py --readers 8 --writers 4 --seconds 10
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+
+PROFILES = ('development', 'production')
+
+
+def setup_django(path, profile):
+    """Configure Django in this process for the database at path"""
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'learning_backend.settings'
+    os.environ['DATABASE_PATH'] = path
+    os.environ['DB_PROFILE'] = profile
+    os.environ['SERVER_INTERFACE'] = 'wsgi'
+
+    import django
+    django.setup()
+
+
+def seed(path, users, notes):
+    setup_django(path, 'development')
+    from django.core.management import call_command
+
+    call_command('migrate', verbosity=0)
+    call_command('seed_data', users=users, notes=notes, content_size=2000, stdout=io.StringIO())
+
+
+def worker(kind, path, profile, start, deadline, results):
+    setup_django(path, profile)
+    from django.contrib.auth.models import User
+    from django.db import OperationalError, close_old_connections, transaction
+    from django.db.backends.signals import connection_created
+    from api.models import Note
+
+    connects = [0]
+    connection_created.connect(lambda **kwargs: connects.__setitem__(0, connects[0] + 1), weak=False)
+    user_ids = list(User.objects.values_list('pk', flat=True))
+    close_old_connections()
+    time.sleep(max(0, start - time.time()))
+
+    def read(user_id):
+        list(
+            Note.objects.filter(user_id=user_id)
+            .order_by('-updated_at', '-id')
+            .values('id', 'title', 'content')[:20]
+        )
+
+    def write(user_id):
+        with transaction.atomic():
+            note = Note.objects.filter(user_id=user_id).first()
+            note.is_favorite = not note.is_favorite
+            note.save(update_fields=['is_favorite', 'updated_at'])
+
+    operation = read if kind == 'read' else write
+    ok = locked = 0
+    while time.time() < deadline:
+        # request_started / request_finished
+        close_old_connections()
+        try:
+            operation(random.choice(user_ids))
+            ok += 1
+        except OperationalError:
+            locked += 1
+        finally:
+            close_old_connections()
+    results.put((kind, ok, locked, connects[0]))
+
+
+def run(profile, template, args):
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.sqlite3')
+        shutil.copy(template, path)
+
+        results = context.Queue()
+        # Everyone starts together once the spawned interpreters have set up Django
+        start = time.time() + args.startup
+        deadline = start + args.seconds
+        workers = [
+            context.Process(target=worker, args=(kind, path, profile, start, deadline, results))
+            for kind in ['read'] * args.readers + ['write'] * args.writers
+        ]
+        for process in workers:
+            process.start()
+        totals = {'read': 0, 'write': 0, 'locked': 0, 'connects': 0}
+        for _ in workers:
+            kind, ok, locked, connects = results.get()
+            totals[kind] += ok
+            totals['locked'] += locked
+            totals['connects'] += connects
+        for process in workers:
+            process.join()
+
+    return {
+        'reads_per_sec': totals['read'] / args.seconds,
+        'writes_per_sec': totals['write'] / args.seconds,
+        'locked_errors': totals['locked'],
+        'connections': totals['connects'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--notes', type=int, default=250, help="Notes per user")
+    parser.add_argument('--startup', type=float, default=3, help="Seconds allowed for workers to start")
+    parser.add_argument('--profile', action='append', choices=PROFILES, help="Run only these profiles")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, 'template.sqlite3')
+        seeder = multiprocessing.get_context('spawn').Process(target=seed, args=(template, args.users, args.notes))
+        seeder.start()
+        seeder.join()
+        if seeder.exitcode:
+            raise SystemExit(f"Seeding failed with status {seeder.exitcode}")
+
+        print(f"{args.readers} readers, {args.writers} writers, {args.seconds:g}s per profile\n")
+        print(f"{'profile':<14}{'reads/s':>10}{'writes/s':>10}{'locked':>8}{'connections':>13}")
+        for profile in args.profile or PROFILES:
+            result = run(profile, template, args)
+            print(
+                f"{profile:<14}{result['reads_per_sec']:>10.0f}{result['writes_per_sec']:>10.0f}"
+                f"{result['locked_errors']:>8}{result['connections']:>13}"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "learning_backend.settings")
+# The ASGI profile: async read views, no persistent connections (see settings)
+os.environ.setdefault("SERVER_INTERFACE", "asgi")
 
 application = get_asgi_application()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+from importlib.util import find_spec
 from pathlib import Path
 from decouple import config
 from datetime import timedelta
@@ -47,6 +48,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Removes itself unless PROFILING_ENABLED is set
+    "api.profiling.ProfilingMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -76,6 +79,15 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "learning_backend.wsgi.application"
 
+# Set to "asgi" by learning_backend/asgi.py
+SERVER_INTERFACE = config("SERVER_INTERFACE", default="wsgi")
+
+# Serve the dashboard, progress and note list/detail GETs from async views
+# (api/async_views.py); independent queries of one request then run
+# concurrently on a pool of ASYNC_QUERY_WORKERS threads, each with its own connection
+ASYNC_VIEWS = config("ASYNC_VIEWS", default=SERVER_INTERFACE == "asgi", cast=bool)
+ASYNC_QUERY_WORKERS = config("ASYNC_QUERY_WORKERS", default=8, cast=int)
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -83,10 +95,79 @@ WSGI_APPLICATION = "learning_backend.wsgi.application"
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "NAME": config("DATABASE_PATH", default=str(BASE_DIR / "db.sqlite3")),
     }
 }
 
+# DB_PROFILE=production tunes SQLite for several concurrent workers:
+# WAL lets readers run alongside the single writer, BEGIN IMMEDIATE takes the
+# write lock up front (so busy_timeout applies instead of an instant
+# "database is locked"), and connections are reused across requests (except
+# under ASGI, where Django's per-request threads would leak them).
+DB_PROFILE = config("DB_PROFILE", default="development")
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": config("SQLITE_BUSY_TIMEOUT_MS", default=5000, cast=int),
+    "mmap_size": config("SQLITE_MMAP_SIZE", default=256 * 1024 * 1024, cast=int),
+    "cache_size": config("SQLITE_CACHE_SIZE", default=-64000, cast=int),  # negative = KiB
+    "temp_store": "MEMORY",
+}
+
+if DB_PROFILE == "production":
+    DATABASES["default"].update({
+        "CONN_MAX_AGE": config("CONN_MAX_AGE", default=0 if SERVER_INTERFACE == "asgi" else 600, cast=int),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "init_command": ";".join(f"PRAGMA {name}={value}" for name, value in SQLITE_PRAGMAS.items()),
+            "transaction_mode": "IMMEDIATE",
+            "timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000,
+        },
+    })
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Use a shared backend (e.g. Redis or Memcached) when running several workers,
+# otherwise per-user cache invalidation only reaches the worker that did the write.
+
+CACHES = {
+    "default": {
+        "BACKEND": config("CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": config("CACHE_LOCATION", default="learning-backend"),
+    },
+    # Rendered note content keyed by content hash (api/rendering.py). Entries
+    # never go stale, so they have no timeout; LocMemCache drops the least
+    # recently used ones beyond MAX_ENTRIES.
+    "renderings": {
+        "BACKEND": config("RENDER_CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": config("RENDER_CACHE_LOCATION", default="learning-backend-renderings"),
+        "TIMEOUT": None,
+        "OPTIONS": {"MAX_ENTRIES": config("RENDER_CACHE_MAX_ENTRIES", default=2000, cast=int)},
+    },
+}
+
+# Upper bound on dashboard staleness for changes that bypass model signals
+# (queryset.update()) and for the rolling "last 7 days" count.
+DASHBOARD_CACHE_TIMEOUT = config("DASHBOARD_CACHE_TIMEOUT", default=300, cast=int)
+
+
+# Deletions are remembered this long for /api/sync/; older sync tokens must
+# start over with a full sync. Pruned by `manage.py prune_tombstones`.
+SYNC_TOMBSTONE_RETENTION_DAYS = config("SYNC_TOMBSTONE_RETENTION_DAYS", default=90, cast=int)
+
+
+# How long an authenticated request may reuse the cached User row instead of
+# querying it (0 disables); saving a user drops its cached copy
+AUTH_USER_CACHE_TIMEOUT = config("AUTH_USER_CACHE_TIMEOUT", default=60, cast=int)
+
+
+# Per-request query/latency profiling, exported at /api/_metrics (see api/profiling.py)
+PROFILING_ENABLED = config("PROFILING_ENABLED", default=False, cast=bool)
+PROFILING_QUERY_BUDGET = config("PROFILING_QUERY_BUDGET", default=20, cast=int)
+PROFILING_METRICS_IPS = config("PROFILING_METRICS_IPS", default="127.0.0.1,::1").split(",")
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -107,6 +188,32 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# The first hasher makes new hashes; the others still verify older ones, which
+# are rehashed to the first on the next successful login (api/passwords.py).
+# Argon2 needs argon2-cffi; without it PBKDF2 stays the default.
+PASSWORD_HASHER = config("PASSWORD_HASHER", default="argon2" if find_spec("argon2") else "pbkdf2")
+_PASSWORD_HASHERS = {
+    "argon2": "api.passwords.TunedArgon2PasswordHasher",
+    "pbkdf2": "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+    "scrypt": "django.contrib.auth.hashers.ScryptPasswordHasher",
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    hasher for name, hasher in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER
+] + ["django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher"]
+ARGON2_TIME_COST = config("ARGON2_TIME_COST", default=2, cast=int)
+ARGON2_MEMORY_COST = config("ARGON2_MEMORY_COST", default=19456, cast=int)  # KiB
+ARGON2_PARALLELISM = config("ARGON2_PARALLELISM", default=1, cast=int)
+
+# Password hashing runs in this many threads; calls beyond the queue depth are
+# refused with 429 instead of tying up request workers
+PASSWORD_HASHING_WORKERS = config("PASSWORD_HASHING_WORKERS", default=2, cast=int)
+PASSWORD_HASHING_QUEUE = config("PASSWORD_HASHING_QUEUE", default=8, cast=int)
+
+# Token buckets per client IP and per username on login/register (api/throttling.py)
+AUTH_THROTTLE_BURST = config("AUTH_THROTTLE_BURST", default=10, cast=int)
+AUTH_THROTTLE_PER_MINUTE = config("AUTH_THROTTLE_PER_MINUTE", default=10, cast=float)
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -132,11 +239,22 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # simplejwt's JWTAuthentication, with the user row cached (api/authentication.py)
+        'api.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # orjson-backed JSON when installed, DRF's stdlib json otherwise
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20
 }
@@ -146,6 +264,8 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
+    # Tokens carry a hash of the password, so changing it revokes them
+    'CHECK_REVOKE_TOKEN': True,
 }
 
 # CORS Configuration
@@ -155,3 +275,17 @@ CORS_ALLOW_CREDENTIALS = True
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Django's default handlers, plus a SHA-256 of each file as it streams in for
+# the content-addressed attachment store (api/blobs.py)
+FILE_UPLOAD_HANDLERS = [
+    'api.blobs.HashingMemoryFileUploadHandler',
+    'api.blobs.HashingTemporaryFileUploadHandler',
+]
+
+# Chunked uploads (/api/uploads/, see api/uploads.py): the largest chunk one PUT
+# may carry, the largest file, and how long an idle session is kept before
+# `manage.py prune_uploads` removes it with its staged bytes.
+UPLOAD_CHUNK_SIZE = config('UPLOAD_CHUNK_SIZE', default=8 * 1024 * 1024, cast=int)
+UPLOAD_MAX_SIZE = config('UPLOAD_MAX_SIZE', default=1024 * 1024 * 1024, cast=int)
+UPLOAD_SESSION_TTL_HOURS = config('UPLOAD_SESSION_TTL_HOURS', default=24, cast=int)
@@ -34,15 +34,20 @@ export default function NotesPage() {
   useEffect(() => {
     const fetchData = async () => {
       try {
-        const [notesRes, categoriesRes, tagsRes] = await Promise.all([
-          apiClient.getNotes(),
-          apiClient.getCategories(),
-          apiClient.getTags(),
-        ]);
+        // One round trip, read from a single snapshot
+        const responses = await apiClient.batch(
+          [{ path: '/notes/' }, { path: '/categories/' }, { path: '/tags/' }],
+          true,
+        );
+        const failed = responses.find((response) => response.status >= 400);
+        if (failed) {
+          throw new Error(`Batched request failed with status ${failed.status}`);
+        }
+        const [notesRes, categoriesRes, tagsRes] = responses.map((response) => response.body);
 
         setNotes(notesRes.results || notesRes);
-        setCategories(categoriesRes);
-        setTags(tagsRes);
+        setCategories(categoriesRes.results || categoriesRes);
+        setTags(tagsRes.results || tagsRes);
       } catch (error) {
         console.error('Error fetching data:', error);
       } finally {
@@ -11,7 +11,9 @@ import {
   NoteList, 
   DashboardStats,
   LearningProgress,
-  PaginatedResponse
+  PaginatedResponse,
+  BatchRequest,
+  BatchResponse
 } from '@/types';
 
 class ApiClient {
@@ -221,6 +223,16 @@ class ApiClient {
     return response.data;
   }
 
+  // Several requests in one round trip; paths are relative to the API root like the methods above
+  async batch(requests: BatchRequest[], snapshot = false): Promise<BatchResponse[]> {
+    const apiRoot = new URL(this.baseURL, window.location.origin).pathname.replace(/\/$/, '');
+    const response = await this.client.post('/batch/', {
+      requests: requests.map((request) => ({ ...request, path: `${apiRoot}${request.path}` })),
+      snapshot,
+    });
+    return response.data.responses;
+  }
+
   // File uploads
   async uploadAttachment(noteId: number, file: File, description?: string): Promise<any> {
     const formData = new FormData();
@@ -52,6 +52,9 @@ export interface Note {
   created_at: string;
   updated_at: string;
   last_reviewed: string | null;
+  // Only with ?expand=content_html / ?expand=excerpt
+  content_html?: string;
+  excerpt?: string;
 }
 
 export interface NoteList {
@@ -65,6 +68,8 @@ export interface NoteList {
   tags_count: number;
   created_at: string;
   updated_at: string;
+  content_html?: string;
+  excerpt?: string;
 }
 
 export interface LearningProgress {
@@ -120,3 +125,16 @@ export interface PaginatedResponse<T> {
   previous: string | null;
   results: T[];
 }
+
+export interface BatchRequest {
+  method?: 'GET' | 'POST' | 'PUT' | 'PATCH' | 'DELETE';
+  path: string;
+  body?: unknown;
+  headers?: Record<string, string>;
+}
+
+export interface BatchResponse<T = any> {
+  status: number;
+  headers: Record<string, string>;
+  body: T;
+}